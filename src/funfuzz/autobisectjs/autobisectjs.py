@@ -7,11 +7,18 @@
 """autobisectjs, for bisecting changeset regression windows. Supports Mercurial repositories and SpiderMonkey only.
 """
 
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import copy
+import functools
+import io
+import multiprocessing
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
 from pathlib import Path
 import re
-import shutil
+import signal
 import subprocess
 import sys
 import tempfile
@@ -20,16 +27,27 @@ import time
 from lithium.interestingness.utils import rel_or_abs_import
 
 from . import known_broken_earliest_working as kbew
+from ..js import artifact_store
 from ..js import build_options
 from ..js import compile_shell
 from ..js import inspect_shell
+from ..js import shell_cache
+from ..util import changeset_index
 from ..util import file_system_helpers
+from ..util import hg_cmdserver
 from ..util import hg_helpers
 from ..util import s3cache
 from ..util import sm_compile_helpers
 from ..util import subprocesses as sps
 from ..util.lock_dir import LockDir
 
+ADAPTIVE_TIMEOUT_FACTOR = 10  # Tests may take this many times as long as the first good and bad runs did
+MIN_TEST_TIMEOUT = 30  # seconds
+MAX_TEST_TIMEOUT = 999  # seconds
+# Interestingness tests that run the shell once with their --timeout, so that they can take the derived timeout.
+# compare_jit is left out, its --timeout applies to each of the many runs of a single test.
+TIMEOUT_INTERESTINGNESS_TESTS = ("funfuzz.js.js_interesting", "funfuzz.util.crashesat")
+
 
 def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
     # pylint: disable=too-many-branches,too-complex,too-many-statements
@@ -51,6 +69,14 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         build_options="",
         useTreeherderBinaries=False,
         nameOfTreeherderBranch="mozilla-inbound",
+        jobs=1,
+        speculate=False,
+        cachedRevTolerance=0.2,
+        artifactStore=None,
+        artifactsOnly=False,
+        repeat=1,
+        timeoutLabel="skip",
+        batchFile=None,
     )
 
     # Specify how the shell will be built.
@@ -88,16 +114,54 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
                       action="store_true",
                       help="Interpret the final arguments as an interestingness test.")
 
+    parser.add_option("-n", "--repeat", dest="repeat", type="int",
+                      help="Run the test of each revision up to this many times, in parallel unless interestingness "
+                           "tests are used, for intermittent failures. Any bad run makes the revision bad. "
+                           'Defaults to "%default".')
+
+    parser.add_option("--timeoutLabel", dest="timeoutLabel",
+                      help="Specify how to treat revisions whose test times out. The timeout is derived from how "
+                           "long the first good and bad tests took. Interestingness tests that take a timeout are "
+                           "given it too, and label timeouts themselves. "
+                           '(bad, good, or skip) Defaults to "%default"')
+
     # Specify parameters for the js shell.
     parser.add_option("-p", "--parameters", dest="parameters",
                       help='Specify parameters for the js shell, e.g. -p "-a --ion-eager testcase.js".')
 
     # Specify how to treat revisions that fail to compile.
-    # (You might want to add these to kbew.knownBrokenRanges in known_broken_earliest_working.)
+    # (Skipped ranges are learned, but you might want to add them to kbew.known_broken_ranges as well.)
     parser.add_option("-l", "--compilationFailedLabel", dest="compilationFailedLabel",
                       help="Specify how to treat revisions that fail to compile. "
                            '(bad, good, or skip) Defaults to "%default"')
 
+    parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                      help="Build this many revisions at the same time, each in its own shared working copy, "
+                           'narrowing down the range in fewer rounds. Defaults to "%default".')
+
+    parser.add_option("-S", "--speculate", dest="speculate",
+                      action="store_true",
+                      help="While a revision is being tested, build both revisions that may be tested next in the "
+                           'background, each in its own shared working copy. Defaults to "%default".')
+
+    parser.add_option("-c", "--cachedRevTolerance", dest="cachedRevTolerance", type="float",
+                      help="Test a revision whose shell is already in the local or S3 shell cache instead of one that "
+                           "splits the range evenly, if it is this close, as a fraction of the distance between "
+                           'the even split points. Below 0.5, set to 0 to always split evenly. Defaults to "%default".')
+
+    parser.add_option("-A", "--artifactStore", dest="artifactStore",
+                      help="Directory or URL of a store of prebuilt shells, see funfuzz.js.artifact_store. The range "
+                           "is first narrowed down using only the shells in the store, so that only the remaining "
+                           "range needs compiling.")
+    parser.add_option("--artifactsOnly", dest="artifactsOnly",
+                      action="store_true",
+                      help="Stop once the range is narrowed down using the artifact store, without compiling.")
+
+    parser.add_option("--batch", dest="batchFile",
+                      help="Bisect all the testcases listed in this file together, building each revision once for "
+                           "all of them. Each line holds the parameters for the js shell, optionally followed by "
+                           '" -- " and an interestingness test with its arguments.')
+
     parser.add_option("-T", "--useTreeherderBinaries",
                       dest="useTreeherderBinaries",
                       action="store_true",
@@ -113,7 +177,8 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         sys.exit(0)
 
     options.build_options = build_options.parse_shell_opts(options.build_options)
-    options.skipRevs = " + ".join(kbew.known_broken_ranges(options.build_options))
+    options.skipRevs = " + ".join(kbew.known_broken_ranges(options.build_options) +
+                                  kbew.learned_broken_ranges(options.build_options))
 
     options.runtime_params = [x for x in options.parameters.split(" ") if x]
 
@@ -125,6 +190,14 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         raise OSError(f"Testcase at {options.runtime_params[-1]} is not present.")
 
     assert options.compilationFailedLabel in ("bad", "good", "skip")
+    assert options.timeoutLabel in ("bad", "good", "skip")
+    assert options.jobs >= 1
+    assert options.repeat >= 1
+    assert 0 <= options.cachedRevTolerance < 0.5
+    if options.artifactsOnly and not options.artifactStore:
+        parser.error("--artifactsOnly needs an artifact store.")
+    if options.batchFile and (options.artifactStore or options.jobs > 1):
+        parser.error("--batch cannot be combined with an artifact store or with building several revisions at once.")
 
     extraFlags = []  # pylint: disable=invalid-name
 
@@ -135,11 +208,19 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         for a in args:  # pylint: disable=invalid-name
             if a.startswith("--flags="):
                 extraFlags = a[8:].split(" ")  # pylint: disable=invalid-name
-        options.testAndLabel = externalTestAndLabel(options, args)
+        options.testAndLabel = make_test_and_label(options, args)
     elif args:
         parser.error("Too many arguments.")
     else:
-        options.testAndLabel = internalTestAndLabel(options)
+        options.testAndLabel = make_test_and_label(options, [])
+
+    if options.batchFile:
+        options.batch = read_batch_file(options, Path(options.batchFile).expanduser())
+        if not options.batch:
+            parser.error(f"No testcases in {options.batchFile}.")
+        # Start from a revision known to work with the flags of every testcase
+        for batch_options, _ in options.batch.values():
+            extraFlags.extend(batch_options.runtime_params)
 
     earliestKnownQuery = kbew.earliest_known_working_rev(  # pylint: disable=invalid-name
         options.build_options, options.runtime_params + extraFlags, options.skipRevs)
@@ -173,53 +254,481 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
     return options
 
 
-def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,missing-docstring,too-complex
-    # pylint: disable=too-many-locals,too-many-statements
+def make_test_and_label(options, interestingness):
+    """Return the function that tests and labels shells for the testcase in the options.
+
+    Args:
+        options (object): Options of autobisectjs
+        interestingness (list): Interestingness test and its arguments, or an empty list to use internalTestAndLabel
+
+    Returns:
+        function: Tests a shell, returning a label and the reason for it
+    """
+    if interestingness:
+        test_and_label = externalTestAndLabel(options, interestingness)
+    else:
+        test_and_label = internalTestAndLabel(options)
+    if options.repeat > 1:
+        # Interestingness tests may keep global state, so only run the shell tests of autobisectjs itself in parallel
+        test_and_label = RepeatedTestAndLabel(
+            test_and_label, options.repeat, 1 if interestingness else multiprocessing.cpu_count())
+    return test_and_label
+
+
+def read_batch_file(options, batch_file):
+    """Read the testcases to bisect together. Each line holds the parameters for the js shell, optionally followed by
+    " -- " and an interestingness test with its arguments, e.g.:
+
+        --fuzzing-safe --ion-eager testcase1.js
+        --fuzzing-safe testcase2.js -- funfuzz.js.js_interesting --timeout=30 crashes
+
+    Args:
+        options (object): Options of autobisectjs, shared by all the testcases
+        batch_file (Path): Full path to the file listing the testcases
+
+    Raises:
+        OSError: If a testcase is not present
+
+    Returns:
+        dict: Options and test of each testcase, keyed by its parameters
+    """
+    batch = {}
+    with io.open(str(batch_file), "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parameters, _, interestingness = line.strip().partition(" -- ")
+            if not parameters or parameters.startswith("#"):
+                continue
+            testcase_options = copy.copy(options)
+            testcase_options.parameters = parameters
+            testcase_options.runtime_params = [x for x in parameters.split(" ") if x]
+            if "-e 42" not in parameters and not Path(testcase_options.runtime_params[-1]).expanduser().is_file():
+                raise OSError(f"Testcase at {testcase_options.runtime_params[-1]} is not present.")
+            batch[parameters] = (testcase_options,
+                                 make_test_and_label(testcase_options, [x for x in interestingness.split(" ") if x]))
+    return batch
+
+
+def dag_ancestors(parents, heads):
+    """Return the ancestors of some changesets, within a range.
+
+    Args:
+        parents (dict): Parents of each changeset of the range that are in the range too
+        heads (iterable): Changesets of the range
+
+    Returns:
+        set: The changesets and their ancestors
+    """
+    ancestors = set(heads)
+    to_visit = list(ancestors)
+    while to_visit:
+        for parent in parents[to_visit.pop()]:
+            if parent not in ancestors:
+                ancestors.add(parent)
+                to_visit.append(parent)
+    return ancestors
+
+
+def bisect_together(revs, parents, names, test_rev, skip_range=None, has_shell=None, tolerance=0):
+    # pylint: disable=too-many-arguments,too-many-locals
+    """Bisect a range for the first bad revision of several testcases at once. Each revision built is tested
+    against every testcase it is a candidate for, so that the testcases share builds for as long as their candidates
+    overlap, before each finishes on its own.
+
+    Like hg bisect, the candidates of a testcase are the ancestors of its first bad revision so far, that are not
+    ancestors of a good one. They follow the DAG, so merges within the range are bisected correctly.
+
+    Args:
+        revs (list): Revisions of the range in revision number order, the first assumed good and the last assumed
+                     bad for every testcase, each an ancestor of the last
+        parents (dict): Parents of each revision that are in the range too
+        names (list): Names of the testcases
+        test_rev (function): Builds a revision and tests it against some testcases, returning a dict of their labels
+        skip_range (function): Called with a revision that fails compilation, returns revisions to skip with it
+        has_shell (function): Tells whether the shell of a revision is already built, to test it in preference
+        tolerance (float): How far to move from the middle of a range towards a built shell, as for prefer_cached_revs
+
+    Returns:
+        dict: For each testcase, its first bad revision, the skipped revisions that could be the first bad one
+              instead, and the labels of the revisions tested
+    """
+    order = {rev: i for i, rev in enumerate(revs)}
+    first_bads = {name: revs[-1] for name in names}
+    goods = {name: {revs[0]} for name in names}
+    skipped = {name: set() for name in names}
+    labels = {name: {revs[0]: ("good", "assumed start rev is good"), revs[-1]: ("bad", "assumed end rev is bad")}
+              for name in names}
+    while True:
+        candidates = {name: sorted(dag_ancestors(parents, [first_bads[name]]) - dag_ancestors(parents, goods[name]) -
+                                   {first_bads[name]}, key=order.get)
+                      for name in names}
+        untested = {name: [rev for rev in candidates[name] if rev not in skipped[name]] for name in names}
+        untested = {name: untested_revs for name, untested_revs in untested.items() if untested_revs}
+        if not untested:
+            break
+        # Split the most candidates, which the most other testcases are likely to share
+        widest = untested[max(untested, key=lambda name: len(untested[name]))]
+        rev = widest[len(widest) // 2]
+        if has_shell and tolerance:
+            rev = prefer_cached_revs(widest, [rev], has_shell, tolerance)[0]
+        rev_labels = test_rev(rev, [name for name in untested if rev in untested[name]])
+        for name, label in rev_labels.items():
+            labels[name][rev] = label
+            if label[0] == "good":
+                goods[name].add(rev)
+            elif label[0] == "bad":
+                first_bads[name] = rev
+            else:
+                skipped[name].add(rev)
+        if skip_range and ("skip", "compilation failed") in rev_labels.values():
+            for broken_rev in skip_range(rev):
+                for name in names:
+                    skipped[name].add(broken_rev)
+    return {name: (first_bads[name], candidates[name], labels[name]) for name in names}
+
+
+def bisect_batch(options, repo_dir):  # pylint: disable=too-many-locals
+    """Bisect the testcases of a batch file together, see bisect_together.
+
+    Args:
+        options (object): Options of autobisectjs, with the testcases in options.batch
+        repo_dir (Path): Full path to the repository
+    """
     repo_dir = str(repo_dir)
-    print(f"{time.asctime()} | Bisecting on: {repo_dir}", flush=True)
+    print(f"{time.asctime()} | Bisecting {len(options.batch)} testcases together on: {repo_dir}", flush=True)
+    start = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.startRepo)[0]
+    end = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.endRepo)[0]
+    revs = []
+    parents = {}
+    for line in hg_cmdserver.run(
+            ["hg", "-R", repo_dir, "log", "-r", f"sort({start}::{end}, rev)",
+             "--template={node|short} {p1node|short} {p2node|short}\n"],
+            check=True,
+            ).stdout.decode("utf-8", errors="replace").splitlines():
+        rev, *rev_parents = line.split(" ")
+        revs.append(rev)
+        parents[rev] = [parent for parent in rev_parents if parent in parents]
+    # Known and learned broken ranges stay in the DAG, so that it remains connected, but are never tested
+    broken_revs = set()
+    if options.skipRevs:
+        broken_revs = set(hg_cmdserver.run(
+            ["hg", "-R", repo_dir, "log", "-r", f"({start}::{end}) and ({options.skipRevs})",
+             "--template={node|short}\n"],
+            check=True,
+            ).stdout.decode("utf-8", errors="replace").split())
+
+    def test_rev(rev, names):
+        shell = compile_shell.CompiledShell(options.build_options, rev)
+        print(f"Rev {rev}:", end=" ", flush=True)
+        if rev in broken_revs:
+            print("skip (in a known broken range)", flush=True)
+            return {name: ("skip", "in a known broken range") for name in names}
+        try:
+            compile_shell.obtainShell(shell, updateToRev=rev)
+        except (subprocess.CalledProcessError, OSError):
+            print(f"{options.compilationFailedLabel} (compilation failed)", flush=True)
+            return {name: (options.compilationFailedLabel, "compilation failed") for name in names}
+        print(f"Testing {len(names)} testcases...", flush=True)
+        labels = {}
+        for name in names:
+            labels[name] = options.batch[name][1](shell.get_shell_cache_js_bin_path(), rev)
+            print(f"  {name}: {labels[name][0]} ({labels[name][1]})", flush=True)
+        return labels
+
+    def is_busted(rev):
+        print(f"Rev {rev}:", end=" ", flush=True)
+        try:
+            compile_shell.obtainShell(compile_shell.CompiledShell(options.build_options, rev), updateToRev=rev)
+        except (subprocess.CalledProcessError, OSError):
+            print("compilation failed", flush=True)
+            return True
+        print("compiled", flush=True)
+        return False
+
+    def skip_broken_range(rev):
+        # As in findBlamedCset, binary search for the edges of the bustage, learn them and skip the whole range
+        print(f"Looking for the edges of the compilation bustage around {rev}...", flush=True)
+        broken_range = find_linear_broken_range(repo_dir, revs, rev, is_busted)
+        if not broken_range:
+            print("The compilation bustage spans merges, so skipping around it one changeset at a time.", flush=True)
+            return []
+        print(f"Changesets from {broken_range[0]} up to {broken_range[1]} fail to compile, skipping them all.",
+              flush=True)
+        kbew.record_broken_range(options.build_options, *broken_range)
+        return revs[revs.index(broken_range[0]):revs.index(broken_range[1])]
+
+    names = list(options.batch)
+    if options.testInitialRevs:
+        # Only bisect the testcases that the start revision is good for and the end revision is bad for
+        end_labels = test_rev(end, names)
+        names = [name for name in names if end_labels[name][0] == "bad"]
+        start_labels = test_rev(start, names) if names else {}
+        names = [name for name in names if start_labels[name][0] == "good"]
+        for name in options.batch:
+            if name not in names:
+                print(f"{name}: not bisecting, as the start revision is not good or the end revision is not bad.",
+                      flush=True)
+
+    cached_shells = CachedShells(options.build_options)
+    results = bisect_together(revs, parents, names, test_rev,
+                              skip_range=skip_broken_range if options.compilationFailedLabel == "skip" else None,
+                              has_shell=cached_shells.has_shell, tolerance=options.cachedRevTolerance)
 
+    for name, (first_bad, suspects, labels) in results.items():
+        print(flush=True)
+        if suspects:
+            print(f"{name}: due to skipped revisions, the first bad revision could be any of: "
+                  f"{' '.join(suspects + [first_bad])}", flush=True)
+            continue
+        print(f"{name}: the first bad revision is:", flush=True)
+        print(sanitizeCsetMsg(hg_cmdserver.run(["hg", "-R", repo_dir, "log", "-r", first_bad], check=True)
+                              .stdout.decode("utf-8", errors="replace"), repo_dir), flush=True)
+        checkBlameParents(repo_dir, first_bad, "bad", labels, lambda rev, name=name: test_rev(rev, [name])[name],
+                          start, end)
+
+    end_bisect(repo_dir)
+    print(time.asctime(), flush=True)
+
+
+def narrow_range(revs, test):
+    """Binary search a range for the first bad revision, without telling hg.
+
+    Args:
+        revs (list): Revisions strictly inside the range, in order
+        test (function): Tests a revision, returning "good", "bad" or "skip"
+
+    Returns:
+        tuple: The last revision tested good and the first one tested bad, None for either if there was none
+    """
+    revs = list(revs)
+    last_good = None
+    first_bad = None
+    low, high = 0, len(revs)  # revs[low:high] are left to test
+    while low < high:
+        mid = (low + high) // 2
+        label = test(revs[mid])
+        if label == "good":
+            last_good = revs[mid]
+            low = mid + 1
+        elif label == "bad":
+            first_bad = revs[mid]
+            high = mid
+        else:
+            del revs[mid]
+            high -= 1
+    return last_good, first_bad
+
+
+def find_broken_range(revs, busted_index, is_busted):
+    """Binary search for the edges of the range of revisions that fail to compile around a busted one, assuming that
+    the first and last revisions compile and that the range is contiguous.
+
+    Args:
+        revs (list): Revisions in order
+        busted_index (int): Index of a revision known to fail compilation, strictly inside revs
+        is_busted (function): Builds a revision, returning whether it fails compilation
+
+    Returns:
+        tuple: Indices of the first revision that fails compilation and of the first one that compiles again
+    """
+    assert 0 < busted_index < len(revs) - 1
+    low, high = 0, busted_index  # revs[low] compiles and revs[high] does not
+    while high - low > 1:
+        mid = (low + high) // 2
+        if is_busted(revs[mid]):
+            high = mid
+        else:
+            low = mid
+    first_busted = high
+    low, high = busted_index, len(revs) - 1  # revs[low] does not compile and revs[high] does
+    while high - low > 1:
+        mid = (low + high) // 2
+        if is_busted(revs[mid]):
+            low = mid
+        else:
+            high = mid
+    return first_busted, high
+
+
+def find_linear_broken_range(repo_dir, revs, busted_rev, is_busted):
+    """Find the edges of a compilation bustage with find_broken_range, only trusting them if the changesets between
+    the edges form a single line of development. Across merges, changesets in revision number order interleave
+    several lines, so the edges found there need not bound the bustage in the DAG.
+
+    Args:
+        repo_dir (str): Full path to the repository
+        revs (list): Revisions in revision number order, the first and last of which compile
+        busted_rev (str): Revision known to fail compilation, strictly inside revs
+        is_busted (function): Builds a revision, returning whether it fails compilation
+
+    Returns:
+        tuple: First revision that fails compilation and first one that compiles again, or None if they are not on
+               the same line of development
+    """
+    first_busted, first_fixed = find_broken_range(revs, revs.index(busted_rev), is_busted)
+    broken_revs = revs[first_busted:first_fixed + 1]
+    if hg_helpers.get_linear_range(repo_dir, broken_revs[0], broken_revs[-1]) != broken_revs:
+        return None
+    return broken_revs[0], broken_revs[-1]
+
+
+def bisect_artifacts(options, repo_dir):
+    """Narrow down the range to bisect by testing only the prebuilt shells of an artifact store, without compiling.
+
+    The start and end revisions are assumed to be good and bad, they get tested by the bisection that follows.
+
+    Args:
+        options (object): Options of autobisectjs
+        repo_dir (Path): Full path to the repository
+
+    Returns:
+        tuple: Hashes of the start and end revisions of the remaining range
+    """
+    store = artifact_store.get_artifact_store(options.artifactStore)
+    start = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.startRepo)[0]
+    end = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.endRepo)[0]
+    revs = changeset_index.resolve_revs(repo_dir, start, end)
+    if not revs or None in revs:
+        print("Unable to find the range in the changeset index, not using the artifact store.", flush=True)
+        return start, end
+    start_rev, end_rev = revs
+    cset_index = changeset_index.get_index(repo_dir)
+    stored_revs = sorted(
+        rev for rev in (cset_index.rev(node) for node in
+                        store.list_revs(build_options.computeShellType(options.build_options)))
+        if rev is not None and start_rev < rev < end_rev and
+        cset_index.is_ancestor(start_rev, rev) and cset_index.is_ancestor(rev, end_rev))
+    print(f"{time.asctime()} | Bisecting over {len(stored_revs)} prebuilt shells in {options.artifactStore}",
+          flush=True)
+
+    def test(rev):
+        shell = compile_shell.CompiledShell(options.build_options, rev)
+        if not store.obtain_shell(shell):
+            print(f"{rev}: skip (unable to obtain the prebuilt shell)", flush=True)
+            return "skip"
+        label = options.testAndLabel(shell.get_shell_cache_js_bin_path(), rev)
+        print(f"{rev}: {label[0]} ({label[1]})", flush=True)
+        return label[0]
+
+    last_good, first_bad = narrow_range([cset_index.nodes[rev][:12] for rev in stored_revs], test)
+    return last_good or start, first_bad or end
+
+
+def begin_bisect(options, repo_dir):
+    """Resolve the revisions to bisect between, then reset hg bisect and mark the known broken ranges as skipped.
+
+    Args:
+        options (object): Options of autobisectjs
+        repo_dir (str): Full path to the repository
+
+    Returns:
+        tuple: hg command prefix, and the hashes of the start and end revisions
+    """
     hgPrefix = ["hg", "-R", repo_dir]  # pylint: disable=invalid-name
 
     # Resolve names such as "tip", "default", or "52707" to stable hg hash ids, e.g. "9f2641871ce8".
     # pylint: disable=invalid-name
-    realStartRepo = sRepo = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.startRepo)[0]
+    sRepo = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.startRepo)[0]
     # pylint: disable=invalid-name
-    realEndRepo = eRepo = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.endRepo)[0]
+    eRepo = hg_helpers.get_repo_hash_and_id(repo_dir, repo_rev=options.endRepo)[0]
     sps.vdump(f"Bisecting in the range {sRepo}:{eRepo}")
 
     # Refresh source directory (overwrite all local changes) to default tip if required.
     if options.resetRepoFirst:
-        subprocess.run(hgPrefix + ["update", "-C", "default"], check=True)
+        hg_cmdserver.run(hgPrefix + ["update", "-C", "default"], check=True)
         # Throws exit code 255 if purge extension is not enabled in .hgrc:
-        subprocess.run(hgPrefix + ["purge", "--all"], check=True)
+        hg_cmdserver.run(hgPrefix + ["purge", "--all"], check=True)
 
     # Reset bisect ranges and set skip ranges.
-    subprocess.run(hgPrefix + ["bisect", "-r"],
-                   check=True,
-                   cwd=os.getcwd(),
-                   timeout=99)
+    hg_cmdserver.run(hgPrefix + ["bisect", "-r"], check=True)
     if options.skipRevs:
-        subprocess.run(hgPrefix + ["bisect", "--skip", options.skipRevs],
-                       check=True,
-                       cwd=os.getcwd(),
-                       timeout=300)
+        hg_cmdserver.run(hgPrefix + ["bisect", "--skip", options.skipRevs], check=True)
+
+    return hgPrefix, sRepo, eRepo
+
+
+def end_bisect(repo_dir):
+    """Reset hg bisect and the working directory of the repository.
+
+    Args:
+        repo_dir (str): Full path to the repository
+    """
+    sps.vdump("Resetting bisect")
+    hg_cmdserver.run(["hg", "-R", repo_dir, "bisect", "-U", "-r"], check=True)
+
+    sps.vdump("Resetting working directory")
+    hg_cmdserver.run(["hg", "-R", repo_dir, "update", "-C", "-r", "default"], check=True)
+    hg_helpers.destroyPyc(repo_dir)
+
+
+def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,missing-docstring,too-complex
+    # pylint: disable=too-many-locals,too-many-statements
+    repo_dir = str(repo_dir)
+    print(f"{time.asctime()} | Bisecting on: {repo_dir}", flush=True)
+
+    # pylint: disable=invalid-name
+    hgPrefix, realStartRepo, realEndRepo = begin_bisect(options, repo_dir)
+    sRepo = realStartRepo  # pylint: disable=invalid-name
+    eRepo = realEndRepo  # pylint: disable=invalid-name
+
+    cached_shells = CachedShells(options.build_options)
+
+    def prefer_cached(rev):
+        # Test a nearby revision instead of the one hg suggests, if its shell is already built
+        untested = hg_helpers.get_bisect_revs(repo_dir) if options.cachedRevTolerance else []
+        if rev not in untested:
+            return rev
+        cached_rev = prefer_cached_revs(untested, [rev], cached_shells.has_shell, options.cachedRevTolerance)[0]
+        if cached_rev != rev:
+            print(f"Testing {cached_rev} instead of {rev}, as its shell is already built.", flush=True)
+        return cached_rev
 
     labels = {}
+
+    def skip_broken_range(rev):
+        # Rather than have hg walk linearly around a compilation bustage, binary search for its edges, learn them
+        # for later bisections, and skip the whole range at once
+        revs = hg_helpers.get_bisect_revs(repo_dir, "range")
+        if rev not in revs[1:-1]:
+            return
+        probes = {}
+
+        def is_busted(probe_rev):
+            probes[probe_rev] = testRev(probe_rev)
+            print(f"{probes[probe_rev][0]} ({probes[probe_rev][1]})", flush=True)
+            return probes[probe_rev][1] == "compilation failed"
+
+        print(f"Looking for the edges of the compilation bustage around {rev}...", flush=True)
+        broken_range = find_linear_broken_range(repo_dir, revs, rev, is_busted)
+        if broken_range:
+            print(f"Changesets from {broken_range[0]} up to {broken_range[1]} fail to compile, skipping them all.",
+                  flush=True)
+            kbew.record_broken_range(options.build_options, *broken_range)
+            hg_cmdserver.run(hgPrefix + ["bisect", "-U", "--skip", kbew.hgrange(*broken_range)], check=True)
+        else:
+            print("The compilation bustage spans merges, so leaving hg to skip around it.", flush=True)
+        # Revisions that compiled while looking for the edges were tested too, so tell hg what they showed
+        labels.update(probes)
+        seen_bad = False
+        for probe_rev in sorted(probes, key=revs.index):
+            probe_label = probes[probe_rev]
+            if probe_label[1] == "compilation failed" or (probe_label[0] == "good" and seen_bad):
+                continue
+            seen_bad = seen_bad or probe_label[0] == "bad"
+            hg_cmdserver.run(hgPrefix + ["bisect", "-U", f"--{probe_label[0]}", probe_rev], check=True)
+
     # Specify `hg bisect` ranges.
     if options.testInitialRevs:
         currRev = eRepo  # If testInitialRevs mode is set, compile and test the latest rev first.
     else:
         labels[sRepo] = ("good", "assumed start rev is good")
         labels[eRepo] = ("bad", "assumed end rev is bad")
-        subprocess.run(hgPrefix + ["bisect", "-U", "-g", sRepo], check=True)
-        mid_bisect_output = subprocess.run(
+        hg_cmdserver.run(hgPrefix + ["bisect", "-U", "-g", sRepo], check=True)
+        mid_bisect_output = hg_cmdserver.run(
             hgPrefix + ["bisect", "-U", "-b", eRepo],
-            check=True,
-            cwd=os.getcwd(),
-            stdout=subprocess.PIPE,
-            timeout=300).stdout.decode("utf-8", errors="replace")
+            check=True).stdout.decode("utf-8", errors="replace")
         currRev = hg_helpers.get_cset_hash_from_bisect_msg(
             mid_bisect_output.split("\n"))
+        currRev = prefer_cached(currRev)
 
     iterNum = 1
     if options.testInitialRevs:
@@ -229,16 +738,29 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
     blamedGoodOrBad = None
     blamedRev = None
 
+    speculative_builds = SpeculativeBuilds(options, Path(repo_dir)) if options.speculate else None
+
+    def speculate(rev):
+        # While rev is being tested, build whatever may be tested next
+        if options.testInitialRevs:
+            speculative_builds.start([sRepo])
+        else:
+            speculative_builds.start(next_bisect_candidates(repo_dir, rev))
+
     while currRev is not None:
         startTime = time.time()
-        label = testRev(currRev)
+        if speculative_builds:
+            speculative_builds.wait(currRev)
+            label = testRev(currRev, after_build=functools.partial(speculate, currRev))
+        else:
+            label = testRev(currRev)
         labels[currRev] = label
+        if label == ("skip", "compilation failed") and not options.testInitialRevs:
+            skip_broken_range(currRev)
         if label[0] == "skip":
             skipCount += 1
             # If we use "skip", we tell hg bisect to do a linear search to get around the skipping.
-            # If the range is large, doing a bisect to find the start and endpoints of compilation
-            # bustage would be faster. 20 total skips being roughly the time that the pair of
-            # bisections would take.
+            # Compilation bustage is skipped as a whole range above, so this only adds up for other skips.
             if skipCount > 20:
                 print("Skipped 20 times, stopping autobisectjs.", flush=True)
                 break
@@ -256,37 +778,395 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
             options.testInitialRevs = False
             assert currRev is None
             currRev = sRepo  # If options.testInitialRevs is set, test earliest possible rev next.
+        elif currRev is not None:
+            currRev = prefer_cached(currRev)
+        if speculative_builds:
+            speculative_builds.cancel_all_except(currRev)
 
         iterNum += 1
         endTime = time.time()
         oneRunTime = endTime - startTime
         print(f"This iteration took {oneRunTime:.3f} seconds to run.", flush=True)
 
+    if speculative_builds:
+        speculative_builds.cancel_all_except(None)
+
     if blamedRev is not None:
         checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, realStartRepo,
                           realEndRepo)
 
-    sps.vdump("Resetting bisect")
-    subprocess.run(hgPrefix + ["bisect", "-U", "-r"], check=True)
+    end_bisect(repo_dir)
 
-    sps.vdump("Resetting working directory")
-    subprocess.run(hgPrefix + ["update", "-C", "-r", "default"],
-                   check=True,
-                   cwd=os.getcwd(),
-                   timeout=999)
-    hg_helpers.destroyPyc(repo_dir)
+    print(time.asctime(), flush=True)
+
+
+def find_blamed_cset_parallel(options, repo_dir, testRev):  # pylint: disable=invalid-name,too-complex
+    """Bisect like findBlamedCset, but build options.jobs revisions at a time, splitting what is left of the range
+    into options.jobs + 1 parts each round, so that it takes about log(n)/log(jobs + 1) rounds instead of log2(n).
+
+    Each revision is built in its own working copy sharing the store of the repository, while the shells are tested
+    one at a time, since interestingness tests may keep global state.
+
+    Args:
+        options (object): Options of autobisectjs
+        repo_dir (Path): Full path to the repository
+        testRev (function): Builds and tests a single revision in the repository, for the parents of blamed merges
+    """
+    # pylint: disable=too-many-branches,too-many-locals
+    repo_dir = str(repo_dir)
+    print(f"{time.asctime()} | Bisecting on: {repo_dir}, building {options.jobs} revisions at a time", flush=True)
+
+    hgPrefix, realStartRepo, realEndRepo = begin_bisect(options, repo_dir)  # pylint: disable=invalid-name
+    cached_shells = CachedShells(options.build_options)
+    share_dirs = [get_share_dir(Path(repo_dir), i) for i in range(options.jobs)]
+    for share_dir in share_dirs:
+        hg_helpers.ensure_share(Path(repo_dir), share_dir)
+
+    if options.testInitialRevs:
+        labels = build_and_test_revs(options, [realEndRepo, realStartRepo], share_dirs)
+        print("Finished testing the initial boundary revisions...", flush=True)
+    else:
+        labels = {realStartRepo: ("good", "assumed start rev is good"),
+                  realEndRepo: ("bad", "assumed end rev is bad")}
+    # Like findBlamedCset, tell hg about the end revision first, and only look for a changeset to test afterwards
+    testInitialRevs = options.testInitialRevs  # pylint: disable=invalid-name
+    options.testInitialRevs = True
+    bisectLabel(hgPrefix, options, labels[realEndRepo][0], realEndRepo, realStartRepo, realEndRepo)
+    options.testInitialRevs = False
+    (blamedGoodOrBad, blamedRev, currRev, _, _) = bisectLabel(  # pylint: disable=invalid-name
+        hgPrefix, options, labels[realStartRepo][0], realStartRepo, realStartRepo, realEndRepo)
+    options.testInitialRevs = testInitialRevs
+
+    round_num = 0
+    skip_count = 0
+    while blamedRev is None and currRev is not None:
+        untested = hg_helpers.get_bisect_revs(repo_dir)
+        if not untested:
+            break
+        round_num += 1
+        points = pick_bisection_points(untested, options.jobs)
+        if options.cachedRevTolerance:
+            points = prefer_cached_revs(untested, points, cached_shells.has_shell, options.cachedRevTolerance)
+        print(f"Round {round_num}: testing {len(points)} of {len(untested)} untested changesets...", flush=True)
+        start_time = time.time()
+        round_labels = build_and_test_revs(options, points, share_dirs)
+        labels.update(round_labels)
+
+        seen_bad = False
+        for rev in points:
+            label = round_labels[rev]
+            print(f"{rev}: {label[0]} ({label[1]})", flush=True)
+            if label[0] == "skip":
+                skip_count += 1
+            elif label[0] == "good" and seen_bad:
+                # A good revision after a bad one means one of them was labelled for the wrong reason
+                print(f"Not telling hg that {rev} is good, as an earlier changeset was bad.", flush=True)
+                continue
+            seen_bad = seen_bad or label[0] == "bad"
+            (blamedGoodOrBad, blamedRev, currRev, _, _) = bisectLabel(  # pylint: disable=invalid-name
+                hgPrefix, options, label[0], rev, realStartRepo, realEndRepo)
+            if blamedRev is not None or currRev is None:
+                break
+        print(f"This round took {time.time() - start_time:.3f} seconds to run.", flush=True)
+        if skip_count > 20:
+            print("Skipped 20 times, stopping autobisectjs.", flush=True)
+            break
+
+    if blamedRev is not None:
+        checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, realStartRepo,
+                          realEndRepo)
+
+    end_bisect(repo_dir)
 
     print(time.asctime(), flush=True)
 
 
+class SpeculativeBuilds:
+    """Builds of the revisions that bisection may test next, running in the background in shared working copies.
+
+    Each build is a separate compile_shell process, so that it can be cancelled. Finished shells land in the shell
+    cache, where obtainShell finds them.
+
+    Args:
+        options (object): Options of autobisectjs
+        repo_dir (Path): Full path to the repository
+    """
+
+    def __init__(self, options, repo_dir):
+        self.options = options
+        self.share_dirs = [get_share_dir(repo_dir, i) for i in range(2)]
+        for share_dir in self.share_dirs:
+            hg_helpers.ensure_share(repo_dir, share_dir)
+        self.builds = {}  # compile_shell processes, keyed by revision
+
+    def start(self, revs):
+        """Start building revisions that are not in the shell cache yet.
+
+        Args:
+            revs (list): Up to two revisions
+        """
+        assert not self.builds
+        for rev, share_dir in zip(revs, self.share_dirs):
+            shell = compile_shell.CompiledShell(self.options.build_options, rev)
+            if (shell.get_shell_cache_js_bin_path().is_file() or
+                    shell.get_shell_cache_js_bin_path().with_suffix(".busted").is_file()):
+                continue
+            print(f"Speculatively building rev {rev} in {share_dir}...", flush=True)
+            self.builds[rev] = subprocess.Popen(
+                [sys.executable, "-u", "-m", "funfuzz.js.compile_shell",
+                 "-b", f"{self.options.build_options.build_options_str} -R {share_dir}", "-r", rev],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True)
+
+    def wait(self, rev):
+        """Wait for the speculative build of a revision to finish, if there is one.
+
+        Args:
+            rev (str): Revision
+        """
+        if rev in self.builds:
+            print(f"Waiting for the speculative build of rev {rev}...", flush=True)
+            self.builds.pop(rev).wait()
+
+    def cancel_all_except(self, rev):
+        """Cancel the speculative builds of all revisions but one, which keeps building.
+
+        Args:
+            rev (str): Revision to keep building, if any
+        """
+        for other_rev in [other_rev for other_rev in self.builds if other_rev != rev]:
+            build = self.builds.pop(other_rev)
+            if build.poll() is None:
+                print(f"Cancelling the speculative build of rev {other_rev}", flush=True)
+                # Interrupt compile_shell itself, so that obtainShell cleans up its shell cache directory and its
+                # lock, rather than marking the revision as busted. Then kill whatever compilers are left over.
+                build.send_signal(signal.SIGINT)
+                try:
+                    build.wait(timeout=99)
+                except subprocess.TimeoutExpired:
+                    pass
+                try:
+                    os.killpg(build.pid, signal.SIGKILL)
+                except OSError:
+                    pass  # Nothing left to kill
+                build.wait()
+
+
+def next_bisect_candidates(repo_dir, rev):
+    """Return the changesets hg bisect is likely to suggest testing next if a revision were good, or if it were bad.
+
+    hg is not told anything, the changesets left to test either way are found with the bisect() revset instead, and
+    the middle one of each is picked, which is what hg suggests when they form a single line of development.
+
+    Args:
+        repo_dir (str): Full path to the repository
+        rev (str): Revision being tested
+
+    Returns:
+        list: Changesets likely to be suggested, none if hg would be done bisecting
+    """
+    candidates = []
+    for revset in (f'bisect("untested") - ::{rev}', f'(bisect("untested") and ::{rev}) - {rev}'):
+        untested = hg_cmdserver.run(
+            ["hg", "-R", repo_dir, "log", "-r", f"sort({revset}, rev)", "--template={node|short}\n"],
+            check=True,
+            ).stdout.decode("utf-8", errors="replace").split()
+        if untested:
+            candidates.append(untested[len(untested) // 2])
+    return candidates
+
+
+def get_share_dir(repo_dir, i):
+    """Return the working copy sharing the store of a repository that parallel bisection builds in.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        i (int): Number of the parallel build
+
+    Returns:
+        Path: Full path to the shared working copy
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / "bisect-shares" / f"{repo_dir.name}-{i}"
+
+
+def pick_bisection_points(revs, k):
+    """Pick up to k revisions that split a range into equal parts.
+
+    Args:
+        revs (list): Revisions of the range, in order
+        k (int): Number of revisions to pick
+
+    Returns:
+        list: Revisions picked, in order
+    """
+    if len(revs) <= k:
+        return list(revs)
+    return [revs[(i + 1) * len(revs) // (k + 1)] for i in range(k)]
+
+
+def prefer_cached_revs(revs, points, has_shell, tolerance):
+    """Move the points splitting a range to nearby revisions whose shells are already built, where there are any.
+
+    Args:
+        revs (list): Revisions of the range, in order
+        points (list): Revisions splitting the range evenly, in order
+        has_shell (function): Tells whether the shell of a revision is already built
+        tolerance (float): How far a point may move, as a fraction of the distance between points. Below 0.5, the
+                           points stay apart and in order.
+
+    Returns:
+        list: Revisions to test, in order
+    """
+    window = int(tolerance * len(revs) / (len(points) + 1))
+    moved = []
+    for point in points:
+        pos = revs.index(point)
+        nearby = [pos] + [i for distance in range(1, window + 1) for i in (pos - distance, pos + distance)
+                          if 0 <= i < len(revs)]
+        moved.append(next((revs[i] for i in nearby if has_shell(revs[i])), point))
+    return moved
+
+
+class CachedShells:  # pylint: disable=too-few-public-methods
+    """Tell whether the shells of revisions are already in the local shell cache, or in the S3 cache.
+
+    Args:
+        build_opts (object): Build options of the shells
+    """
+
+    def __init__(self, build_opts):
+        self.build_opts = build_opts
+        self.s3_tarballs = None
+
+    def has_shell(self, rev):
+        """Tell whether the shell of a revision is already built.
+
+        Args:
+            rev (str): Changeset hash
+
+        Returns:
+            bool: True if the shell is in the local shell cache or in the S3 cache
+        """
+        shell = compile_shell.CompiledShell(self.build_opts, rev)
+        if shell.get_shell_cache_js_bin_path().is_file():
+            return True
+        if shell.get_shell_cache_js_bin_path().with_suffix(".busted").is_file():
+            return False
+        if self.s3_tarballs is None:
+            # List the S3 cache once per bisection, rather than asking for each revision
+            s3cache_obj = s3cache.S3Cache(compile_shell.S3_SHELL_CACHE_DIRNAME)
+            if s3cache_obj.connect() and not os.getenv("RETAIN_SRC"):
+                self.s3_tarballs = s3cache_obj.list_files(f"{build_options.computeShellType(self.build_opts)}-")
+            else:
+                self.s3_tarballs = set()
+        return shell.get_s3_tar_name_with_ext() in self.s3_tarballs
+
+
+def build_in_share(options, rev, share_dir):
+    """Build the shell of a revision in a shared working copy.
+
+    Args:
+        options (object): Options of autobisectjs
+        rev (str): Revision to build
+        share_dir (Path): Full path to the shared working copy
+
+    Returns:
+        tuple: Label of the revision if it failed to compile, otherwise None
+    """
+    build_opts = copy.copy(options.build_options)
+    build_opts.repo_dir = share_dir
+    with LockDir(sm_compile_helpers.get_lock_dir_path(Path.home(), share_dir)):
+        try:
+            compile_shell.obtainShell(compile_shell.CompiledShell(build_opts, rev), updateToRev=rev)
+        except (subprocess.CalledProcessError, OSError):
+            return options.compilationFailedLabel, "compilation failed"
+    return None
+
+
+def build_and_test_revs(options, revs, share_dirs):
+    """Build the shells of several revisions at the same time, one per shared working copy, then test them.
+
+    Args:
+        options (object): Options of autobisectjs
+        revs (list): Revisions to build, no more than there are shared working copies
+        share_dirs (list): Full paths to the shared working copies
+
+    Returns:
+        dict: Labels of the revisions
+    """
+    assert len(revs) <= len(share_dirs)
+    with ThreadPoolExecutor(max_workers=len(revs)) as executor:
+        build_labels = list(executor.map(build_in_share, [options] * len(revs), revs, share_dirs))
+
+    labels = {}
+    for rev, build_label in zip(revs, build_labels):
+        if build_label:
+            labels[rev] = build_label
+            continue
+        print(f"Rev {rev}: Testing...", end=" ", flush=True)
+        labels[rev] = options.testAndLabel(
+            compile_shell.CompiledShell(options.build_options, rev).get_shell_cache_js_bin_path(), rev)
+        print(flush=True)
+    return labels
+
+
+class AdaptiveTimeout:
+    """Derive the timeout of shell tests from how long the first good run and the first bad run took, so that a
+    revision that hangs does not hold up bisection for long.
+
+    Args:
+        factor (float): How many times as long as the slower of those runs a test may take
+        minimum (int): Lower bound of the timeout, in seconds
+        maximum (int): Upper bound of the timeout, which is also the timeout until a run has been timed, in seconds
+    """
+
+    def __init__(self, factor=ADAPTIVE_TIMEOUT_FACTOR, minimum=MIN_TEST_TIMEOUT, maximum=MAX_TEST_TIMEOUT):
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+        self.first_durations = {}  # Durations of the first good run and of the first bad run, in seconds
+
+    def get(self):
+        """Return the timeout for the next test.
+
+        Returns:
+            int: Timeout in seconds
+        """
+        if not self.first_durations:
+            return self.maximum
+        return int(min(max(self.factor * max(self.first_durations.values()), self.minimum), self.maximum))
+
+    def record(self, label, duration):
+        """Record how long a test took.
+
+        Args:
+            label (str): Label of the revision tested
+            duration (float): Duration of the test, in seconds
+        """
+        if label in ("good", "bad"):
+            self.first_durations.setdefault(label, duration)
+
+
 def internalTestAndLabel(options):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc,too-complex
     """Use autobisectjs without interestingness tests to examine the revision of the js shell."""
-    def inner(shellFilename, _hgHash):  # pylint: disable=invalid-name,missing-return-doc,too-many-return-statements
-        # pylint: disable=invalid-name
-        (stdoutStderr, exitCode) = inspect_shell.testBinary(shellFilename, options.runtime_params,
-                                                            options.build_options.runWithVg)
-
+    adaptive_timeout = AdaptiveTimeout()
+
+    def inner(shellFilename, _hgHash):  # pylint: disable=invalid-name,missing-return-doc
+        timeout = adaptive_timeout.get()
+        start_time = time.time()
+        try:
+            (stdoutStderr, exitCode) = inspect_shell.testBinary(  # pylint: disable=invalid-name
+                shellFilename, options.runtime_params, options.build_options.runWithVg, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return options.timeoutLabel, f"Timed out after {timeout} seconds"
+        duration = time.time() - start_time
+        label, reason = label_run(stdoutStderr, exitCode)
+        adaptive_timeout.record(label, duration)
+        return label, f"{reason}, took {duration:.1f} of {timeout} seconds"
+
+    def label_run(stdoutStderr, exitCode):  # pylint: disable=invalid-name,too-many-return-statements
         if (stdoutStderr.find(options.output) != -1) and (options.output != ""):  # pylint: disable=no-else-return
             return "bad", "Specified-bad output"
         elif options.watchExitCode is not None and exitCode == options.watchExitCode:
@@ -325,25 +1205,99 @@ def externalTestAndLabel(options, interestingness):  # pylint: disable=invalid-n
     """Make use of interestingness scripts to decide whether the changeset is good or bad."""
     conditionScript = rel_or_abs_import(interestingness[0])  # pylint: disable=invalid-name
     conditionArgPrefix = interestingness[1:]  # pylint: disable=invalid-name
+    # Unless a timeout is given, tests that accept one get the derived timeout once the first runs have been timed
+    adaptive_timeout = AdaptiveTimeout() if conditionScript.__name__ in TIMEOUT_INTERESTINGNESS_TESTS and not any(
+        arg in ("-t", "--timeout") or arg.startswith("--timeout=") for arg in conditionArgPrefix) else None
 
     def inner(shellFilename, hgHash):  # pylint: disable=invalid-name,missing-return-doc
         # pylint: disable=invalid-name
         conditionArgs = conditionArgPrefix + [str(shellFilename)] + options.runtime_params
+        if adaptive_timeout and adaptive_timeout.first_durations:
+            conditionArgs = [f"--timeout={adaptive_timeout.get()}"] + conditionArgs
         temp_dir = Path(tempfile.mkdtemp(prefix=f"abExtTestAndLabel-{hgHash}"))
         temp_prefix = temp_dir / "t"
         if hasattr(conditionScript, "init"):
             # Since we're changing the js shell name, call init() again!
             conditionScript.init(conditionArgs)
+        start_time = time.time()
         if conditionScript.interesting(conditionArgs, str(temp_prefix)):
             innerResult = ("bad", "interesting")  # pylint: disable=invalid-name
         else:
             innerResult = ("good", "not interesting")  # pylint: disable=invalid-name
+        if adaptive_timeout:
+            adaptive_timeout.record(innerResult[0], time.time() - start_time)
         if temp_dir.is_dir():
             file_system_helpers.rm_tree_incl_readonly_files(str(temp_dir))
         return innerResult
     return inner
 
 
+class RepeatedTestAndLabel:  # pylint: disable=too-few-public-methods
+    """Run the test of a revision several times, so that intermittent failures do not get it labelled good.
+
+    Any bad run makes the revision bad, so no more runs are started after one. Good labels come with the confidence
+    that a bad revision would have failed at least once, going by how often runs failed on the bad revisions so far.
+
+    Args:
+        test_and_label (function): Tests a shell once, returning a label and the reason for it
+        repeat (int): Number of times to run the test of a revision
+        jobs (int): Number of runs at the same time
+    """
+
+    def __init__(self, test_and_label, repeat, jobs):
+        self.test_and_label = test_and_label
+        self.repeat = repeat
+        self.jobs = min(jobs, repeat)
+        self.bad_runs = 0  # Failed runs on bad revisions
+        self.runs_on_bad = 0  # All runs on bad revisions
+
+    def __call__(self, shellFilename, hgHash):  # pylint: disable=invalid-name
+        """Test a revision up to the given number of times.
+
+        Args:
+            shellFilename (Path): Full path to the shell
+            hgHash (str): Changeset hash of the shell
+
+        Returns:
+            tuple: Label and the reason for it
+        """
+        results = []
+        # Otherwise interestingness tests would reuse the cached result of the first run, see js_interesting
+        no_result_cache = os.environ.get("NO_RESULT_CACHE")
+        os.environ["NO_RESULT_CACHE"] = "1"
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                running = set()
+                started = 0
+                while True:
+                    while started < self.repeat and len(running) < self.jobs and \
+                            all(result[0] != "bad" for result in results):
+                        running.add(executor.submit(self.test_and_label, shellFilename, hgHash))
+                        started += 1
+                    if not running:
+                        break
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+        finally:
+            if no_result_cache is None:
+                del os.environ["NO_RESULT_CACHE"]
+            else:
+                os.environ["NO_RESULT_CACHE"] = no_result_cache
+
+        bad_results = [result for result in results if result[0] == "bad"]
+        if bad_results:
+            self.bad_runs += len(bad_results)
+            self.runs_on_bad += len(results)
+            return "bad", f"{bad_results[0][1]}, in {len(bad_results)} of {len(results)} runs"
+        label, reason = results[0]
+        if not self.runs_on_bad:
+            return label, f"{reason}, in all {len(results)} runs"
+        failure_rate = self.bad_runs / self.runs_on_bad
+        confidence = 1 - (1 - failure_rate) ** len(results)
+        return label, (f"{reason}, in all {len(results)} runs, {confidence:.0%} confidence "
+                       f"given that {failure_rate:.0%} of runs on bad revisions failed")
+
+
 # pylint: disable=invalid-name,missing-param-doc,missing-type-doc,too-many-arguments
 def checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, startRepo, endRepo):
     """If bisect blamed a merge, try to figure out why."""
@@ -351,12 +1305,9 @@ def checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, sta
     bisectLied = False
     missedCommonAncestor = False
 
-    hg_parent_output = subprocess.run(
+    hg_parent_output = hg_cmdserver.run(
         ["hg", "-R", str(repo_dir)] + ["parent", "--template={node|short},", "-r", blamedRev],
-        check=True,
-        cwd=os.getcwd(),
-        stdout=subprocess.PIPE,
-        timeout=99).stdout.decode("utf-8", errors="replace")
+        check=True).stdout.decode("utf-8", errors="replace")
     parents = hg_parent_output.split(",")[:-1]
 
     if len(parents) == 1:
@@ -429,12 +1380,9 @@ def bisectLabel(hgPrefix, options, hgLabel, currRev, startRepo, endRepo):  # pyl
     # pylint: disable=too-many-arguments
     """Tell hg what we learned about the revision."""
     assert hgLabel in ("good", "bad", "skip")
-    outputResult = subprocess.run(
+    outputResult = hg_cmdserver.run(
         hgPrefix + ["bisect", "-U", f"--{hgLabel}", currRev],
-        check=True,
-        cwd=os.getcwd(),
-        stdout=subprocess.PIPE,
-        timeout=999).stdout.decode("utf-8", errors="replace")
+        check=True).stdout.decode("utf-8", errors="replace")
     outputLines = outputResult.split("\n")
 
     repo_dir = None
@@ -469,7 +1417,7 @@ def bisectLabel(hgPrefix, options, hgLabel, currRev, startRepo, endRepo):  # pyl
     currRev = hg_helpers.get_cset_hash_from_bisect_msg(outputLines[0])
     if currRev is None:
         print("Resetting to default revision...", flush=True)
-        subprocess.run(hgPrefix + ["update", "-C", "default"], check=True)
+        hg_cmdserver.run(hgPrefix + ["update", "-C", "default"], check=True)
         hg_helpers.destroyPyc(repo_dir)
         raise Exception("hg did not suggest a changeset to test!")
 
@@ -486,33 +1434,6 @@ def bisectLabel(hgPrefix, options, hgLabel, currRev, startRepo, endRepo):  # pyl
     return None, None, currRev, start, end
 
 
-def rm_old_local_cached_dirs(cache_dir):
-    """Remove old local cached directories, which were created four weeks ago.
-
-    Args:
-        cache_dir (Path): Full path to the cache directory
-    """
-    assert isinstance(cache_dir, Path)
-    cache_dir = cache_dir.expanduser()
-
-    # This is in autobisectjs because it has a lock so we do not race while removing directories
-    # Adapted from http://stackoverflow.com/a/11337407
-    SECONDS_IN_A_DAY = 24 * 60 * 60
-    s3CacheObj = s3cache.S3Cache(compile_shell.S3_SHELL_CACHE_DIRNAME)
-    if s3CacheObj.connect():
-        NUMBER_OF_DAYS = 1  # EC2 VMs generally have less disk space for local shell caches
-    else:
-        NUMBER_OF_DAYS = 28
-
-    names = [cache_dir / x for x in cache_dir.iterdir()]
-
-    for name in names:
-        if name.is_dir():
-            timediff = time.mktime(time.gmtime()) - Path.stat(name).st_atime
-            if timediff > SECONDS_IN_A_DAY * NUMBER_OF_DAYS:
-                shutil.rmtree(str(name))
-
-
 def main():
     """Prevent running two instances of autobisectjs concurrently - we don't want to confuse hg."""
     options = parseOpts()
@@ -526,9 +1447,18 @@ def main():
         if options.useTreeherderBinaries:
             print("TBD: We need to switch to the autobisect repository.", flush=True)
             sys.exit(0)
+        if options.artifactStore:  # Narrow down the range using prebuilt shells first
+            options.startRepo, options.endRepo = bisect_artifacts(options, repo_dir)
+            print(f"Prebuilt shells narrowed the range down to {options.startRepo}:{options.endRepo}", flush=True)
+        if options.artifactsOnly:
+            pass
+        elif options.batchFile:  # Bisect several testcases using a single set of local builds
+            bisect_batch(options, repo_dir)
+        elif options.jobs > 1:  # Bisect using several local builds at a time
+            find_blamed_cset_parallel(options, repo_dir, compile_shell.makeTestRev(options))
         else:  # Bisect using local builds
             findBlamedCset(options, repo_dir, compile_shell.makeTestRev(options))
 
         # Last thing we do while we have a lock.
-        # Note that this only clears old *local* cached directories, not remote ones.
-        rm_old_local_cached_dirs(sm_compile_helpers.ensure_cache_dir(Path.home()))
+        # Note that this only evicts *local* cached shells, not remote ones.
+        shell_cache.make_room(sm_compile_helpers.ensure_cache_dir(Path.home()))
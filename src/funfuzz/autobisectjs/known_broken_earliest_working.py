@@ -5,13 +5,21 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 """Known broken changeset ranges of SpiderMonkey are specified in this file.
+
+Ranges that autobisectjs finds to fail compilation are also learned, in a database in the shell cache.
 """
 
+from pathlib import Path
 import platform
 import subprocess
 
+import fasteners
 from pkg_resources import parse_version
 
+from ..js import build_options
+from ..util import file_system_helpers
+from ..util import sm_compile_helpers
+
 
 def hgrange(first_bad, first_good):  # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc
     # pylint: disable=missing-type-doc
@@ -105,6 +113,46 @@ def known_broken_ranges(options):  # pylint: disable=missing-param-doc,missing-r
     return skips
 
 
+def get_learned_ranges_path():
+    """Return the path of the database of broken ranges learned by autobisectjs.
+
+    Returns:
+        Path: Full path to the JSON file, keyed by build type, of [first_bad, first_good] pairs
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / "learned-broken-ranges.json"
+
+
+def learned_broken_ranges(options):
+    """Return a list of revsets corresponding to revisions that earlier bisections found to fail compilation.
+
+    Args:
+        options (object): Build options
+
+    Returns:
+        list: Revsets of the learned broken ranges for the build type
+    """
+    ranges = file_system_helpers.read_json(get_learned_ranges_path()) or {}
+    return [hgrange(first_bad, first_good)
+            for first_bad, first_good in ranges.get(build_options.computeShellType(options), [])]
+
+
+def record_broken_range(options, first_bad, first_good):
+    """Learn that a range of revisions fails compilation, so that later bisections skip it at once.
+
+    Args:
+        options (object): Build options
+        first_bad (str): Hash of the first changeset that fails compilation
+        first_good (str): Hash of the first changeset that compiles again
+    """
+    ranges_path = get_learned_ranges_path()
+    with fasteners.InterProcessLock(str(ranges_path.with_suffix(".lock"))):
+        ranges = file_system_helpers.read_json(ranges_path) or {}
+        build_type_ranges = ranges.setdefault(build_options.computeShellType(options), [])
+        if [first_bad, first_good] not in build_type_ranges:
+            build_type_ranges.append([first_bad, first_good])
+            file_system_helpers.write_json_atomically(ranges_path, ranges)
+
+
 def earliest_known_working_rev(_options, flags, skip_revs):  # pylint: disable=missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc,too-many-branches,too-complex,too-many-statements
     """Return a revset which evaluates to the first revision of the shell that compiles with |options|
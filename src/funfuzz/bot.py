@@ -21,16 +21,21 @@ import time
 
 from EC2Reporter.EC2Reporter import EC2Reporter
 
+from .js import artifact_store
 from .js import build_options
 from .js import compile_shell
 from .js import loop
+from .js import reduction_queue
+from .js import shell_flags
 from .util import create_collector
 from .util import fork_join
 from .util import hg_helpers
 from .util import sm_compile_helpers
 from .util.lock_dir import LockDir
 
+ASAN_MEMORY_PER_PROCESS = 1024 ** 3  # bytes
 JS_SHELL_DEFAULT_TIMEOUT = 24  # see comments in loop for tradeoffs
+MEMORY_PER_PROCESS = 256 * 1024 ** 2  # bytes
 
 
 class BuildInfo:  # pylint: disable=missing-param-doc,missing-type-doc,too-few-public-methods
@@ -53,6 +58,8 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         timeout=0,
         build_options=None,
         useTreeherderBuilds=False,
+        artifactStore=None,
+        reducers=max(multiprocessing.cpu_count() // 8, 1),
     )
 
     parser.add_option("--build", dest="existingBuildDir",
@@ -67,12 +74,21 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
     parser.add_option("-T", "--use-treeherder-builds", dest="useTreeherderBuilds", action="store_true",
                       help="Download builds from treeherder instead of compiling our own.")
 
+    parser.add_option("--artifact-store", dest="artifactStore",
+                      help="Directory or URL of a store of prebuilt shells to take the shell from instead of "
+                           "compiling it, if the store has it. See funfuzz.js.artifact_store.")
+
     # Specify how the shell will be built.
     parser.add_option("-b", "--build-options",
                       dest="build_options",
                       help='Specify build options, e.g. -b "-c opt --arch=32" for js '
                            "(python -m funfuzz.js.build_options --help)")
 
+    parser.add_option("--reducers", type="int", dest="reducers",
+                      help="Number of processes reducing interesting testcases, taken out of the one fuzzing "
+                           "process per core. Set to 0 to have fuzzing processes reduce their own testcases. "
+                           'Defaults to "%default".')
+
     parser.add_option("--timeout", type="int", dest="timeout",
                       help="Sets the timeout for loop. "
                            "Defaults to taking into account the speed of the computer and debugger (if any).")
@@ -115,12 +131,22 @@ def main():  # pylint: disable=missing-docstring
 
     build_info = ensureBuild(options)
     assert build_info.buildDir.is_dir()
-
-    number_of_processes = multiprocessing.cpu_count()
-    if "-asan" in str(build_info.buildDir):
-        # This should really be based on the amount of RAM available, but I don't know how to compute that in Python.
-        # I could guess 1 GB RAM per core, but that wanders into sketchyville.
-        number_of_processes = max(number_of_processes // 2, 1)
+    if build_info.mtrArgs:
+        # Build the supported flag table once, so that all forkJoin workers read it from disk instead
+        shell_flags.get_supported_flags(build_info.mtrArgs[-1])
+
+    # Reducers take the place of fuzzing processes, so that there is still one process per core
+    number_of_processes = max(multiprocessing.cpu_count() - options.reducers, 1)
+    # forkJoin runs fewer processes if the memory available does not allow for this much per process, and adjusts
+    # this guess once it has seen how much memory the processes (including their js shells) really use.
+    memory_per_process = (ASAN_MEMORY_PER_PROCESS if "-asan" in str(build_info.buildDir) else
+                          MEMORY_PER_PROCESS)
+
+    # No fuzzing processes are running yet, so any submission still marked as uploading was abandoned
+    create_collector.requeue_orphaned_uploads(create_collector.get_spool_dir())
+    if options.reducers:
+        # No reducers are running yet, so any job still marked as running was abandoned by a previous run
+        reduction_queue.requeue_orphaned_jobs(reduction_queue.get_queue_dir())
 
     try:
         EC2Reporter().report(f"About to start fuzzing {number_of_processes} \n"
@@ -130,8 +156,10 @@ def main():  # pylint: disable=missing-docstring
     except RuntimeError:
         # Ignore errors if the server is temporarily unavailable
         print("Failed to contact server")
-    fork_join.forkJoin(options.tempDir, number_of_processes, loopFuzzingAndReduction, options, build_info,
-                       collector)
+    deadline = time.time() + options.targetTime
+    fork_join.forkJoin(options.tempDir, options.reducers + number_of_processes, loopFuzzingAndReduction, options,
+                       build_info, collector, deadline,
+                       deadline=deadline, memory_per_process=memory_per_process)
     try:
         EC2Reporter().report("Fuzzing has finished...")
     except RuntimeError:
@@ -199,7 +227,9 @@ def ensureBuild(options):  # pylint: disable=invalid-name,missing-docstring,miss
             bRev = hg_helpers.get_repo_hash_and_id(options.build_options.repo_dir)[0]  # pylint: disable=invalid-name
             cshell = compile_shell.CompiledShell(options.build_options, bRev)
             updateLatestTxt = (options.build_options.repo_dir == "mozilla-central")  # pylint: disable=invalid-name
-            compile_shell.obtainShell(cshell, updateLatestTxt=updateLatestTxt)
+            if not (options.artifactStore and
+                    artifact_store.get_artifact_store(options.artifactStore).obtain_shell(cshell)):
+                compile_shell.obtainShell(cshell, updateLatestTxt=updateLatestTxt)
 
             bDir = cshell.get_shell_cache_dir()  # pylint: disable=invalid-name
             # Strip out first 3 chars or else the dir name in fuzzing jobs becomes:
@@ -227,9 +257,18 @@ def ensureBuild(options):  # pylint: disable=invalid-name,missing-docstring,miss
     return BuildInfo(bDir, bType, bSrc, bRev, manyTimedRunArgs)
 
 
-def loopFuzzingAndReduction(options, buildInfo, collector, i):  # pylint: disable=invalid-name,missing-docstring
+def loopFuzzingAndReduction(options, buildInfo, collector, deadline, i):  # pylint: disable=invalid-name
+    # pylint: disable=missing-docstring
+    # Workers that forkJoin restarts, or starts late for lack of memory, only get the time left until the deadline
+    target_time = int(deadline - time.time())
+    if target_time <= 0:
+        return
+    if i < options.reducers:
+        # Reducers get the lowest IDs, so that they are started first when memory is short
+        reduction_queue.run_reducer(reduction_queue.get_queue_dir(), collector, target_time)
+        return
     tempDir = Path(tempfile.mkdtemp(f"loop{i}"))  # pylint: disable=invalid-name
-    loop.many_timed_runs(options.targetTime, tempDir, buildInfo.mtrArgs, collector, False)
+    loop.many_timed_runs(target_time, tempDir, buildInfo.mtrArgs, collector, False)
 
 
 def mtrArgsCreation(options, cshell):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
@@ -242,6 +281,8 @@ def mtrArgsCreation(options, cshell):  # pylint: disable=invalid-name,missing-pa
         manyTimedRunArgs.append("--valgrind")
     manyTimedRunArgs.append("--compare-jit")
     manyTimedRunArgs.append("--random-flags")
+    if options.reducers:
+        manyTimedRunArgs.append(f"--reduction-queue={reduction_queue.get_queue_dir()}")
 
     # Ordering of elements in manyTimedRunArgs is important.
     manyTimedRunArgs.append(str(options.timeout))
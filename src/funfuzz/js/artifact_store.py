@@ -0,0 +1,208 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Stores of prebuilt js shells, so that shells can be obtained without compiling them.
+
+For each build type, e.g. js-dbg-64-linux-x86_64, a store holds a tarball of the dist/bin directory of every revision
+built, and an index of those revisions:
+
+    <store>/<build type>/<revision>.tar.bz2
+    <store>/<build type>/index.txt
+
+A store is either a local directory, or such a directory served over HTTP, e.g. by `python3 -m http.server`.
+"""
+
+import argparse
+import io
+import os
+from pathlib import Path
+import shutil
+import tarfile
+import tempfile
+
+import fasteners
+import requests
+
+from . import build_options
+from . import shell_cache
+from ..util import file_system_helpers
+from ..util import sm_compile_helpers
+from ..util.file_system_helpers import safe_tar_extractall
+
+
+class ArtifactStore:
+    """Base class of artifact stores, which only need to implement read()."""
+
+    def __init__(self):
+        self.revs = {}  # Revisions in the store, keyed by build type
+
+    def read(self, name):
+        """Read a file of the store.
+
+        Args:
+            name (str): Path of the file relative to the root of the store, with "/" separators
+
+        Returns:
+            bytes: Contents of the file, or None if there is no such file
+        """
+        raise NotImplementedError
+
+    def list_revs(self, build_type):
+        """List the revisions of a build type in the store. The index is only read once.
+
+        Args:
+            build_type (str): Shell type, as returned by build_options.computeShellType
+
+        Returns:
+            set: Short changeset hashes
+        """
+        if build_type not in self.revs:
+            index = self.read(f"{build_type}/index.txt") or b""
+            self.revs[build_type] = {rev[:12] for rev in index.decode("utf-8", errors="replace").split()}
+        return self.revs[build_type]
+
+    def obtain_shell(self, shell):
+        """Put a shell into the shell cache from the store, unless it is in the shell cache already.
+
+        Args:
+            shell (class): CompiledShell to obtain
+
+        Returns:
+            bool: True if the shell is now in the shell cache
+        """
+        if shell.get_shell_cache_js_bin_path().is_file():
+            return True
+        build_type = build_options.computeShellType(shell.build_opts)
+        rev = shell.get_hg_hash()[:12]
+        if rev not in self.list_revs(build_type):
+            return False
+        tarball = self.read(f"{build_type}/{rev}.tar.bz2")
+        if tarball is None:
+            return False
+
+        print(f"Extracting the shell of {rev} from the artifact store...")
+        if shell.get_shell_cache_dir().is_dir():
+            file_system_helpers.rm_tree_incl_readonly_files(shell.get_shell_cache_dir())
+        shell.get_shell_cache_dir().mkdir()
+        with tarfile.open(fileobj=io.BytesIO(tarball), mode="r:bz2") as f:
+            safe_tar_extractall(f, str(shell.get_shell_cache_dir()))
+        # dist/bin has the shell as js, while the shell cache names it, and its .fuzzmanagerconf, after itself
+        for entry in shell.get_shell_cache_dir().iterdir():
+            if entry.name == "js" or entry.name.startswith("js."):
+                entry.rename(entry.with_name(shell.get_shell_name_without_ext() + entry.name[len("js"):]))
+        shell_cache.record_shell(sm_compile_helpers.ensure_cache_dir(Path.home()), shell.get_shell_name_without_ext())
+        return True
+
+
+class DirectoryArtifactStore(ArtifactStore):
+    """An artifact store in a local directory.
+
+    Args:
+        root (Path): Full path to the root of the store
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+
+    def read(self, name):
+        """Read a file of the store.
+
+        Args:
+            name (str): Path of the file relative to the root of the store, with "/" separators
+
+        Returns:
+            bytes: Contents of the file, or None if there is no such file
+        """
+        try:
+            return (self.root / name).read_bytes()
+        except OSError:
+            return None
+
+    def add_shell(self, build_type, rev, bin_dir):
+        """Add a shell to the store.
+
+        Args:
+            build_type (str): Shell type, as returned by build_options.computeShellType
+            rev (str): Changeset hash
+            bin_dir (Path): Full path to the dist/bin directory of the shell
+        """
+        rev = rev[:12]
+        build_type_dir = self.root / build_type
+        build_type_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            tarball = shutil.make_archive(str(Path(temp_dir) / rev), "bztar", str(bin_dir))
+            shutil.move(tarball, str(build_type_dir / f"{rev}.tar.bz2"))
+        with fasteners.InterProcessLock(str(build_type_dir / "index.lock")):
+            revs = self.read(f"{build_type}/index.txt") or b""
+            if rev.encode("utf-8") not in revs.split():
+                with io.open(str(build_type_dir / "index.txt"), "a", encoding="utf-8", errors="replace") as f:
+                    f.write(f"{rev}\n")
+        self.revs.pop(build_type, None)
+
+
+class HttpArtifactStore(ArtifactStore):
+    """An artifact store served over HTTP.
+
+    Args:
+        base_url (str): URL of the root of the store
+    """
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def read(self, name):
+        """Read a file of the store.
+
+        Args:
+            name (str): Path of the file relative to the root of the store, with "/" separators
+
+        Returns:
+            bytes: Contents of the file, or None if there is no such file
+        """
+        try:
+            response = requests.get(f"{self.base_url}/{name}", timeout=600)
+        except requests.exceptions.RequestException:
+            return None
+        return response.content if response.status_code == 200 else None
+
+
+def get_artifact_store(location):
+    """Return the artifact store at a location.
+
+    Args:
+        location (str): URL of a store served over HTTP, or path to a local directory
+
+    Returns:
+        ArtifactStore: The artifact store
+    """
+    if location.startswith(("http://", "https://")):
+        return HttpArtifactStore(location)
+    return DirectoryArtifactStore(Path(location).expanduser().resolve())
+
+
+def main():
+    """Add shells of the shell cache to a local artifact store, naming them js as in dist/bin."""
+    parser = argparse.ArgumentParser(description="Add shells of the shell cache to a local artifact store")
+    parser.add_argument("store", help="Root directory of the artifact store")
+    parser.add_argument("shell_dirs", nargs="+", help="Shell cache directories of the shells to add")
+    args = parser.parse_args()
+
+    store = DirectoryArtifactStore(Path(args.store).expanduser().resolve())
+    for shell_dir in args.shell_dirs:
+        shell_dir = Path(shell_dir).expanduser().resolve()
+        build_type, rev = shell_cache.SHELL_DIR_RE.match(shell_dir.name).groups()
+        with tempfile.TemporaryDirectory() as bin_dir:
+            for entry in shell_dir.iterdir():
+                if entry.is_file() and entry.suffix != ".busted":
+                    shutil.copy2(str(entry), os.path.join(bin_dir, entry.name.replace(shell_dir.name, "js")))
+            store.add_shell(build_type, rev, Path(bin_dir))
+        print(f"Added {shell_dir.name} to {store.root}")
+
+
+if __name__ == "__main__":
+    main()
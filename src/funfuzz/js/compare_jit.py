@@ -7,6 +7,8 @@
 """Test comparing the output of SpiderMonkey using various flags (usually JIT-related).
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 import io
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
@@ -16,6 +18,7 @@ from shlex import quote
 import subprocess
 import sys
 import tempfile
+import threading
 
 from FTB.ProgramConfiguration import ProgramConfiguration
 import FTB.Signatures.CrashInfo as Crash_Info
@@ -54,7 +57,7 @@ def ignore_some_stderr(err_inp):
 
 
 def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,missing-type-doc,too-many-arguments
-                flags, infilename, logPrefix, repo, build_options_str, targetTime, options, ccoverage):
+                flags, infilename, logPrefix, repo, build_options_str, targetTime, options, ccoverage, jobs=1):
     """For use in loop.py
 
     Returns:
@@ -66,18 +69,18 @@ def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,miss
     initialdir_name = logPrefix.parent / f"{logPrefix.stem}-initial"
     is_quick_mode = random() < 0.5
     # pylint: disable=invalid-name
-    cl = compareLevel(jsEngine, flags, infilename, initialdir_name, options, False, is_quick_mode)
+    cl = compareLevel(jsEngine, flags, infilename, initialdir_name, options, False, is_quick_mode, jobs)
     lev = cl[0]
 
     if not (ccoverage or lev == js_interesting.JS_FINE):
         itest = [__name__, f'--flags={" ".join(flags)}',
-                 f"--minlevel={lev}", f"--timeout={options.timeout}", options.knownPath]
+                 f"--minlevel={lev}", f"--timeout={options.timeout}", f"--jobs={jobs}", options.knownPath]
         (lithResult, _lithDetails, autoBisectLog) = lithium_helpers.pinpoint(  # pylint: disable=invalid-name
             itest, logPrefix, jsEngine, [], infilename, repo, build_options_str, targetTime, lev)
         if lithResult == lithium_helpers.LITH_FINISHED:
             print(f"Retesting {infilename} after running Lithium:")
             finaldir_name = logPrefix.parent / f"{logPrefix.stem}-final"
-            retest_cl = compareLevel(jsEngine, flags, infilename, finaldir_name, options, True, False)
+            retest_cl = compareLevel(jsEngine, flags, infilename, finaldir_name, options, True, False, jobs)
             if retest_cl[0] != js_interesting.JS_FINE:
                 cl = retest_cl
                 quality = 0
@@ -96,13 +99,14 @@ def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,miss
     return False
 
 
-def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDiffs, quickMode):
+def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDiffs, quickMode, jobs=1):
     # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc,too-complex
     # pylint: disable=too-many-branches,too-many-arguments,too-many-locals,too-many-statements
 
     # options dict must be one we can pass to js_interesting.ShellResult
     # we also use it directly for knownPath, timeout, and collector
     # Return: (lev, crashInfo) or (js_interesting.JS_FINE, None)
+    # With jobs > 1, later combos run ahead of the one being compared, but the verdict is the sequential one
 
     assert isinstance(infilename, Path)
 
@@ -130,112 +134,157 @@ def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDi
     r0 = None
     prefix0 = None
 
-    for i, command in enumerate(commands):
-        prefix = logPrefix.parent / f"{logPrefix.stem}-r{i}"
-        command = commands[i]
-        r = js_interesting.ShellResult(options, command, prefix, True)  # pylint: disable=invalid-name
-
-        oom = js_interesting.oomed(r.err)
-        r.err = ignore_some_stderr(r.err)
-
-        if (r.return_code == 1 or r.return_code == 2) and (anyLineContains(r.out, "[[script] scriptArgs*]") or (
-                anyLineContains(r.err, "[scriptfile] [scriptarg...]"))):
-            print("Got usage error from:")
-            print(f'  {" ".join(quote(str(x)) for x in command)}')
-            assert i
-            file_system_helpers.delete_logs(prefix)
-        elif r.lev > js_interesting.JS_OVERALL_MISMATCH:
-            # would be more efficient to run lithium on one or the other, but meh
-            summary_more_serious = js_interesting.summaryString(r.issues + ["compare_jit found a more serious bug"],
-                                                                r.lev,
-                                                                r.runinfo.elapsedtime)
-            print(f"{infilename} | {summary_more_serious}")
-            summary_log = (logPrefix.parent / f"{logPrefix.stem}-summary").with_suffix(".txt")
-            with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
-                f.write("\n".join(r.issues + [" ".join(quote(str(x)) for x in command),
-                                              "compare_jit found a more serious bug"]) + "\n")
-            print(f'  {" ".join(quote(str(x)) for x in command)}')
-            return r.lev, r.crashInfo
-        elif r.lev != js_interesting.JS_FINE or r.return_code != 0:
-            summary_other = js_interesting.summaryString(
-                r.issues + ["compare_jit is not comparing output, because the shell exited strangely"],
-                r.lev, r.runinfo.elapsedtime)
-            print(f"{infilename} | {summary_other}")
-            print(f'  {" ".join(quote(str(x)) for x in command)}')
-            file_system_helpers.delete_logs(prefix)
-            if not i:
-                return js_interesting.JS_FINE, None
-        elif oom:
-            # If the shell or python hit a memory limit, we consider the rest of the computation
-            # "tainted" for the purpose of correctness comparison.
-            message = "compare_jit is not comparing output: OOM"
-            summary_oom = js_interesting.summaryString(r.issues + [message], r.lev, r.runinfo.elapsedtime)
-            print(f"{infilename} | {summary_oom}")
-            file_system_helpers.delete_logs(prefix)
-            if not i:
-                return js_interesting.JS_FINE, None
-        elif not i:
-            # Stash output from this run (the first one), so for subsequent runs, we can compare against it.
-            (r0, prefix0) = (r, prefix)  # pylint: disable=invalid-name
-        else:
-            # Compare the output of this run (r.out) to the output of the first run (r0.out), etc.
-
-            def optionDisabledAsmOnOneSide():  # pylint: disable=invalid-name
-                asmMsg = "asm.js type error: Disabled by javascript.options.asmjs"  # pylint: disable=invalid-name
-                # pylint: disable=invalid-name
-                # pylint: disable=cell-var-from-loop
-                optionDisabledAsm = anyLineContains(r0.err, asmMsg) or anyLineContains(r.err, asmMsg)
-                # pylint: disable=invalid-name
-                optionDiffers = (("--no-asmjs" in commands[0]) != ("--no-asmjs" in command))
-                return optionDisabledAsm and optionDiffers
-
-            mismatchErr = (r.err != r0.err and not optionDisabledAsmOnOneSide())  # pylint: disable=invalid-name
-            mismatchOut = (r.out != r0.out)  # pylint: disable=invalid-name
-
-            if mismatchErr or mismatchOut:  # pylint: disable=no-else-return
-                # Generate a short summary for stdout and a long summary for a "*-summary.txt" file.
-                # pylint: disable=invalid-name
-                rerunCommand = " ".join(quote(str(x)) for x in [
-                    "python3 -m funfuzz.js.compare_jit",
-                    f'--flags={" ".join(flags)}',
-                    f"--timeout={options.timeout}",
-                    str(options.knownPath),
-                    str(jsEngine),
-                    str(infilename.name)])
-                (summary, issues) = summarizeMismatch(mismatchErr, mismatchOut, prefix0, prefix)
-                summary = (
-                    f'  {" ".join(quote(str(x)) for x in commands[0])}\n'
-                    f'  {" ".join(quote(str(x)) for x in command)}\n'
-                    f"\n"
-                    f"{summary}"
-                )
+    prefixes = [logPrefix.parent / f"{logPrefix.stem}-r{i}" for i in range(len(commands))]
+    results = run_combos(options, commands, prefixes, jobs)
+
+    with closing(results):
+        for i, (command, prefix, r) in enumerate(zip(commands, prefixes, results)):  # pylint: disable=invalid-name
+            oom = "memory_limit" in r.err_matches
+            r.err = ignore_some_stderr(r.err)
+
+            if (r.return_code == 1 or r.return_code == 2) and ("usage" in r.out_matches or "usage" in r.err_matches):
+                print("Got usage error from:")
+                print(f'  {" ".join(quote(str(x)) for x in command)}')
+                assert i
+                file_system_helpers.delete_logs(prefix)
+            elif r.lev > js_interesting.JS_OVERALL_MISMATCH:
+                # would be more efficient to run lithium on one or the other, but meh
+                summary_more_serious = js_interesting.summaryString(r.issues + ["compare_jit found a more serious bug"],
+                                                                    r.lev,
+                                                                    r.runinfo.elapsedtime)
+                print(f"{infilename} | {summary_more_serious}")
                 summary_log = (logPrefix.parent / f"{logPrefix.stem}-summary").with_suffix(".txt")
                 with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
-                    f.write(f"{rerunCommand}\n\n{summary}")
-                summary_overall_mismatch = js_interesting.summaryString(
-                    issues, js_interesting.JS_OVERALL_MISMATCH, r.runinfo.elapsedtime)
-                print(f"{infilename} | {summary_overall_mismatch}")
-                if quickMode:
-                    print(rerunCommand)
-                if showDetailedDiffs:
-                    print(summary)
-                    print()
-                assert jsEngine.with_suffix(".fuzzmanagerconf").is_file()
-                # Create a crashInfo object with empty stdout, and stderr showing diffs
-                # pylint: disable=invalid-name
-                pc = ProgramConfiguration.fromBinary(str(jsEngine.parent / jsEngine.stem))
-                pc.addProgramArguments(flags)
-                crashInfo = Crash_Info.CrashInfo.fromRawCrashData([], summary, pc)  # pylint: disable=invalid-name
-                return js_interesting.JS_OVERALL_MISMATCH, crashInfo
-            else:
-                # print "compare_jit: match"
+                    f.write("\n".join(r.issues + [" ".join(quote(str(x)) for x in command),
+                                                  "compare_jit found a more serious bug"]) + "\n")
+                print(f'  {" ".join(quote(str(x)) for x in command)}')
+                return r.lev, r.crashInfo
+            elif r.lev != js_interesting.JS_FINE or r.return_code != 0:
+                summary_other = js_interesting.summaryString(
+                    r.issues + ["compare_jit is not comparing output, because the shell exited strangely"],
+                    r.lev, r.runinfo.elapsedtime)
+                print(f"{infilename} | {summary_other}")
+                print(f'  {" ".join(quote(str(x)) for x in command)}')
                 file_system_helpers.delete_logs(prefix)
+                if not i:
+                    return js_interesting.JS_FINE, None
+            elif oom:
+                # If the shell or python hit a memory limit, we consider the rest of the computation
+                # "tainted" for the purpose of correctness comparison.
+                message = "compare_jit is not comparing output: OOM"
+                summary_oom = js_interesting.summaryString(r.issues + [message], r.lev, r.runinfo.elapsedtime)
+                print(f"{infilename} | {summary_oom}")
+                file_system_helpers.delete_logs(prefix)
+                if not i:
+                    return js_interesting.JS_FINE, None
+            elif not i:
+                # Stash output from this run (the first one), so for subsequent runs, we can compare against it.
+                (r0, prefix0) = (r, prefix)  # pylint: disable=invalid-name
+            else:
+                # Compare the output of this run (r.out) to the output of the first run (r0.out), etc.
+
+                def optionDisabledAsmOnOneSide():  # pylint: disable=invalid-name
+                    # pylint: disable=invalid-name
+                    # pylint: disable=cell-var-from-loop
+                    optionDisabledAsm = "asmjs_disabled" in r0.err_matches or "asmjs_disabled" in r.err_matches
+                    # pylint: disable=invalid-name
+                    optionDiffers = (("--no-asmjs" in commands[0]) != ("--no-asmjs" in command))
+                    return optionDisabledAsm and optionDiffers
+
+                mismatchErr = (r.err != r0.err and not optionDisabledAsmOnOneSide())  # pylint: disable=invalid-name
+                mismatchOut = (r.out != r0.out)  # pylint: disable=invalid-name
+
+                if mismatchErr or mismatchOut:  # pylint: disable=no-else-return
+                    # Generate a short summary for stdout and a long summary for a "*-summary.txt" file.
+                    # pylint: disable=invalid-name
+                    rerunCommand = " ".join(quote(str(x)) for x in [
+                        "python3 -m funfuzz.js.compare_jit",
+                        f'--flags={" ".join(flags)}',
+                        f"--timeout={options.timeout}",
+                        str(options.knownPath),
+                        str(jsEngine),
+                        str(infilename.name)])
+                    r0.spill_logs()
+                    r.spill_logs()
+                    (summary, issues) = summarizeMismatch(mismatchErr, mismatchOut, prefix0, prefix)
+                    summary = (
+                        f'  {" ".join(quote(str(x)) for x in commands[0])}\n'
+                        f'  {" ".join(quote(str(x)) for x in command)}\n'
+                        f"\n"
+                        f"{summary}"
+                    )
+                    summary_log = (logPrefix.parent / f"{logPrefix.stem}-summary").with_suffix(".txt")
+                    with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
+                        f.write(f"{rerunCommand}\n\n{summary}")
+                    summary_overall_mismatch = js_interesting.summaryString(
+                        issues, js_interesting.JS_OVERALL_MISMATCH, r.runinfo.elapsedtime)
+                    print(f"{infilename} | {summary_overall_mismatch}")
+                    if quickMode:
+                        print(rerunCommand)
+                    if showDetailedDiffs:
+                        print(summary)
+                        print()
+                    assert jsEngine.with_suffix(".fuzzmanagerconf").is_file()
+                    # Create a crashInfo object with empty stdout, and stderr showing diffs
+                    # pylint: disable=invalid-name
+                    pc = ProgramConfiguration.fromBinary(str(jsEngine.parent / jsEngine.stem))
+                    pc.addProgramArguments(flags)
+                    crashInfo = Crash_Info.CrashInfo.fromRawCrashData([], summary, pc)  # pylint: disable=invalid-name
+                    return js_interesting.JS_OVERALL_MISMATCH, crashInfo
+                else:
+                    # print "compare_jit: match"
+                    file_system_helpers.delete_logs(prefix)
 
     # All matched :)
     file_system_helpers.delete_logs(prefix0)
     return js_interesting.JS_FINE, None
 
 
+def run_combos(options, commands, prefixes, jobs):
+    """Run the js shell with each set of flags, yielding the results in the order of the commands.
+
+    With more than one job, the commands run on a bounded pool of threads, each waiting on its own shell. When the
+    caller stops early, runs that have not started are cancelled, shells still running are killed, and logs of runs
+    it never looked at are removed.
+
+    Args:
+        options (object): Options that can be passed to js_interesting.ShellResult
+        commands (list): Commands to run
+        prefixes (list): Log prefixes, one for each command
+        jobs (int): Maximum number of shells to run at the same time
+
+    Yields:
+        ShellResult: Result of each command, in order
+    """
+    if jobs <= 1:
+        for command, prefix in zip(commands, prefixes):
+            yield js_interesting.ShellResult(options, command, prefix, True, in_memory=True)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    stop_event = threading.Event()
+    futures = [executor.submit(js_interesting.ShellResult, options, command, prefix, True, in_memory=True,
+                               stop_event=stop_event)
+               for command, prefix in zip(commands, prefixes)]
+    consumed = 0
+    try:
+        for future in futures:
+            result = future.result()
+            consumed += 1
+            yield result
+    finally:
+        for future in futures[consumed:]:
+            future.cancel()
+        stop_event.set()
+        executor.shutdown(wait=True)
+        for future, prefix in zip(futures[consumed:], prefixes[consumed:]):
+            if not future.cancelled():
+                file_system_helpers.delete_logs(prefix)
+                summary_log = (prefix.parent / f"{prefix.stem}-summary").with_suffix(".txt")
+                if summary_log.is_file():
+                    summary_log.unlink()
+
+
 # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
 def summarizeMismatch(mismatchErr, mismatchOut, prefix0, prefix1):
     issues = []
@@ -271,15 +320,6 @@ def diffFiles(f1, f2):  # pylint: disable=invalid-name,missing-param-doc,missing
     return s
 
 
-# pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
-def anyLineContains(lines, needle):
-    for line in lines:
-        if needle in line:
-            return True
-
-    return False
-
-
 def parseOptions(args):  # pylint: disable=invalid-name
     parser = OptionParser()
     parser.disable_interspersed_args()
@@ -291,6 +331,10 @@ def parseOptions(args):  # pylint: disable=invalid-name
                       type="int", dest="timeout",
                       default=10,
                       help="timeout in seconds")
+    parser.add_option("--jobs",
+                      type="int", dest="jobs",
+                      default=1,
+                      help="number of flag combinations to run at the same time")
     parser.add_option("--flags",
                       dest="flagsSpaceSep",
                       default="",
@@ -322,8 +366,15 @@ def init(args):
 # FIXME: _args is unused here, we should check if it can be removed?  # pylint: disable=fixme
 def interesting(_args, cwd_prefix):
     cwd_prefix = Path(cwd_prefix)  # Lithium uses this function and cwd_prefix from Lithium is not a Path
-    actualLevel = compareLevel(  # pylint: disable=invalid-name
-        gOptions.jsengine, gOptions.flags, gOptions.infilename, cwd_prefix, gOptions, False, False)[0]
+    cache_path = js_interesting.result_cache_path(
+        gOptions.jsengine, ["compare_jit", gOptions.timeout] + gOptions.flags, gOptions.infilename, gOptions.collector)
+    actualLevel = js_interesting.read_cached_level(cache_path)  # pylint: disable=invalid-name
+    if actualLevel is None:
+        timing_dependent_runs = js_interesting.TIMING_DEPENDENT_RUNS["count"]
+        actualLevel = compareLevel(  # pylint: disable=invalid-name
+            gOptions.jsengine, gOptions.flags, gOptions.infilename, cwd_prefix, gOptions, False, False,
+            gOptions.jobs)[0]
+        js_interesting.write_cached_level(cache_path, actualLevel, timing_dependent_runs)
     return actualLevel >= gOptions.minimumInterestingLevel
 
 
@@ -331,7 +382,7 @@ def main():
     options = parseOptions(sys.argv[1:])
     print(compareLevel(
         options.jsengine, options.flags, options.infilename,  # pylint: disable=no-member
-        Path(tempfile.mkdtemp("compare_jitmain")), options, True, False)[0])
+        Path(tempfile.mkdtemp("compare_jitmain")), options, True, False, options.jobs)[0])
 
 
 if __name__ == "__main__":
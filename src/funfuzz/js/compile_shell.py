@@ -25,7 +25,9 @@ from pkg_resources import parse_version
 
 from . import build_options
 from . import inspect_shell
+from . import shell_cache
 from ..util import file_system_helpers
+from ..util import hg_cmdserver
 from ..util import hg_helpers
 from ..util import s3cache
 from ..util import sm_compile_helpers
@@ -595,7 +597,8 @@ def sm_compile(shell):
 
 
 def makeTestRev(options):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
-    def testRev(rev):  # pylint: disable=invalid-name,missing-return-doc,missing-return-type-doc
+    # after_build, if given, is called once the shell has been built, right before it gets tested
+    def testRev(rev, after_build=None):  # pylint: disable=invalid-name,missing-return-doc,missing-return-type-doc
         shell = CompiledShell(options.build_options, rev)
         print(f"Rev {rev}:", end=" ")
 
@@ -604,6 +607,8 @@ def makeTestRev(options):  # pylint: disable=invalid-name,missing-docstring,miss
         except (subprocess.CalledProcessError, OSError):
             return options.compilationFailedLabel, "compilation failed"
 
+        if after_build:
+            after_build()
         print("Testing...", end=" ")
         return options.testAndLabel(shell.get_shell_cache_js_bin_path(), rev)
     return testRev
@@ -613,6 +618,7 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
     # pylint: disable=missing-raises-doc,missing-type-doc,too-many-branches,too-complex,too-many-statements
     """Obtain a js shell. Keep the objdir for now, especially .a files, for symbols."""
     assert sm_compile_helpers.get_lock_dir_path(Path.home(), shell.build_opts.repo_dir).is_dir()
+    cache_dir = sm_compile_helpers.ensure_cache_dir(Path.home())
     cached_no_shell = shell.get_shell_cache_js_bin_path().with_suffix(".busted")
 
     if shell.get_shell_cache_js_bin_path().is_file():  # pylint: disable=no-else-return
@@ -626,14 +632,37 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
         if os.getenv("RETAIN_SRC"):
             print("RETAIN_SRC is set to True, so recompiling with sources retained...")
             file_system_helpers.rm_tree_incl_readonly_files(shell.get_shell_cache_dir())
+        shell_cache.record_shell(cache_dir, shell.get_shell_name_without_ext(), measure=False)
         return
     elif cached_no_shell.is_file():
+        shell_cache.record_shell(cache_dir, shell.get_shell_name_without_ext(), measure=False)
         raise OSError("Found a cached shell that failed compilation...")
     elif shell.get_shell_cache_dir().is_dir():
         print("Found a cache dir without a successful/failed shell...")
         file_system_helpers.rm_tree_incl_readonly_files(shell.get_shell_cache_dir())
 
+    # Make room before building rather than after, so that the disk does not fill up midway
+    shell_cache.make_room(cache_dir, keep=[shell.get_shell_name_without_ext()])
     shell.get_shell_cache_dir().mkdir()
+    try:
+        download_or_compile_shell(shell, updateToRev, updateLatestTxt)
+    finally:
+        shell_cache.record_shell(cache_dir, shell.get_shell_name_without_ext())
+
+
+def download_or_compile_shell(shell, update_to_rev, update_latest_txt):
+    # pylint: disable=too-complex,too-many-branches,too-many-statements
+    """Put a js shell into its empty shell cache directory, from the S3 cache if possible, otherwise by compiling it.
+
+    Args:
+        shell (class): Shell to obtain
+        update_to_rev (str): Changeset to update the repository to before compiling, if any
+        update_latest_txt (bool): Whether to point the "latest" file in the S3 cache to the shell once compiled
+
+    Raises:
+        OSError: If the shell cannot be obtained
+    """
+    cached_no_shell = shell.get_shell_cache_js_bin_path().with_suffix(".busted")
     hg_helpers.destroyPyc(shell.build_opts.repo_dir)
 
     s3cache_obj = s3cache.S3Cache(S3_SHELL_CACHE_DIRNAME)
@@ -656,15 +685,12 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
             return
 
     try:
-        if updateToRev:
+        if update_to_rev:
             # Print *with* a trailing newline to avoid breaking other stuff
-            print(f"Updating to rev {updateToRev} in the {shell.build_opts.repo_dir} repository...")
-            subprocess.run(["hg", "-R", str(shell.build_opts.repo_dir),
-                            "update", "-C", "-r", updateToRev],
-                           check=True,
-                           cwd=os.getcwd(),
-                           stderr=subprocess.DEVNULL,
-                           timeout=9999)
+            print(f"Updating to rev {update_to_rev} in the {shell.build_opts.repo_dir} repository...")
+            hg_cmdserver.run(["hg", "-R", str(shell.build_opts.repo_dir), "update", "-C", "-r", update_to_rev],
+                             check=True,
+                             timeout=9999)
         if shell.build_opts.patch_file:
             hg_helpers.patch_hg_repo_with_mq(shell.build_opts.patch_file, shell.get_repo_dir())
 
@@ -694,7 +720,7 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
     if use_s3cache and not os.getenv("RETAIN_SRC"):
         s3cache_obj.compressAndUploadDirTarball(str(shell.get_shell_cache_dir()),
                                                 str(shell.get_s3_tar_with_ext_full_path()))
-        if updateLatestTxt:
+        if update_latest_txt:
             # So js-dbg-64-dm-darwin-cdcd33fd6e39 becomes js-dbg-64-dm-darwin-latest.txt with
             # js-dbg-64-dm-darwin-cdcd33fd6e39 as its contents.
             txt_info = f'{"-".join(str(shell.get_s3_tar_name_with_ext()).split("-")[:-1] + ["latest"])}.txt'
@@ -9,15 +9,21 @@
 
 import json
 import os
+from pathlib import Path
 import platform
 from shlex import quote
 import subprocess
 
 from lithium.interestingness.utils import env_with_path
 
+from ..util import file_system_helpers
 from ..util import subprocesses as sps
 
 ASAN_ERROR_EXIT_CODE = 77
+# Stored next to the .fuzzmanagerconf file of the shell, see get_build_configuration
+BUILD_CONFIGURATION_SUFFIX = ".buildconfiguration"
+BUILD_CONFIGURATIONS = {}  # In-process cache, keyed by (shell path, size, mtime)
+SHELL_HASHES = {}  # In-process cache, keyed by (shell path, size, mtime)
 RUN_MOZGLUE_LIB = ""
 RUN_NSPR_LIB = ""
 RUN_PLDS_LIB = ""
@@ -146,9 +152,9 @@ def shellSupports(shellPath, args):  # pylint: disable=invalid-name,missing-para
         raise Exception(f"Unexpected exit code in shellSupports {return_code}")
 
 
-def testBinary(shellPath, args, useValgrind, stderr=subprocess.STDOUT):  # pylint: disable=invalid-name
-    # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
-    """Test the given shell with the given args."""
+def testBinary(shellPath, args, useValgrind, stderr=subprocess.STDOUT, timeout=999):  # pylint: disable=invalid-name
+    # pylint: disable=missing-param-doc,missing-raises-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
+    """Test the given shell with the given args. Raises subprocess.TimeoutExpired if it runs for longer than timeout."""
     test_cmd = (constructVgCmdList() if useValgrind else []) + [str(shellPath)] + args
     sps.vdump(f'The testing command is: {" ".join(quote(str(x)) for x in test_cmd)}')
 
@@ -170,7 +176,7 @@ def testBinary(shellPath, args, useValgrind, stderr=subprocess.STDOUT):  # pylin
         env=test_env,
         stderr=stderr,
         stdout=subprocess.PIPE,
-        timeout=999)
+        timeout=timeout)
     out, return_code = test_cmd_result.stdout.decode("utf-8", errors="replace"), test_cmd_result.returncode
     sps.vdump(f"The exit code is: {return_code}")
     return out, return_code
@@ -182,12 +188,102 @@ def testJsShellOrXpcshell(s):  # pylint: disable=invalid-name,missing-param-doc,
     return "xpcshell" if shellSupports(s, ["-e", "Components"]) else "jsShell"
 
 
+def read_shell_cache(shell_path, suffix):
+    """Read data cached for a js shell binary, stored next to the .fuzzmanagerconf file of the shell.
+
+    Entries are keyed by the binary's path, size, mtime and SHA-256 hash. The hash is only computed if the mtime
+    differs, e.g. after the shell got copied or extracted without its contents having changed.
+
+    Args:
+        shell_path (Path): Full path to the js shell
+        suffix (str): Suffix of the cache file, e.g. BUILD_CONFIGURATION_SUFFIX
+
+    Returns:
+        object: Cached contents, or None if absent or stale
+    """
+    shell_path = Path(shell_path).expanduser().resolve()
+    shell_stat = shell_path.stat()
+    cache_file = shell_path.with_suffix(suffix)
+    cached = file_system_helpers.read_json(cache_file)
+    if not (isinstance(cached, dict) and cached.get("path") == str(shell_path) and
+            cached.get("size") == shell_stat.st_size):
+        return None
+    if cached.get("mtime_ns") == shell_stat.st_mtime_ns:
+        return cached.get("contents")
+    if cached.get("sha256") == file_system_helpers.file_sha256(shell_path):
+        cached["mtime_ns"] = shell_stat.st_mtime_ns
+        file_system_helpers.write_json_atomically(cache_file, cached)
+        return cached.get("contents")
+    return None
+
+
+def write_shell_cache(shell_path, suffix, contents):
+    """Store data for a js shell binary next to the .fuzzmanagerconf file of the shell, see read_shell_cache.
+
+    Args:
+        shell_path (Path): Full path to the js shell
+        suffix (str): Suffix of the cache file, e.g. BUILD_CONFIGURATION_SUFFIX
+        contents (object): JSON-serializable contents to be cached
+    """
+    shell_path = Path(shell_path).expanduser().resolve()
+    shell_stat = shell_path.stat()
+    file_system_helpers.write_json_atomically(shell_path.with_suffix(suffix), {
+        "path": str(shell_path),
+        "size": shell_stat.st_size,
+        "mtime_ns": shell_stat.st_mtime_ns,
+        "sha256": file_system_helpers.file_sha256(shell_path),
+        "contents": contents,
+    })
+
+
+def get_build_configuration(shell_path):
+    """Retrieve the full getBuildConfiguration() object of a js shell, launching the shell at most once per binary.
+
+    Results are kept in-process, and are also stored on disk using write_shell_cache so that other processes do not
+    need to launch the shell again.
+
+    Args:
+        shell_path (Path): Full path to the js shell
+
+    Returns:
+        dict: Build configuration of the js shell
+    """
+    shell_path = Path(shell_path).expanduser().resolve()
+    shell_stat = shell_path.stat()
+    memo_key = (str(shell_path), shell_stat.st_size, shell_stat.st_mtime_ns)
+    if memo_key not in BUILD_CONFIGURATIONS:
+        configuration = read_shell_cache(shell_path, BUILD_CONFIGURATION_SUFFIX)
+        if configuration is None:
+            sps.vdump(f"Querying the build configuration of {shell_path}")
+            out = testBinary(shell_path, ["-e", "print(JSON.stringify(getBuildConfiguration()))"],
+                             False, stderr=subprocess.DEVNULL)[0]
+            configuration = json.loads(out.rstrip().split("\n")[-1])
+            write_shell_cache(shell_path, BUILD_CONFIGURATION_SUFFIX, configuration)
+        BUILD_CONFIGURATIONS[memo_key] = configuration
+    return BUILD_CONFIGURATIONS[memo_key]
+
+
+def shell_sha256(shell_path):
+    """Return the SHA-256 hash of a js shell binary, hashing it at most once per process.
+
+    Args:
+        shell_path (Path): Full path to the js shell
+
+    Returns:
+        str: Hex digest of the SHA-256 hash of the binary
+    """
+    shell_path = Path(shell_path).expanduser().resolve()
+    shell_stat = shell_path.stat()
+    memo_key = (str(shell_path), shell_stat.st_size, shell_stat.st_mtime_ns)
+    if memo_key not in SHELL_HASHES:
+        SHELL_HASHES[memo_key] = file_system_helpers.file_sha256(shell_path)
+    return SHELL_HASHES[memo_key]
+
+
 def queryBuildConfiguration(s, parameter):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc
     """Test if a binary is compiled with specified parameters, in getBuildConfiguration()."""
-    return json.loads(testBinary(s,
-                                 ["-e", f'print(getBuildConfiguration()["{parameter}"])'],
-                                 False, stderr=subprocess.DEVNULL)[0].rstrip().lower())
+    return get_build_configuration(s)[parameter]
 
 
 def verifyBinary(sh):  # pylint: disable=invalid-name,missing-param-doc,missing-type-doc
@@ -8,7 +8,9 @@
 """
 
 from copy import deepcopy
+import hashlib
 import io
+import json
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
 from pathlib import Path
@@ -24,9 +26,12 @@ import FTB.Signatures.CrashInfo as Crash_Info
 import lithium.interestingness.timed_run as timedrun
 
 from . import inspect_shell
+from . import shell_cache
+from ..util import capture_run
 from ..util import create_collector
-from ..util import file_manipulation
+from ..util import file_system_helpers
 from ..util import os_ops
+from ..util import output_classifier
 
 # Levels of unhappiness.
 # These are in order from "most expected to least expected" rather than "most ok to worst".
@@ -53,12 +58,44 @@ assert len(JS_LEVEL_NAMES) == JS_LEVELS
 
 
 gOptions = ""  # pylint: disable=invalid-name
+# Everything ShellResult and compare_jit look for in the output of a run, so it only needs to be scanned once
+STDOUT_CLASSIFIER = output_classifier.OutputClassifier({
+    "found_bug": r"^Found a bug: ",
+    # Note that "jsfunfuzz broke its own scripting environment: " is not currently generated in error-reporting.js
+    # Working wasm testcases show "[fuzz-exec] calling " in stdout
+    "understood_exit": (r"^(?:It's looking good!|jsfunfuzz broke its own scripting environment: |"
+                        r"\[fuzz-exec\] calling )"),
+    "usage": r"\[\[script\] scriptArgs\*\]",
+})
+STDERR_CLASSIFIER = output_classifier.OutputClassifier({
+    "unhandlable_oom": r"\[unhandlable oom\]",
+    # --differential-testing shells report running out of memory on stderr, as do ASan and malloc
+    "memory_limit": r"ReportOverRecursed called|ReportOutOfMemory called|failed to allocate|can't allocate region",
+    "understood_exit": r"terminate called|quit called|can't allocate region",
+    # "szone_error" (Tiger), "malloc_error_break" (Leopard), "MallocHelp" (?)
+    "malloc_error": r"szone_error|malloc_error_break|MallocHelp",
+    # Note that looking out for the Assertion failure message is highly SpiderMonkey-specific
+    "assertion_or_crash": r"Assertion failure: |Segmentation fault|Bus error",
+    "usage": r"\[scriptfile\] \[scriptarg\.\.\.\]",
+    "asmjs_disabled": r"asm\.js type error: Disabled by javascript\.options\.asmjs",
+    # Markers that FuzzManager's CrashInfo.fromRawCrashData looks for, see is_suspicious
+    "crash_report": (r"ERROR: AddressSanitizer|Sanitizer: hard rss limit exhausted|ERROR: LeakSanitizer:|"
+                     r"(?:WARNING|ERROR): ThreadSanitizer:|: runtime error: |ERROR: UndefinedBehaviorSanitizer|"
+                     r"received signal SIG|Program terminated with signal |panicked at|^==\d+== "),
+})
+# Number of runs of this process whose CrashInfo was built, and whose CrashInfo and signature search were skipped
+CRASH_INFO_COUNTS = {"built": 0, "skipped": 0}
+# Number of runs of this process that timed out or ran out of memory, whose outcome depends on timing or load
+TIMING_DEPENDENT_RUNS = {"count": 0}
 VALGRIND_ERROR_EXIT_CODE = 77
 
 
 class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attributes,too-few-public-methods
     # options dict should include: timeout, knownPath, collector, valgrind, shellIsDeterministic
-    def __init__(self, options, runthis, logPrefix, in_compare_jit, env=None):  # pylint: disable=too-complex
+    # With in_memory, output is captured through pipes and only written to the -out and -err logs if the result is
+    # interesting, or when spill_logs is called. Setting stop_event (a threading.Event) then kills the run early.
+    def __init__(self, options, runthis, logPrefix, in_compare_jit, env=None,  # pylint: disable=too-complex
+                 in_memory=False, stop_event=None):
         # pylint: disable=too-many-arguments,too-many-branches,too-many-locals,too-many-statements
 
         # If Lithium uses this as an interestingness test, logPrefix is likely not a Path object, so make it one.
@@ -68,6 +105,7 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
         # Ignore trailing ".exe" in Win, also abspath makes it work w/relative paths like "./js"
         # pylint: disable=invalid-name
         assert pathToBinary.with_suffix(".fuzzmanagerconf").is_file()
+        shell_cache.record_shell_in_use(pathToBinary)
         pc = ProgramConfiguration.fromBinary(str(pathToBinary.parent / pathToBinary.stem))
         pc.addProgramArguments(runthis[1:-1])
 
@@ -93,16 +131,22 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
 
         pc.addEnvironmentVariables(dict(timed_run_kw["env"]))
 
-        lithium_logPrefix = str(logPrefix).encode("utf-8")
-        if isinstance(lithium_logPrefix, b"".__class__):
-            lithium_logPrefix = lithium_logPrefix.decode("utf-8", errors="replace")
-
-        # logPrefix should be a string for timed_run in Lithium version 0.2.1 to work properly, apparently
-        runinfo = timedrun.timed_run(
-            [str(x) for x in runthis],  # Convert all Paths/bytes to strings for Lithium
-            options.timeout,
-            lithium_logPrefix,
-            **timed_run_kw)
+        if in_memory:
+            runinfo = capture_run.timed_run([str(x) for x in runthis], options.timeout, stop_event=stop_event,
+                                            **timed_run_kw)
+            self.in_memory_logs = [runinfo.out, runinfo.err]
+        else:
+            lithium_logPrefix = str(logPrefix).encode("utf-8")
+            if isinstance(lithium_logPrefix, b"".__class__):
+                lithium_logPrefix = lithium_logPrefix.decode("utf-8", errors="replace")
+
+            # logPrefix should be a string for timed_run in Lithium version 0.2.1 to work properly, apparently
+            runinfo = timedrun.timed_run(
+                [str(x) for x in runthis],  # Convert all Paths/bytes to strings for Lithium
+                options.timeout,
+                lithium_logPrefix,
+                **timed_run_kw)
+            self.in_memory_logs = None
 
         lev = JS_FINE
         is_oom = False
@@ -112,18 +156,22 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
         # FuzzManager expects a list of strings rather than an iterable, so bite the
         # bullet and "readlines" everything into memory.
         # Collector adds newlines later, see https://git.io/fjoMB
-        out_log = (logPrefix.parent / f"{logPrefix.stem}-out").with_suffix(".txt")
-        with io.open(str(out_log), "r", encoding="utf-8", errors="replace") as f:
-            out = [line.rstrip() for line in f]
-        err_log = (logPrefix.parent / f"{logPrefix.stem}-err").with_suffix(".txt")
-        with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
-            err = [line.rstrip() for line in f]
-
-        for line in reversed(err):
-            if "[unhandlable oom]" in line:
-                print("Ignoring unhandlable oom...")
-                is_oom = True
-                break
+        if in_memory:
+            out = [line.rstrip() for line in io.StringIO(runinfo.out, newline=None)]
+            err = [line.rstrip() for line in io.StringIO(runinfo.err, newline=None)]
+        else:
+            out_log = (logPrefix.parent / f"{logPrefix.stem}-out").with_suffix(".txt")
+            with io.open(str(out_log), "r", encoding="utf-8", errors="replace") as f:
+                out = [line.rstrip() for line in f]
+            err_log = (logPrefix.parent / f"{logPrefix.stem}-err").with_suffix(".txt")
+            with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
+                err = [line.rstrip() for line in f]
+
+        out_matches = STDOUT_CLASSIFIER.classify(out)
+        err_matches = STDERR_CLASSIFIER.classify(err)
+        if "unhandlable_oom" in err_matches:
+            print("Ignoring unhandlable oom...")
+            is_oom = True
 
         if is_oom:
             lev = JS_FINE
@@ -151,23 +199,26 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
                 crash_log = (logPrefix.parent / f"{logPrefix.stem}-crash").with_suffix(".txt")
                 with io.open(str(crash_log), "r", encoding="utf-8", errors="replace") as f:
                     auxCrashData = [line.strip() for line in f.readlines()]
-        elif file_manipulation.amiss(logPrefix):
+        elif "malloc_error" in err_matches:
+            # Signs of malloc being unhappy (double free, out-of-memory, etc)
+            print()
+            print(err_matches["malloc_error"][0].strip("\x07"))
             issues.append("malloc error")
             lev = max(lev, JS_NEW_ASSERT_OR_CRASH)
         elif runinfo.return_code == 0 and not in_compare_jit:
             # We might have(??) run jsfunfuzz directly, so check for special kinds of bugs
-            for line in out:
-                if line.startswith("Found a bug: ") and not ("NestTest" in line and oomed(err)):
+            for line in out_matches.get("found_bug", []):
+                if not ("NestTest" in line and "memory_limit" in err_matches):
                     lev = JS_DECIDED_TO_EXIT
                     issues.append(line.rstrip())
-            if options.shellIsDeterministic and not understoodJsfunfuzzExit(out, err) and not oomed(err):
+            if (options.shellIsDeterministic and not understood_jsfunfuzz_exit(out_matches, err_matches) and
+                    "memory_limit" not in err_matches):
                 issues.append("jsfunfuzz didn't finish")
                 lev = JS_DID_NOT_FINISH
 
         # Copy non-crash issues to where FuzzManager's "AssertionHelper" can see it.
-        if lev != JS_FINE:
-            for issue in issues:
-                err.append(f"[Non-crash bug] {issue}")
+        non_crash_lines = [f"[Non-crash bug] {issue}" for issue in issues] if lev != JS_FINE else []
+        err.extend(non_crash_lines)
 
         activated = False  # Turn on when trying to report *reliable* testcases that do not have a coredump
         # On Linux, fall back to run testcase via gdb using --args if core file data is unavailable
@@ -192,30 +243,44 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
             )
             auxCrashData = no_main_log_gdb_log.stdout
 
-        # Finally, make a CrashInfo object and parse stack traces for asan/crash/assertion bugs
-        crashInfo = Crash_Info.CrashInfo.fromRawCrashData(out, err, pc, auxCrashData=auxCrashData)
+        self._crash_info_data = (out, err, pc, auxCrashData)
+        self._crash_info = None
+        match = (None, None)
+        if is_oom or not is_suspicious(lev, runinfo, auxCrashData, err_matches):
+            # Nothing FuzzManager could make a crash signature out of, so the CrashInfo is only built if asked for
+            CRASH_INFO_COUNTS["skipped"] += 1
+        else:
+            # Finally, make a CrashInfo object and parse stack traces for asan/crash/assertion bugs
+            crashInfo = self.crashInfo  # pylint: disable=invalid-name
+
+            create_collector.printCrashInfo(crashInfo)
+            # We only care about crashes and assertion failures on shells with no symbols
+            # Note that looking out for the Assertion failure message is highly SpiderMonkey-specific
+            if (not isinstance(crashInfo, Crash_Info.NoCrashInfo) or
+                    "assertion_or_crash" in err_matches or
+                    "assertion_or_crash" in STDERR_CLASSIFIER.classify(non_crash_lines)):
+                lev = max(lev, JS_NEW_ASSERT_OR_CRASH)
+
+            try:
+                match = options.collector.search(crashInfo)
+                if match[0] is not None:
+                    create_collector.printMatchingSignature(match)
+                    if match[1].get("frequent"):
+                        print("Ignoring frequent bucket")
+                        lev = JS_FINE
+            except UnicodeDecodeError:  # Sometimes FM throws due to unicode issues
+                print("Note: FuzzManager is throwing a UnicodeDecodeError, signature matching skipped")
+                match = False
 
-        create_collector.printCrashInfo(crashInfo)
-        # We only care about crashes and assertion failures on shells with no symbols
-        # Note that looking out for the Assertion failure message is highly SpiderMonkey-specific
-        if not is_oom and (not isinstance(crashInfo, Crash_Info.NoCrashInfo) or
-                           "Assertion failure: " in str(crashInfo.rawStderr) or
-                           "Segmentation fault" in str(crashInfo.rawStderr) or
-                           "Bus error" in str(crashInfo.rawStderr)):
-            lev = max(lev, JS_NEW_ASSERT_OR_CRASH)
+        print(f"{logPrefix} | {summaryString(issues, lev, runinfo.elapsedtime)}")
 
-        try:
-            match = options.collector.search(crashInfo)
-            if match[0] is not None:
-                create_collector.printMatchingSignature(match)
-                if match[1].get("frequent"):
-                    print("Ignoring frequent bucket")
-                    lev = JS_FINE
-        except UnicodeDecodeError:  # Sometimes FM throws due to unicode issues
-            print("Note: FuzzManager is throwing a UnicodeDecodeError, signature matching skipped")
-            match = False
+        if (runinfo.sta == timedrun.TIMED_OUT or is_oom or "memory_limit" in err_matches or
+                "malloc_error" in err_matches):
+            TIMING_DEPENDENT_RUNS["count"] += 1
 
-        print(f"{logPrefix} | {summaryString(issues, lev, runinfo.elapsedtime)}")
+        self.logPrefix = logPrefix  # pylint: disable=invalid-name
+        if lev != JS_FINE:
+            self.spill_logs()
 
         if lev != JS_FINE:
             summary_log = (logPrefix.parent / f"{logPrefix.stem}-summary").with_suffix(".txt")
@@ -227,58 +292,66 @@ class ShellResult:  # pylint: disable=missing-docstring,too-many-instance-attrib
         self.lev = lev
         self.out = out
         self.err = err
+        self.out_matches = out_matches
+        self.err_matches = err_matches
         self.issues = issues
-        self.crashInfo = crashInfo  # pylint: disable=invalid-name
         self.match = match
         self.runinfo = runinfo
         self.return_code = runinfo.return_code
 
+    @property
+    def crashInfo(self):  # pylint: disable=invalid-name
+        """FuzzManager CrashInfo object of the run, built on first use.
 
-def understoodJsfunfuzzExit(out, err):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
-    # pylint: disable=missing-return-type-doc
-    for line in err:
-        if "terminate called" in line or "quit called" in line:
-            return True
-        if "can't allocate region" in line:
-            return True
-
-    for line in out:
-        # Note that "jsfunfuzz broke its own scripting environment: " is not currently generated in error-reporting.js
-        if line.startswith("It's looking good!") or line.startswith("jsfunfuzz broke its own scripting environment: "):
-            return True
-        if line.startswith("Found a bug: "):
-            return True
-        if line.startswith("[fuzz-exec] calling "):  # Working wasm testcases show this in stdout
-            return True
-
-    return False
-
-
-def hitMemoryLimit(err):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc,missing-return-type-doc
-    # pylint: disable=missing-type-doc
-    """Return True iff stderr text indicates that the shell hit a memory limit."""
-    if "ReportOverRecursed called" in err:  # pylint: disable=no-else-return
-        # --differential-testing
-        return "ReportOverRecursed called"
-    elif "ReportOutOfMemory called" in err:
-        # --differential-testing
-        return "ReportOutOfMemory called"
-    elif "failed to allocate" in err:
-        # ASan
-        return "failed to allocate"
-    elif "can't allocate region" in err:
-        # malloc
-        return "can't allocate region"
+        Returns:
+            object: CrashInfo object
+        """
+        if self._crash_info is None:
+            out, err, pc, aux_crash_data = self._crash_info_data
+            self._crash_info = Crash_Info.CrashInfo.fromRawCrashData(out, err, pc, auxCrashData=aux_crash_data)
+            CRASH_INFO_COUNTS["built"] += 1
+        return self._crash_info
 
-    return None
+    def spill_logs(self):
+        """Write the output of an in-memory run to the usual -out and -err logs, if that has not been done yet."""
+        if self.in_memory_logs is None:
+            return
+        for log_type, contents in zip(["out", "err"], self.in_memory_logs):
+            log_file = (self.logPrefix.parent / f"{self.logPrefix.stem}-{log_type}").with_suffix(".txt")
+            with io.open(str(log_file), "w", encoding="utf-8", errors="replace") as f:
+                f.write(contents)
+        self.in_memory_logs = None
+
+
+def is_suspicious(lev, runinfo, aux_crash_data, err_matches):
+    """Return whether a run might have hit a bug that FuzzManager can make a crash signature out of.
+
+    Runs that are not suspicious do not need a CrashInfo object, nor a search through the signature cache.
 
+    Args:
+        lev (int): Level of the run as determined so far
+        runinfo (class): Lithium rundata of the run
+        aux_crash_data (list): Crash log lines of the run
+        err_matches (dict): Output of STDERR_CLASSIFIER.classify on the stderr of the run
 
-def oomed(err):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
-    # spidermonkey shells running with --differential-testing will tell us on stderr if they run out of memory
-    for line in err:
-        if hitMemoryLimit(line):
-            return True
-    return False
+    Returns:
+        bool: True if the run is suspicious
+    """
+    return (lev != JS_FINE or runinfo.sta == timedrun.CRASHED or bool(aux_crash_data) or
+            "assertion_or_crash" in err_matches or "crash_report" in err_matches)
+
+
+def understood_jsfunfuzz_exit(out_matches, err_matches):
+    """Return whether jsfunfuzz exited in a way that is understood, going by the classified output.
+
+    Args:
+        out_matches (dict): Output of STDOUT_CLASSIFIER.classify
+        err_matches (dict): Output of STDERR_CLASSIFIER.classify
+
+    Returns:
+        bool: True if jsfunfuzz exited in a way that is understood
+    """
+    return bool({"understood_exit", "found_bug"} & set(out_matches) or "understood_exit" in err_matches)
 
 
 def summaryString(issues, level, elapsedtime):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
@@ -287,6 +360,73 @@ def summaryString(issues, level, elapsedtime):  # pylint: disable=invalid-name,m
     return f"{elapsedtime:5.1f}s | {level} | {JS_LEVEL_NAMES[level]}{amissDetails}"
 
 
+def result_cache_path(shell_path, run_settings, testcase, collector):
+    """Return the file holding the cached level of a testcase, in a directory next to the js shell.
+
+    Lithium passes often test the same candidate more than once, so the level is keyed by the contents of the shell
+    and of the testcase, rather than by their paths. Since signatures of frequent buckets turn crashes into JS_FINE,
+    the key also changes whenever the signature cache is refreshed.
+
+    Args:
+        shell_path (Path): Full path to the js shell
+        run_settings (list): Anything else that affects the level, e.g. the kind of test, timeout and shell flags
+        testcase (Path): Full path to the testcase
+        collector (class): Collector for FuzzManager whose signature cache the level was matched against
+
+    Returns:
+        Path: Full path to the cache file, which may not exist yet
+    """
+    cache_key = json.dumps([inspect_shell.shell_sha256(shell_path),
+                            [str(x) for x in run_settings],
+                            file_system_helpers.file_sha256(testcase),
+                            create_collector.get_sigcache_version(collector)])
+    return (Path(shell_path).with_suffix(shell_cache.RESULT_CACHE_SUFFIX) /
+            f'{hashlib.sha256(cache_key.encode("utf-8")).hexdigest()}.json')
+
+
+def read_cached_level(cache_path):
+    """Read the level of a testcase stored by write_cached_level, unless the NO_RESULT_CACHE environment variable is
+    set, e.g. by autobisectjs when it repeats runs to catch intermittent failures.
+
+    Args:
+        cache_path (Path): Full path to the cache file, from result_cache_path
+
+    Returns:
+        int: Cached level, or None if there is none
+    """
+    if os.getenv("NO_RESULT_CACHE"):
+        return None
+    cached = file_system_helpers.read_json(cache_path)
+    if isinstance(cached, dict) and isinstance(cached.get("lev"), int):
+        try:
+            os.utime(str(cache_path))  # Results in use are not pruned, see shell_cache.prune_result_caches
+        except OSError:
+            pass
+        print(f"Reusing the cached result for this testcase: {JS_LEVEL_NAMES[cached['lev']]}")
+        return cached["lev"]
+    return None
+
+
+def write_cached_level(cache_path, lev, timing_dependent_runs):
+    """Store the level of a testcase, so that other interestingness checks of the same contents can reuse it.
+
+    Levels are not stored if any run that led to them timed out or ran out of memory, as rerunning may well give
+    another level, nor if the NO_RESULT_CACHE environment variable is set.
+
+    Args:
+        cache_path (Path): Full path to the cache file, from result_cache_path
+        lev (int): Level of the testcase
+        timing_dependent_runs (int): TIMING_DEPENDENT_RUNS["count"] from before the testcase was run
+    """
+    if TIMING_DEPENDENT_RUNS["count"] != timing_dependent_runs or os.getenv("NO_RESULT_CACHE"):
+        return
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+    except OSError:
+        return
+    file_system_helpers.write_json_atomically(cache_path, {"lev": lev})
+
+
 def truncateFile(fn, maxSize):  # pylint: disable=invalid-name,missing-docstring
     if fn.is_file() and fn.stat().st_size > maxSize:
         with io.open(str(fn), "r+", encoding="utf-8", errors="replace") as f:
@@ -363,13 +503,22 @@ def interesting(_args, cwd_prefix):  # pylint: disable=missing-docstring,missing
     # pylint: disable=missing-return-type-doc
     cwd_prefix = Path(cwd_prefix)  # Lithium uses this function and cwd_prefix from Lithium is not a Path
     options = gOptions
-    # options, runthis, logPrefix, in_compare_jit
-    res = ShellResult(options, options.jsengineWithArgs, cwd_prefix, False)
-    out_log = (cwd_prefix.parent / f"{cwd_prefix.stem}-out").with_suffix(".txt")
-    err_log = (cwd_prefix.parent / f"{cwd_prefix.stem}-err").with_suffix(".txt")
-    truncateFile(out_log, 1000000)
-    truncateFile(err_log, 1000000)
-    return res.lev >= gOptions.minimumInterestingLevel
+    cache_path = result_cache_path(
+        options.jsengine,
+        ["js_interesting", options.timeout, options.valgrind] + options.jsengineWithArgs[1:-1],
+        options.jsengineWithArgs[-1], options.collector)
+    lev = read_cached_level(cache_path)
+    if lev is None:
+        timing_dependent_runs = TIMING_DEPENDENT_RUNS["count"]
+        # options, runthis, logPrefix, in_compare_jit
+        res = ShellResult(options, options.jsengineWithArgs, cwd_prefix, False, in_memory=True)
+        out_log = (cwd_prefix.parent / f"{cwd_prefix.stem}-out").with_suffix(".txt")
+        err_log = (cwd_prefix.parent / f"{cwd_prefix.stem}-err").with_suffix(".txt")
+        truncateFile(out_log, 1000000)
+        truncateFile(err_log, 1000000)
+        lev = res.lev
+        write_cached_level(cache_path, lev, timing_dependent_runs)
+    return lev >= gOptions.minimumInterestingLevel
 
 
 # For direct, manual use
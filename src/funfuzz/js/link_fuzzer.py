@@ -7,8 +7,34 @@
 """Concatenate js files to create jsfunfuzz.
 """
 
+import hashlib
 import io
+import os
 from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from ..util import file_manipulation
+from ..util import file_system_helpers
+from ..util import sm_compile_helpers
+
+LINKED_FUZZER_MAX_AGE = 3 * 24 * 60 * 60  # Unused linked fuzzers are removed from the cache after 3 days
+# Linked fuzzers in use are refreshed at most this often, as refreshing changes the mtime of every hard link too
+LINKED_FUZZER_REFRESH_AGE = 24 * 60 * 60
+LINKED_FUZZER_TEMP_MAX_AGE = 60 * 60  # Temporary files left by interrupted links are removed after an hour
+
+
+def files_to_link():
+    """Return the files that make up jsfunfuzz, in the order they are linked.
+
+    Returns:
+        list: Full paths to the files listed in files_to_link.txt
+    """
+    base_dir = Path(__file__).parent
+    return [base_dir / Path(entry.rstrip())
+            for entry in (base_dir / "files_to_link.txt").read_text().split()
+            if entry.rstrip() and not entry.startswith("#")]
 
 
 def link_fuzzer(target_path, prologue=""):
@@ -18,16 +44,78 @@ def link_fuzzer(target_path, prologue=""):
         target_path (Path): Target file with full path, to be created
         prologue (str): Contents to be prepended to the target file
     """
-    base_dir = Path(__file__).parent
-
     with io.open(str(target_path), "w", encoding="utf-8", errors="replace") as f:  # Create the full jsfunfuzz file
         if prologue:
             f.write(prologue)
 
-        for entry in (base_dir / "files_to_link.txt").read_text().split():
-            entry = entry.rstrip()
-            if entry and not entry.startswith("#"):
-                file_path = base_dir / Path(entry)
-                file_name = f'\n\n// {str(file_path).split("funfuzz", 1)[1][1:]}\n\n'
-                f.write(file_name)
-                f.write(file_path.read_text())
+        for file_path in files_to_link():
+            file_name = f'\n\n// {str(file_path).split("funfuzz", 1)[1][1:]}\n\n'
+            f.write(file_name)
+            f.write(file_path.read_text())
+
+
+def link_cached_fuzzer(target_path, prologue=""):
+    """Create the full jsfunfuzz file from a cache shared by all workers, linking it only if it is not there yet.
+
+    The cache is keyed by the contents of the linked files and the prologue. The SPLICE halves used to build
+    testcases are stored alongside, so that file_manipulation.fuzzSplice does not have to split the file again.
+
+    Args:
+        target_path (Path): Target file with full path, to be created
+        prologue (str): Contents to be prepended to the target file
+    """
+    linked_hash = hashlib.sha256(prologue.encode("utf-8", errors="replace"))
+    for file_path in files_to_link():
+        linked_hash.update(file_path.read_bytes())
+    cache_dir = sm_compile_helpers.ensure_cache_dir(Path.home()) / "jsfunfuzz"
+    cache_dir.mkdir(exist_ok=True)
+    cached_fuzzer = cache_dir / f"jsfunfuzz-{linked_hash.hexdigest()}.js"
+    cached_splice = cached_fuzzer.with_suffix(".splice.json")
+
+    if not cached_fuzzer.is_file():
+        with tempfile.NamedTemporaryFile(dir=str(cache_dir), suffix=".tmp", delete=False) as f:
+            temp_fuzzer = Path(f.name)
+        link_fuzzer(temp_fuzzer, prologue)
+        file_system_helpers.write_json_atomically(cached_splice, file_manipulation.fuzzSplice(temp_fuzzer))
+        os.replace(str(temp_fuzzer), str(cached_fuzzer))
+        remove_stale_fuzzers(cache_dir)
+    elif time.time() - cached_fuzzer.stat().st_mtime > LINKED_FUZZER_REFRESH_AGE:
+        # Keep the fuzzer in use from being removed as stale
+        for cached_file in (cached_fuzzer, cached_splice):
+            try:
+                os.utime(str(cached_file))
+            except OSError:
+                pass
+
+    try:
+        os.link(str(cached_fuzzer), str(target_path))
+    except OSError:
+        shutil.copyfile(str(cached_fuzzer), str(target_path))
+
+    splice = file_system_helpers.read_json(cached_splice)
+    if splice:
+        target_stat = target_path.stat()
+        file_manipulation.FUZZ_SPLICES[(str(target_path), target_stat.st_size, target_stat.st_mtime_ns)] = splice
+
+
+def remove_stale_fuzzers(cache_dir):
+    """Remove linked fuzzers that have not been refreshed for a while, along with their SPLICE halves, and temporary
+    files left behind by interrupted links.
+
+    Workers hold hard links or copies of the files they use, so removing them from the cache is safe.
+
+    Args:
+        cache_dir (Path): Directory holding the cached linked fuzzers
+    """
+    for stale_file in cache_dir.iterdir():
+        if stale_file.suffix == ".tmp":
+            max_age = LINKED_FUZZER_TEMP_MAX_AGE
+        elif stale_file.name.startswith("jsfunfuzz-"):
+            max_age = LINKED_FUZZER_MAX_AGE
+        else:
+            continue
+        try:
+            if time.time() - stale_file.stat().st_mtime > max_age:
+                stale_file.unlink()
+        except OSError:
+            pass
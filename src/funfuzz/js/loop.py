@@ -20,16 +20,21 @@ from textwrap import dedent
 import time
 import zipfile
 
+import fasteners
+
 from . import compare_jit
 from . import js_interesting
 from . import link_fuzzer
+from . import reduction_queue
 from . import shell_flags
 from . import with_binaryen
 from ..util import create_collector
 from ..util import file_manipulation
 from ..util import file_system_helpers
-from ..util import lithium_helpers
+from ..util import fork_join
+from ..util import hg_helpers
 from ..util import os_ops
+from ..util import sm_compile_helpers
 
 
 LOG = logging.getLogger("funfuzz")
@@ -41,9 +46,14 @@ def parseOpts(args):  # pylint: disable=invalid-name,missing-docstring,missing-r
                         action="store_true", dest="use_compare_jit",
                         help="After running the fuzzer, run the FCM lines against the engine "
                              "in two configurations and compare the output.")
+    parser.add_argument("--compare-jit-jobs", type=int, default=1,
+                        help="Number of flag combinations compare_jit runs at the same time (default: 1)")
     parser.add_argument("--random-flags",
                         action="store_true", dest="randomFlags",
                         help="Pass a random set of flags (e.g. --ion-eager) to the js engine")
+    parser.add_argument("--reduction-queue", type=Path,
+                        help="Queue interesting testcases in this directory for reducer processes, "
+                             "instead of reducing them right away")
     parser.add_argument("--repo", type=Path, default=Path.home() / "trees" / "mozilla-central",
                         help="The hg repository (e.g. ~/trees/mozilla-central/), for bisection")
     # if you run loop directly w/o --build, lithium_helpers.pinpoint will try to guess
@@ -104,22 +114,117 @@ def makeRegressionTestPrologue(repo):  # pylint: disable=invalid-name,missing-pa
     """)
 
 
+REGRESSION_TEST_ROOTS = [
+    Path("js") / "src" / "jit-test" / "tests",
+    Path("js") / "src" / "tests",
+    Path("testing") / "web-platform" / "tests" / "streams",
+]
+
+
+def get_regression_test_index_path(repo):
+    """Return the path of the regression test index shared by all workers fuzzing with a repository.
+
+    Args:
+        repo (Path): Full path to the repository
+
+    Returns:
+        Path: Full path to the index file in the shell-cache directory
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / f"regression-tests-{repo.name}.json"
+
+
 def inTreeRegressionTests(repo):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
     # pylint: disable=missing-return-type-doc
-    jit_tests = jsFilesIn(len(str(repo)), repo / "js" / "src" / "jit-test" / "tests")
-    js_tests = jsFilesIn(len(str(repo)), repo / "js" / "src" / "tests")
-    non262_tests = jsFilesIn(len(str(repo)), repo / "js" / "src" / "tests" / "non262")
-    test262_tests = jsFilesIn(len(str(repo)), repo / "js" / "src" / "tests" / "test262")
-    streams_tests = jsFilesIn(len(str(repo)), repo / "testing" / "web-platform" / "tests" / "streams")
-    return jit_tests + js_tests + non262_tests + test262_tests + streams_tests
+    tests = regression_test_index(repo)
+    js_tests = tests[str(Path("js") / "src" / "tests")]
+    # non262 and test262 live inside js/src/tests, so pick them out of its listing instead of walking them again
+    non262_tests = [x for x in js_tests if x.startswith(str(Path("js") / "src" / "tests" / "non262") + os.sep)]
+    test262_tests = [x for x in js_tests if x.startswith(str(Path("js") / "src" / "tests" / "test262") + os.sep)]
+    return (tests[str(Path("js") / "src" / "jit-test" / "tests")] + js_tests + non262_tests + test262_tests +
+            tests[str(Path("testing") / "web-platform" / "tests" / "streams")])
 
 
-def jsFilesIn(repoPathLength, root):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
-    # pylint: disable=missing-return-type-doc
-    return [os.path.join(path, filename)[repoPathLength + 1:]
-            for path, _dirs, files in os.walk(str(root))
-            for filename in files
-            if filename.endswith(".js")]
+def regression_test_index(repo):
+    """Retrieve the lists of regression tests in a repository, keyed by the revision of its working directory.
+
+    The index is shared on disk, so only the first worker to see a new revision walks the tree, and it only
+    re-lists directories that changed since the previous index was built.
+
+    Args:
+        repo (Path): Full path to the repository
+
+    Returns:
+        dict: Relative paths to the .js files within each of REGRESSION_TEST_ROOTS, keyed by the root
+    """
+    try:
+        revision = hg_helpers.get_working_dir_revision(repo)
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        # Not a Mercurial repository, so there is nothing to key the index by
+        return {str(root): jsFilesIn(repo, root, {}, {}) for root in REGRESSION_TEST_ROOTS}
+
+    index_path = get_regression_test_index_path(repo)
+    index = file_system_helpers.read_json(index_path) or {}
+    if index.get("repo") == str(repo) and index.get("revision") == revision:
+        return index["tests"]
+
+    with fasteners.InterProcessLock(str(index_path.with_suffix(".lock"))):
+        # Another worker may have finished building the index while we were waiting for the lock
+        index = file_system_helpers.read_json(index_path) or {}
+        if index.get("repo") == str(repo) and index.get("revision") == revision:
+            return index["tests"]
+
+        old_dirs = index.get("dirs", {}) if index.get("repo") == str(repo) else {}
+        new_dirs = {}
+        tests = {str(root): jsFilesIn(repo, root, old_dirs, new_dirs) for root in REGRESSION_TEST_ROOTS}
+        file_system_helpers.write_json_atomically(index_path, {
+            "repo": str(repo),
+            "revision": revision,
+            "dirs": new_dirs,
+            "tests": tests,
+        })
+    return tests
+
+
+def jsFilesIn(repo, root, old_dirs, new_dirs):  # pylint: disable=invalid-name
+    """Find the .js files within a directory, in the same order as os.walk would.
+
+    Args:
+        repo (Path): Full path to the repository
+        root (Path): Directory relative to the repository
+        old_dirs (dict): Listings from a previous walk, reused for directories whose mtime has not changed
+        new_dirs (dict): Listings from this walk, keyed by the directory relative to the repository
+
+    Returns:
+        list: Paths to the .js files, relative to the repository
+    """
+    js_files = []
+    try:
+        dir_mtime = (repo / root).stat().st_mtime_ns
+    except OSError:
+        return js_files
+
+    listing = old_dirs.get(str(root))
+    if not listing or listing[0] != dir_mtime:
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(str(repo / root)) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        # os.walk does not descend into symlinked directories either
+                        if not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    elif entry.name.endswith(".js"):
+                        files.append(entry.name)
+        except OSError:
+            return js_files
+        listing = [dir_mtime, files, subdirs]
+    new_dirs[str(root)] = listing
+
+    js_files.extend(str(root / filename) for filename in listing[1])
+    for subdir in listing[2]:
+        js_files.extend(jsFilesIn(repo, root / subdir, old_dirs, new_dirs))
+    return js_files
 
 
 def get_path_prefix(shell):
@@ -179,7 +284,7 @@ def many_timed_runs(target_time, wtmp_dir, args, collector, ccoverage):
 
     fuzzjs = wtmp_dir / "jsfunfuzz.js"
 
-    link_fuzzer.link_fuzzer(fuzzjs, regressionTestPrologue)
+    link_fuzzer.link_cached_fuzzer(fuzzjs, regressionTestPrologue)
     assert fuzzjs.is_file()
 
     env = {}  # default environment will be used
@@ -192,10 +297,21 @@ def many_timed_runs(target_time, wtmp_dir, args, collector, ccoverage):
         LOG.info("collecting coverage with GCOV_PREFIX_STRIP=%s and GCOV_PREFIX=%s",
                  env["GCOV_PREFIX_STRIP"], env["GCOV_PREFIX"])
 
+    spool_dir = None
+    if not ccoverage:
+        # Hand submissions off to a background uploader, so a slow FuzzManager server does not hold up fuzzing
+        spool_dir = create_collector.get_spool_dir()
+        create_collector.start_uploader(collector, spool_dir)
+
     iteration = 0
     while True:
         if target_time and time.time() > startTime + target_time:
             print("Out of time!")
+            if spool_dir:
+                # Whatever does not get uploaded now stays in the spool for the next run
+                create_collector.upload_spool(collector, spool_dir)
+            print(f'CrashInfo objects built: {js_interesting.CRASH_INFO_COUNTS["built"]}, '
+                  f'skipped for runs with nothing suspicious: {js_interesting.CRASH_INFO_COUNTS["skipped"]}')
             fuzzjs.unlink()
             if not os.listdir(str(wtmp_dir)):
                 wtmp_dir.rmdir()
@@ -216,6 +332,7 @@ def many_timed_runs(target_time, wtmp_dir, args, collector, ccoverage):
         js_interesting_opts = js_interesting.parseOptions(js_interesting_args)
 
         iteration += 1
+        fork_join.count_iteration()
         log_prefix = wtmp_dir / f"w{iteration}"
 
         res, out_log = run_to_report(options, js_interesting_opts, env.copy(), log_prefix,
@@ -247,7 +364,8 @@ def many_timed_runs(target_time, wtmp_dir, args, collector, ccoverage):
 
             compare_jit.compare_jit(options.jsEngine, options.engineFlags, cj_testcase,
                                     log_prefix.parent / f"{log_prefix.stem}-cj", options.repo,
-                                    options.build_options_str, target_time, js_interesting_opts, ccoverage)
+                                    options.build_options_str, target_time, js_interesting_opts, ccoverage,
+                                    jobs=options.compare_jit_jobs)
 
             if cj_testcase.is_file():
                 cj_testcase.unlink()
@@ -296,7 +414,11 @@ def run_to_report(options, js_interesting_opts, env, log_prefix, fuzzjs, ccovera
         with io.open(str(reduced_log), "w", encoding="utf-8", errors="replace") as f:
             f.writelines(newfileLines)
 
-        if not ccoverage:
+        signature = res.crashInfo.createShortSignature()
+        if not ccoverage and signature != "No crash detected" and not reduction_queue.register_signature(
+                reduction_queue.get_signature_registry_path(), signature, orig_log):
+            print(f"Not reducing {reduced_log}, the same signature is already being reduced")
+        elif not ccoverage:
             # Run Lithium and autobisectjs (make a reduced testcase and find a regression window)
             interestingpy = "funfuzz.js.js_interesting"
             itest = [interestingpy]
@@ -305,39 +427,25 @@ def run_to_report(options, js_interesting_opts, env, log_prefix, fuzzjs, ccovera
             itest.append(f"--minlevel={res.lev}")
             itest.append(f"--timeout={options.timeout}")
             itest.append(options.knownPath)
-            (lith_result, _lith_details, autobisect_log) = lithium_helpers.pinpoint(
-                itest, log_prefix, options.jsEngine, options.engineFlags, reduced_log, options.repo,
-                options.build_options_str, target_time, res.lev)
-
-            # Upload with final output
-            if lith_result == lithium_helpers.LITH_FINISHED:
-                fargs = js_interesting_opts.jsengineWithArgs[:-1] + [reduced_log]
-                retest_result = js_interesting.ShellResult(js_interesting_opts,
-                                                           fargs,
-                                                           log_prefix.parent / f"{log_prefix.stem}-final",
-                                                           False)
-                if retest_result.lev > js_interesting.JS_FINE:
-                    res = retest_result
-                    quality = 0
-                else:
-                    quality = 6
+            job = {
+                "itest": itest,
+                "js_engine": str(options.jsEngine),
+                "engine_flags": options.engineFlags,
+                "repo": str(options.repo),
+                "build_options_str": options.build_options_str,
+                "target_time": target_time,
+                "lev": res.lev,
+                "signature": signature,
+                "js_interesting_args": ([f"--timeout={js_interesting_opts.timeout}"] +
+                                        (["--valgrind"] if js_interesting_opts.valgrind else []) +
+                                        [js_interesting_opts.knownPath] +
+                                        [str(x) for x in js_interesting_opts.jsengineWithArgs]),
+            }
+            if options.reduction_queue:
+                queued_job = reduction_queue.enqueue(options.reduction_queue, job, reduced_log, res.crashInfo)
+                print(f"Queued {reduced_log} for reduction: {queued_job}")
             else:
-                quality = 10
-
-            print(f"Submitting {reduced_log} (quality={quality}) at {time.asctime()}")
-
-            metadata = {}
-            if autobisect_log:
-                metadata = {"autobisect_log": "".join(autobisect_log)}
-
-            # Create .zip file for uploading to FuzzManager as some testcases can be 8MB+, see https://git.io/fjqxI
-            assert reduced_log.is_file()
-            result_zip = log_prefix.parent / "reduced.zip"
-            with zipfile.ZipFile(result_zip, "w") as f:
-                f.write(reduced_log, reduced_log.name, compress_type=zipfile.ZIP_DEFLATED)
-
-            create_collector.submit_collector(collector, res.crashInfo, str(result_zip), quality, meta_data=metadata)
-            print(f"Submitted {result_zip}")
+                reduction_queue.reduce_and_submit(job, log_prefix, reduced_log, res.crashInfo, collector)
 
     return res, out_log
 
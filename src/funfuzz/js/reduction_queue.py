@@ -0,0 +1,304 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Reduce interesting testcases and submit them to FuzzManager, either right away or via an on-disk queue that is
+served by a separate pool of reducer processes, so that fuzzing processes can keep fuzzing.
+"""
+
+import hashlib
+import itertools
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import time
+import traceback
+import zipfile
+
+import fasteners
+
+from . import js_interesting
+from ..util import create_collector
+from ..util import file_system_helpers
+from ..util import lithium_helpers
+from ..util import sm_compile_helpers
+
+REDUCER_POLL_INTERVAL = 10  # seconds
+# Signatures seen longer ago than this are reduced again, by then the first reduction has made it to FuzzManager
+SIGNATURE_REGISTRY_TTL = 24 * 60 * 60  # seconds
+# Orders the jobs queued by this process within the same microsecond
+JOB_COUNTER = itertools.count()
+
+
+def get_queue_dir():
+    """Return the reduction queue shared by the fuzzing and reducer processes on this machine.
+
+    Returns:
+        Path: Full path to the queue directory
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / "reduction-queue"
+
+
+def get_signature_registry_path():
+    """Return the registry of crash signatures being reduced by the processes on this machine.
+
+    Returns:
+        Path: Full path to the registry file
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / "reduction-signatures.json"
+
+
+def get_kept_testcase_path(registry_path, signature):
+    """Return where the smallest testcase of a crash signature is kept.
+
+    Args:
+        registry_path (Path): Full path to the registry file
+        signature (str): Short crash signature
+
+    Returns:
+        Path: Full path to the kept testcase
+    """
+    return registry_path.with_suffix("") / f'{hashlib.sha256(signature.encode("utf-8")).hexdigest()}.js'
+
+
+def remove_unregistered_testcases(registry_path, registry):
+    """Remove the kept testcases of signatures that are no longer in the registry.
+
+    Args:
+        registry_path (Path): Full path to the registry file
+        registry (dict): Registry entries, keyed by signature
+    """
+    kept_names = {get_kept_testcase_path(registry_path, signature).name for signature in registry}
+    if not registry_path.with_suffix("").is_dir():
+        return
+    for kept_testcase in registry_path.with_suffix("").iterdir():
+        if kept_testcase.name not in kept_names:
+            try:
+                kept_testcase.unlink()
+            except OSError:
+                pass
+
+
+def register_signature(registry_path, signature, testcase):
+    """Record a hit of a crash signature, to find out whether the testcase needs reducing.
+
+    Only the first hit of a signature gets reduced. Later hits are counted, and the smallest of their testcases is kept
+    next to the registry, in case it is of use to whoever looks into the bug, until the signature expires.
+
+    Args:
+        registry_path (Path): Full path to the registry file
+        signature (str): Short crash signature
+        testcase (Path): Unreduced testcase of the hit
+
+    Returns:
+        bool: True if this is the first hit of the signature, which should then be reduced
+    """
+    testcase_size = testcase.stat().st_size
+    kept_testcase = get_kept_testcase_path(registry_path, signature)
+    with fasteners.InterProcessLock(str(registry_path.with_suffix(".lock"))):
+        registry = file_system_helpers.read_json(registry_path) or {}
+        now = time.time()
+        registry = {sig: entry for sig, entry in registry.items()
+                    if now - entry["first_seen"] < SIGNATURE_REGISTRY_TTL}
+        remove_unregistered_testcases(registry_path, registry)
+        entry = registry.get(signature)
+        is_first_hit = entry is None
+        if is_first_hit:
+            entry = registry[signature] = {"first_seen": now, "hits": 0, "smallest_size": None}
+        entry["hits"] += 1
+        if entry["smallest_size"] is None or testcase_size < entry["smallest_size"]:
+            kept_testcase.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(str(testcase), str(kept_testcase))
+            entry["smallest_size"] = testcase_size
+        file_system_helpers.write_json_atomically(registry_path, registry)
+    if not is_first_hit:
+        print(f'Hit {entry["hits"]} of "{signature}", which is already being reduced. '
+              f"Smallest testcase so far: {kept_testcase}")
+    return is_first_hit
+
+
+def unregister_signature(registry_path, signature):
+    """Forget a crash signature whose reduction did not submit anything, so that its next hit gets reduced again.
+
+    Args:
+        registry_path (Path): Full path to the registry file
+        signature (str): Short crash signature
+    """
+    with fasteners.InterProcessLock(str(registry_path.with_suffix(".lock"))):
+        registry = file_system_helpers.read_json(registry_path) or {}
+        if registry.pop(signature, None) is not None:
+            file_system_helpers.write_json_atomically(registry_path, registry)
+        remove_unregistered_testcases(registry_path, registry)
+
+
+def reduce_and_submit(job, log_prefix, testcase, crash_info, collector):
+    """Reduce and submit a testcase with submit_reduced, unregistering its crash signature if that fails.
+
+    Args:
+        job (dict): Details of the run that found the testcase, see loop.run_to_report
+        log_prefix (Path): Prefix of the log files
+        testcase (Path): Testcase to be reduced in place
+        crash_info (object): CrashInfo object of the run that found the testcase
+        collector (object): Collector object for FuzzManager submission
+    """
+    try:
+        submit_reduced(job, log_prefix, testcase, crash_info, collector)
+    except Exception:
+        if job.get("signature"):
+            unregister_signature(get_signature_registry_path(), job["signature"])
+        raise
+
+
+def submit_reduced(job, log_prefix, testcase, crash_info, collector):
+    """Run Lithium and autobisectjs on a testcase, then submit the reduced testcase to FuzzManager.
+
+    Args:
+        job (dict): Details of the run that found the testcase, see loop.run_to_report
+        log_prefix (Path): Prefix of the log files
+        testcase (Path): Testcase to be reduced in place
+        crash_info (object): CrashInfo object of the run that found the testcase
+        collector (object): Collector object for FuzzManager submission
+    """
+    (lith_result, _lith_details, autobisect_log) = lithium_helpers.pinpoint(
+        job["itest"], log_prefix, Path(job["js_engine"]), job["engine_flags"], testcase, Path(job["repo"]),
+        job["build_options_str"], job["target_time"], job["lev"])
+
+    # Upload with final output
+    if lith_result == lithium_helpers.LITH_FINISHED:
+        js_interesting_opts = js_interesting.parseOptions(job["js_interesting_args"][:-1] + [str(testcase)])
+        retest_result = js_interesting.ShellResult(js_interesting_opts,
+                                                   js_interesting_opts.jsengineWithArgs,
+                                                   log_prefix.parent / f"{log_prefix.stem}-final",
+                                                   False)
+        if retest_result.lev > js_interesting.JS_FINE:
+            crash_info = retest_result.crashInfo
+            quality = 0
+        else:
+            quality = 6
+    else:
+        quality = 10
+
+    print(f"Submitting {testcase} (quality={quality}) at {time.asctime()}")
+
+    metadata = {}
+    if autobisect_log:
+        metadata = {"autobisect_log": "".join(autobisect_log)}
+
+    # Create .zip file for uploading to FuzzManager as some testcases can be 8MB+, see https://git.io/fjqxI
+    assert testcase.is_file()
+    result_zip = log_prefix.parent / "reduced.zip"
+    with zipfile.ZipFile(result_zip, "w") as f:
+        f.write(testcase, testcase.name, compress_type=zipfile.ZIP_DEFLATED)
+
+    create_collector.submit_collector(collector, crash_info, str(result_zip), quality, meta_data=metadata)
+    print(f"Submitted {result_zip}")
+
+
+def enqueue(queue_dir, job, testcase, crash_info):
+    """Add a testcase to the reduction queue.
+
+    The job is assembled in a staging directory, then renamed into the pending directory, so reducers never see
+    partially written jobs. Job names start with the time in microseconds, so that sorting them gives the queue order.
+
+    Args:
+        queue_dir (Path): Full path to the queue directory
+        job (dict): Details of the run that found the testcase, see loop.run_to_report
+        testcase (Path): Testcase to be reduced
+        crash_info (object): CrashInfo object of the run that found the testcase
+
+    Returns:
+        Path: Full path to the queued job
+    """
+    (queue_dir / "pending").mkdir(parents=True, exist_ok=True)
+    job_dir = Path(tempfile.mkdtemp(prefix=f"{int(time.time() * 1000000):017d}-{next(JOB_COUNTER):06d}-",
+                                    dir=str(queue_dir)))
+    shutil.copyfile(str(testcase), str(job_dir / testcase.name))
+    file_system_helpers.write_json_atomically(job_dir / "job.json", dict(
+        job, testcase=testcase.name, crash_info=create_collector.serialize_crash_info(crash_info)))
+    queued_job_dir = queue_dir / "pending" / job_dir.name
+    os.replace(str(job_dir), str(queued_job_dir))
+    return queued_job_dir
+
+
+def claim_job(queue_dir):
+    """Take the oldest job from the reduction queue.
+
+    Jobs are claimed by renaming them into the running directory, which only one process can succeed at.
+
+    Args:
+        queue_dir (Path): Full path to the queue directory
+
+    Returns:
+        Path: Full path to the claimed job, or None if the queue is empty
+    """
+    (queue_dir / "running").mkdir(parents=True, exist_ok=True)
+    try:
+        pending = sorted(os.listdir(str(queue_dir / "pending")))
+    except OSError:
+        return None
+    for job_name in pending:
+        try:
+            os.rename(str(queue_dir / "pending" / job_name), str(queue_dir / "running" / job_name))
+        except OSError:
+            continue  # Another reducer got to it first
+        return queue_dir / "running" / job_name
+    return None
+
+
+def requeue_orphaned_jobs(queue_dir):
+    """Move jobs left behind by reducers that did not finish back into the pending directory.
+
+    Only call this when no reducers are running, e.g. before bot starts them.
+
+    Args:
+        queue_dir (Path): Full path to the queue directory
+    """
+    if not (queue_dir / "running").is_dir():
+        return
+    (queue_dir / "pending").mkdir(parents=True, exist_ok=True)
+    for job_name in os.listdir(str(queue_dir / "running")):
+        print(f"Requeueing unfinished reduction job: {job_name}")
+        os.replace(str(queue_dir / "running" / job_name), str(queue_dir / "pending" / job_name))
+
+
+def run_job(job_dir, collector):
+    """Reduce and submit a claimed job, then remove it from the queue, whether or not the reduction succeeded.
+
+    Args:
+        job_dir (Path): Full path to the claimed job
+        collector (object): Collector object for FuzzManager submission
+    """
+    job = file_system_helpers.read_json(job_dir / "job.json")
+    if job is None:
+        print(f"Discarding unreadable reduction job: {job_dir}")
+    else:
+        print(f"Reducing {job_dir} at {time.asctime()}")
+        try:
+            reduce_and_submit(job, job_dir / "w", job_dir / job["testcase"],
+                              create_collector.deserialize_crash_info(job["crash_info"]), collector)
+        except Exception:  # pylint: disable=broad-except
+            # Requeueing the job could fail the same way forever, so drop it. Its signature is no longer registered,
+            # so the next hit gets queued afresh.
+            print(f"Discarding reduction job that failed: {job_dir}")
+            traceback.print_exc()
+    file_system_helpers.rm_tree_incl_readonly_files(job_dir)
+
+
+def run_reducer(queue_dir, collector, target_time):
+    """Serve the reduction queue until the target time is up. A job that is started always runs to completion.
+
+    Args:
+        queue_dir (Path): Full path to the queue directory
+        collector (object): Collector object for FuzzManager submission
+        target_time (int): Target time the harness runs before restarting
+    """
+    start_time = time.time()
+    while time.time() < start_time + target_time:
+        job_dir = claim_job(queue_dir)
+        if job_dir is None:
+            time.sleep(REDUCER_POLL_INTERVAL)
+        else:
+            run_job(job_dir, collector)
@@ -0,0 +1,233 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Keep an index of the shells in the local shell cache, and keep the cache within a disk quota by evicting the least
+recently used shells.
+"""
+
+import os
+from pathlib import Path
+import re
+import shutil
+import time
+
+import fasteners
+
+from ..util import file_system_helpers
+
+SHELL_CACHE_QUOTA = 20 * 1024 ** 3  # bytes, overridden by the SHELL_CACHE_QUOTA_GB environment variable
+# Disk space to leave free besides the quota, so that builds do not run out of space midway, in bytes
+SHELL_CACHE_MIN_FREE_SPACE = 5 * 1024 ** 3
+EVICTION_GRACE_PERIOD = 24 * 60 * 60  # Shells used more recently than this may still be in use elsewhere, in seconds
+# Shells being run are recorded as used this often, well within the grace period, in seconds
+SHELL_IN_USE_REFRESH_INTERVAL = 60 * 60
+LAST_RECORDED_USES = {}  # When this process last recorded the use of shells, keyed by shell directory
+RESULT_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # Cached testcase results not used for this long are pruned, in seconds
+RESULT_CACHE_SUFFIX = ".results"  # Directory of cached testcase results next to each shell, see js_interesting
+SHELL_DIR_RE = re.compile(r"^(js-.+)-([0-9a-f]{12,40})$")
+
+
+def get_index_path(cache_dir):
+    """Return where the index of a shell cache is stored.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+
+    Returns:
+        Path: Full path to the index file
+    """
+    return cache_dir / "shell-cache-index.json"
+
+
+def get_quota():
+    """Return the disk quota of the shell cache.
+
+    Returns:
+        int: Quota in bytes
+    """
+    if os.getenv("SHELL_CACHE_QUOTA_GB"):
+        return int(float(os.getenv("SHELL_CACHE_QUOTA_GB")) * 1024 ** 3)
+    return SHELL_CACHE_QUOTA
+
+
+def get_dir_size(path):
+    """Return the disk space used by the files in a directory.
+
+    Args:
+        path (Path): Full path to the directory
+
+    Returns:
+        int: Size in bytes
+    """
+    size = 0
+    for root, _dirs, files in os.walk(str(path)):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def measure_shell(cache_dir, shell_name):
+    """Describe a shell cache directory, for its index entry.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        shell_name (str): Name of the shell without extension, which is also the name of its directory
+
+    Returns:
+        dict: Index entry without the time of last use, or None if the directory does not exist
+    """
+    shell_dir = cache_dir / shell_name
+    if not shell_dir.is_dir():
+        return None
+    build_type, rev = SHELL_DIR_RE.match(shell_name).groups()
+    return {
+        "build_type": build_type,
+        "rev": rev,
+        "size": get_dir_size(shell_dir),
+        "busted": (shell_dir / f"{shell_name}.busted").is_file(),
+    }
+
+
+def read_index(cache_dir):
+    """Read the index of a shell cache, indexing the shells already in the cache if there is no index yet.
+
+    Callers should hold the lock of the index.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+
+    Returns:
+        dict: Index entries keyed by shell name
+    """
+    index = file_system_helpers.read_json(get_index_path(cache_dir))
+    if index is None:
+        index = {}
+        for shell_dir in cache_dir.iterdir():
+            if SHELL_DIR_RE.match(shell_dir.name) and shell_dir.is_dir():
+                index[shell_dir.name] = measure_shell(cache_dir, shell_dir.name)
+                index[shell_dir.name]["last_used"] = shell_dir.stat().st_atime
+    return index
+
+
+def record_shell(cache_dir, shell_name, measure=True):
+    """Record the use of a shell in the index, or its removal if its directory no longer exists.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        shell_name (str): Name of the shell without extension
+        measure (bool): Whether the directory may have changed since it was last recorded, and needs measuring again
+    """
+    if not SHELL_DIR_RE.match(shell_name):
+        return
+    # Measure outside of the lock, as walking a directory that still has an objdir can take a while
+    entry = measure_shell(cache_dir, shell_name) if measure else None
+    with fasteners.InterProcessLock(str(get_index_path(cache_dir).with_suffix(".lock"))):
+        index = read_index(cache_dir)
+        if not (cache_dir / shell_name).is_dir():
+            index.pop(shell_name, None)
+        else:
+            if entry is None:
+                entry = index.get(shell_name) or measure_shell(cache_dir, shell_name)
+            entry["last_used"] = time.time()
+            index[shell_name] = entry
+        file_system_helpers.write_json_atomically(get_index_path(cache_dir), index)
+
+
+def record_shell_in_use(shell_path):
+    """Record the use of a shell being run, at most once per SHELL_IN_USE_REFRESH_INTERVAL, so that make_room does not
+    evict shells that fuzzing processes or reducers are still running. Shells outside of a shell cache are ignored.
+
+    Args:
+        shell_path (Path): Full path to the js binary
+    """
+    shell_dir = Path(shell_path).parent
+    now = time.time()
+    if now - LAST_RECORDED_USES.get(shell_dir, 0) < SHELL_IN_USE_REFRESH_INTERVAL:
+        return
+    LAST_RECORDED_USES[shell_dir] = now
+    if SHELL_DIR_RE.match(shell_dir.name) and get_index_path(shell_dir.parent).is_file():
+        record_shell(shell_dir.parent, shell_dir.name, measure=False)
+
+
+def make_room(cache_dir, keep=(), quota=None, min_free_space=SHELL_CACHE_MIN_FREE_SPACE):
+    """Evict the least recently used shells until the cache is within its quota and enough disk space is free.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        keep (iterable): Names of shells not to evict, e.g. the one about to be built
+        quota (int): Disk quota of the shell cache in bytes, defaults to get_quota()
+        min_free_space (int): Disk space to leave free, in bytes
+
+    Returns:
+        list: Names of the evicted shells
+    """
+    quota = get_quota() if quota is None else quota
+    prune_result_caches(cache_dir)
+    evicted = []
+    with fasteners.InterProcessLock(str(get_index_path(cache_dir).with_suffix(".lock"))):
+        index = {name: entry for name, entry in read_index(cache_dir).items() if (cache_dir / name).is_dir()}
+        total_size = sum(entry["size"] for entry in index.values())
+        free_space = shutil.disk_usage(str(cache_dir)).free
+        now = time.time()
+        for name in sorted(index, key=lambda name: index[name]["last_used"]):
+            if total_size <= quota and free_space >= min_free_space:
+                break
+            if name in keep or now - index[name]["last_used"] < EVICTION_GRACE_PERIOD:
+                continue
+            file_system_helpers.rm_tree_incl_readonly_files(cache_dir / name)
+            total_size -= index[name]["size"]
+            free_space += index[name]["size"]
+            del index[name]
+            evicted.append(name)
+        file_system_helpers.write_json_atomically(get_index_path(cache_dir), index)
+    if evicted:
+        print(f"Evicted {len(evicted)} shells from the shell cache, which now takes {total_size // 1024 ** 2} MB")
+    return evicted
+
+
+def prune_result_caches(cache_dir, max_age=RESULT_CACHE_MAX_AGE):
+    """Remove the cached testcase results of the shells in a shell cache that have not been used for a while.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        max_age (int): Age since the last use of a result beyond which it is removed, in seconds
+    """
+    oldest = time.time() - max_age
+    for shell_dir in cache_dir.iterdir():
+        results_dir = shell_dir / f"{shell_dir.name}{RESULT_CACHE_SUFFIX}"
+        if not SHELL_DIR_RE.match(shell_dir.name) or not results_dir.is_dir():
+            continue
+        for entry in os.scandir(str(results_dir)):
+            try:
+                if entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # Removed by another process already
+
+
+def nearest_cached_shells(cache_dir, build_type, cset_index, rev):
+    """Find the cached shells of a build type that are nearest to a revision, e.g. to test those first.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        build_type (str): Shell type, as returned by build_options.computeShellType
+        cset_index (ChangesetIndex): Changeset index of the repository the shells were built from
+        rev (int): Revision number
+
+    Returns:
+        list: Short changeset hashes of the shells that are not busted, nearest revision numbers first
+    """
+    index = file_system_helpers.read_json(get_index_path(cache_dir)) or {}
+    distances = {}
+    for entry in index.values():
+        if entry["build_type"] == build_type and not entry["busted"]:
+            cached_rev = cset_index.rev(entry["rev"])
+            if cached_rev is not None:
+                distances[entry["rev"]] = abs(cached_rev - rev)
+    return sorted(distances, key=distances.get)
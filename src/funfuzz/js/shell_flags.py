@@ -7,8 +7,8 @@
 """Allows detection of support for various command-line flags.
 """
 
-from functools import lru_cache
 import multiprocessing
+from pathlib import Path
 import platform
 import random
 import re
@@ -16,8 +16,137 @@ import re
 from . import inspect_shell
 from .build_options import chance
 
+# Stored next to the .fuzzmanagerconf file of the shell, see get_supported_flags
+SUPPORTED_FLAGS_SUFFIX = ".supportedflags"
+SUPPORTED_FLAGS = {}  # In-process cache, keyed by shell path
+
+# Every flag that is tested with shell_supports_flag in this file, so that one pass can answer all of them
+PROBED_FLAGS = [
+    "--baseline-eager",
+    "--baseline-warmup-threshold=0",
+    "--blinterp",
+    "--blinterp-eager",
+    "--blinterp-warmup-threshold=0",
+    "--cpu-count=1",
+    "--differential-testing",
+    "--fast-warmup",
+    "--fuzzing-safe",
+    "--gc-zeal=1,1",
+    "--ion",
+    "--ion-full-warmup-threshold=0",
+    "--ion-offthread-compile=on",
+    "--ion-optimization-levels=on",
+    "--more-compartments",
+    "--no-blinterp",
+    "--no-cgc",
+    "--no-incremental-gc",
+    "--no-ion",
+    "--no-native-regexp",
+    "--no-off-thread-parse-global",
+    "--no-sse3",
+    "--no-streams",
+    "--no-threads",
+    "--nursery-bigints=on",
+    "--nursery-strings=on",
+    "--scalar-replace-arguments",
+    "--spectre-mitigations=on",
+    "--test-wasm-await-tier2",
+    "--wasm-compiler=none",
+]
+
+
+def help_option_names(shell_path):
+    """Returns the names of the long options listed in the --help output of a shell.
+
+    Args:
+        shell_path (Path): Path to the required shell.
+
+    Returns:
+        set: Long option names, e.g. "--fuzzing-safe", or an empty set if the --help output could not be understood.
+    """
+    out = inspect_shell.testBinary(Path(shell_path), ["--help"], False)[0]
+    names = set(re.findall(r"(?<![\w-])(--[a-z0-9][\w-]*)", out))
+    return names if "--help" in names else set()
+
+
+def probe_flags(shell_path, flags):
+    """Tests flags in batches, launching the shell once if all of them are supported.
+
+    A rejected batch is split in halves until the unsupported flags are found.
+
+    Args:
+        shell_path (Path): Path to the required shell.
+        flags (list): Flags to test.
+
+    Returns:
+        dict: Flags mapped to True if they are supported, False otherwise.
+    """
+    if not flags:
+        return {}
+    try:
+        all_supported = inspect_shell.shellSupports(Path(shell_path), list(flags) + ["-e", "42"])
+    except Exception:  # pylint: disable=broad-except
+        # Some flag combinations may exit unexpectedly, only individual flags are expected to behave
+        if len(flags) == 1:
+            raise
+        all_supported = False
+    if all_supported:
+        return {flag: True for flag in flags}
+    if len(flags) == 1:
+        return {flags[0]: False}
+    result = probe_flags(shell_path, flags[:len(flags) // 2])
+    result.update(probe_flags(shell_path, flags[len(flags) // 2:]))
+    return result
+
+
+def discover_flags(shell_path, flags):
+    """Builds a table of supported flags in one pass, using the --help output of the shell where possible.
+
+    Flags with values, e.g. "--wasm-compiler=none", are additionally probed since only their names are listed.
+    If the --help output cannot be understood, all flags are probed in batches instead.
+
+    Args:
+        shell_path (Path): Path to the required shell.
+        flags (list): Flags to test.
+
+    Returns:
+        dict: Flags mapped to True if they are supported, False otherwise.
+    """
+    option_names = help_option_names(shell_path)
+    if not option_names:
+        return probe_flags(shell_path, flags)
+
+    table = {}
+    flags_with_values = []
+    for flag in flags:
+        if flag.split("=", 1)[0] not in option_names:
+            table[flag] = False
+        elif "=" in flag:
+            flags_with_values.append(flag)
+        else:
+            table[flag] = True
+    table.update(probe_flags(shell_path, flags_with_values))
+    return table
+
+
+def get_supported_flags(shell_path):
+    """Returns the table of supported flags of a shell, which is shared on disk by all processes using the shell.
+
+    Args:
+        shell_path (Path): Path to the required shell.
+
+    Returns:
+        dict: Flags mapped to True if they are supported, False otherwise.
+    """
+    if str(shell_path) not in SUPPORTED_FLAGS:
+        flag_table = inspect_shell.read_shell_cache(shell_path, SUPPORTED_FLAGS_SUFFIX)
+        if flag_table is None:
+            flag_table = discover_flags(shell_path, PROBED_FLAGS)
+            inspect_shell.write_shell_cache(shell_path, SUPPORTED_FLAGS_SUFFIX, flag_table)
+        SUPPORTED_FLAGS[str(shell_path)] = flag_table
+    return SUPPORTED_FLAGS[str(shell_path)]
+
 
-@lru_cache(maxsize=None)
 def shell_supports_flag(shell_path, flag):
     """Returns whether a particular flag is supported by a shell.
 
@@ -28,8 +157,11 @@ def shell_supports_flag(shell_path, flag):
     Returns:
         bool: True if the flag is supported, i.e. does not cause the shell to throw an error, False otherwise.
     """
-    out = inspect_shell.shellSupports(shell_path, [flag, "-e", "42"])
-    return out
+    flag_table = get_supported_flags(shell_path)
+    if flag not in flag_table:
+        flag_table.update(probe_flags(shell_path, [flag]))
+        inspect_shell.write_shell_cache(shell_path, SUPPORTED_FLAGS_SUFFIX, flag_table)
+    return flag_table[flag]
 
 
 def add_random_arch_flags(shell_path, input_list=False):
@@ -0,0 +1,154 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Run a process with a timeout like Lithium's timed_run, but capture its output in memory instead of log files.
+"""
+
+from collections import deque
+import os
+import subprocess
+import threading
+import time
+
+import lithium.interestingness.timed_run as timedrun
+
+CAPTURE_HEAD_BYTES = 4 * 1024 * 1024
+CAPTURE_TAIL_BYTES = 4 * 1024 * 1024
+STOP_POLL_INTERVAL = 0.1  # seconds
+
+
+class BoundedCapture:
+    """Keep the start and the end of a stream in memory, dropping the middle once the stream outgrows the limits.
+
+    Args:
+        head_limit (int): Number of bytes to keep from the start of the stream
+        tail_limit (int): Number of bytes to keep from the end of the stream
+    """
+
+    def __init__(self, head_limit=CAPTURE_HEAD_BYTES, tail_limit=CAPTURE_TAIL_BYTES):
+        self.head_limit = head_limit
+        self.tail_limit = tail_limit
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.dropped = 0
+
+    def feed(self, data):
+        """Add data read from the stream.
+
+        Args:
+            data (bytes): Data read from the stream
+        """
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        while self.tail_size > self.tail_limit:
+            excess = self.tail_size - self.tail_limit
+            if len(self.tail[0]) <= excess:
+                excess = len(self.tail.popleft())
+            else:
+                self.tail[0] = self.tail[0][excess:]
+            self.tail_size -= excess
+            self.dropped += excess
+
+    def drain(self, pipe):
+        """Read a pipe until it is closed.
+
+        Args:
+            pipe (file): Pipe to read from
+        """
+        for data in iter(lambda: os.read(pipe.fileno(), 65536), b""):
+            self.feed(data)
+        pipe.close()
+
+    def getvalue(self):
+        """Return the captured text, noting how much was dropped from the middle, if anything.
+
+        Returns:
+            str: Captured text
+        """
+        dropped_note = f"\n[... {self.dropped} bytes dropped ...]\n".encode("utf-8") if self.dropped else b""
+        return (bytes(self.head) + dropped_note + b"".join(self.tail)).decode("utf-8", errors="replace")
+
+
+def timed_run(cmd_with_args, timeout, env=None, preexec_fn=None, stop_event=None):
+    """Run a command with a timeout, capturing stdout and stderr through pipes into bounded buffers.
+
+    Args:
+        cmd_with_args (list): List of command and parameters to be executed
+        timeout (int): Timeout for the command to be run, in seconds
+        env (dict): Environment for the command to be executed in
+        preexec_fn (function): preexec_fn to be passed to subprocess.Popen
+        stop_event (class): threading.Event which, once set, kills the command as if it timed out
+
+    Returns:
+        class: A Lithium rundata instance, with the captured stdout and stderr text as its out and err
+    """
+    start_time = time.time()
+    child = subprocess.Popen(
+        cmd_with_args,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        close_fds=(os.name == "posix"),  # close_fds should not be changed on Windows
+        env=(env or timedrun.make_env(cmd_with_args[0], os.environ)),
+        preexec_fn=preexec_fn,
+    )
+    captures = [BoundedCapture(), BoundedCapture()]
+    readers = [threading.Thread(target=capture.drain, args=[pipe], daemon=True)
+               for capture, pipe in zip(captures, [child.stdout, child.stderr])]
+    for reader in readers:
+        reader.start()
+
+    killed = False
+    try:
+        if stop_event is None:
+            return_code = child.wait(timeout=timeout)
+        else:
+            # Wake up regularly to see whether the caller wants the run stopped early
+            while not stop_event.is_set():
+                try:
+                    return_code = child.wait(
+                        timeout=min(STOP_POLL_INTERVAL, max(start_time + timeout - time.time(), 0)))
+                    break
+                except subprocess.TimeoutExpired:
+                    if time.time() >= start_time + timeout:
+                        raise
+            else:
+                raise subprocess.TimeoutExpired(cmd_with_args, timeout)
+    except subprocess.TimeoutExpired:
+        timedrun.xpkill(child)
+        killed = True
+        return_code = child.wait()
+    elapsed_time = time.time() - start_time
+    for reader in readers:
+        reader.join()
+
+    # Same classification as Lithium's timed_run
+    if killed and (os.name != "posix" or return_code == -9):
+        msg = "TIMED OUT"
+        sta = timedrun.TIMED_OUT
+    elif return_code == 0:
+        msg = "NORMAL"
+        sta = timedrun.NORMAL
+    elif return_code == timedrun.ASAN_EXIT_CODE:
+        msg = "CRASHED (Address Sanitizer fault)"
+        sta = timedrun.CRASHED
+    elif 0 < return_code < 0x80000000:
+        msg = f"ABNORMAL exit code {return_code}"
+        sta = timedrun.ABNORMAL
+    else:
+        # The program was terminated by a signal, which usually indicates a crash.
+        signum = -return_code
+        msg = f'CRASHED signal {signum} ({timedrun.get_signal_name(signum, "Unknown signal")})'
+        sta = timedrun.CRASHED
+
+    return timedrun.rundata(sta, return_code, msg, elapsed_time, killed, child.pid,
+                            captures[0].getvalue(), captures[1].getvalue())
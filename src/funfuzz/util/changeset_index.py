@@ -0,0 +1,209 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""An index of the changesets of a Mercurial repository, to answer ancestry questions without starting hg.
+"""
+
+import heapq
+from pathlib import Path
+import re
+
+from . import file_system_helpers
+from . import hg_cmdserver
+from . import sm_compile_helpers
+
+CHANGESET_INDEXES = {}  # Indexes loaded by this process, keyed by repository path
+HG_LOG_TEMPLATE = "{rev} {node} {p1rev} {p2rev} {branch}\n"
+HEX_NODE_RE = re.compile(r"^[0-9a-f]{12}([0-9a-f]{28})?$")
+PARENTS_RE = re.compile(r"^parents\(([0-9a-f]{12}|[0-9a-f]{40})\)$")
+
+
+class ChangesetIndex:
+    """Revision numbers, nodes, parents and branches of all changesets of a repository.
+
+    The index is stored in the shell cache, built with a single `hg log` of the whole repository, and extended with
+    an `hg log` of just the new changesets afterwards.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+    """
+
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.nodes = []  # Full hashes, indexed by revision number
+        self.parents = []  # Revision numbers of the parents of each changeset
+        self.branches = []
+        self.revs_by_short_node = {}
+
+    def get_path(self):
+        """Return where the index of the repository is stored.
+
+        Returns:
+            Path: Full path to the index file
+        """
+        return sm_compile_helpers.ensure_cache_dir(Path.home()) / f"changesets-{self.repo_dir.name}.json"
+
+    def load(self):
+        """Load the index stored in the shell cache, if any."""
+        contents = file_system_helpers.read_json(self.get_path())
+        if contents:
+            self.nodes = contents["nodes"]
+            self.parents = contents["parents"]
+            self.branches = contents["branches"]
+            self.revs_by_short_node = {node[:12]: rev for rev, node in enumerate(self.nodes)}
+
+    def update(self):
+        """Add the changesets that were pulled since the index was last updated, then store the index.
+
+        The index is rebuilt from scratch if its last changeset is no longer in the repository, e.g. after a strip.
+        """
+        first_rev = max(len(self.nodes) - 1, 0)
+        log_lines = hg_cmdserver.run(
+            ["hg", "-R", str(self.repo_dir), "log", "-r", f"{first_rev}:tip", "--template", HG_LOG_TEMPLATE],
+            check=False,
+            timeout=9999,
+            ).stdout.decode("utf-8", errors="replace").splitlines()
+        if self.nodes and (not log_lines or log_lines[0].split(" ")[1] != self.nodes[-1]):
+            self.nodes, self.parents, self.branches, self.revs_by_short_node = [], [], [], {}
+            self.update()
+            return
+        new_lines = log_lines[1:] if self.nodes else log_lines
+        for line in new_lines:
+            rev, node, p1_rev, p2_rev, branch = line.split(" ", 4)
+            assert int(rev) == len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append([int(p) for p in (p1_rev, p2_rev) if int(p) >= 0])
+            self.branches.append(branch)
+            self.revs_by_short_node[node[:12]] = int(rev)
+        if new_lines:
+            file_system_helpers.write_json_atomically(self.get_path(), {
+                "nodes": self.nodes,
+                "parents": self.parents,
+                "branches": self.branches,
+            })
+
+    def rev(self, node):
+        """Return the revision number of a changeset.
+
+        Args:
+            node (str): Short (12 characters) or full hash of the changeset
+
+        Returns:
+            int: Revision number, or None if the changeset is not in the index
+        """
+        rev = self.revs_by_short_node.get(node[:12])
+        if rev is None or not self.nodes[rev].startswith(node):
+            return None
+        return rev
+
+    def is_ancestor(self, a_rev, b_rev):
+        """Return whether a changeset is an ancestor of another one, or the same changeset.
+
+        Args:
+            a_rev (int): Revision number of the possible ancestor
+            b_rev (int): Revision number of the possible descendant
+
+        Returns:
+            bool: True if a_rev is an ancestor of b_rev
+        """
+        # Parents always have lower revision numbers, so nothing below a_rev needs visiting
+        to_visit = [b_rev]
+        seen = {b_rev}
+        while to_visit:
+            rev = to_visit.pop()
+            if rev == a_rev:
+                return True
+            for parent in self.parents[rev]:
+                if parent >= a_rev and parent not in seen:
+                    seen.add(parent)
+                    to_visit.append(parent)
+        return False
+
+    def common_ancestor(self, a_rev, b_rev):
+        """Return the common ancestor of two changesets with the highest revision number.
+
+        Args:
+            a_rev (int): Revision number of a changeset
+            b_rev (int): Revision number of another changeset
+
+        Returns:
+            int: Revision number of the common ancestor, or None if there is none
+        """
+        # Walk back from both changesets in decreasing revision order. The first changeset reached from both sides
+        # has no common ancestor with a higher revision number, as that would have been reached first.
+        reached_from = {b_rev: {"b"}}
+        reached_from[a_rev] = reached_from.get(a_rev, set()) | {"a"}
+        to_visit = [-rev for rev in reached_from]
+        while to_visit:
+            rev = -heapq.heappop(to_visit)
+            if reached_from[rev] == {"a", "b"}:
+                return rev
+            for parent in self.parents[rev]:
+                if parent not in reached_from:
+                    reached_from[parent] = set()
+                    heapq.heappush(to_visit, -parent)
+                reached_from[parent] |= reached_from[rev]
+        return None
+
+    def resolve(self, spec):
+        """Resolve a changeset hash, or the parents() of one if it is not a merge, to its revision number.
+
+        Args:
+            spec (str): Changeset hash, or parents(<hash>)
+
+        Returns:
+            int: Revision number, or None if the changeset is not in the index
+
+        Raises:
+            ValueError: If the index cannot tell, e.g. for other revsets, or for the parents of a merge
+        """
+        parents_match = PARENTS_RE.match(spec)
+        if parents_match:
+            rev = self.rev(parents_match.group(1))
+            if rev is not None and len(self.parents[rev]) != 1:
+                raise ValueError(f"{spec} is not a single changeset")
+            return None if rev is None else self.parents[rev][0]
+        if HEX_NODE_RE.match(spec):
+            return self.rev(spec)
+        raise ValueError(f"{spec} is not supported by the changeset index")
+
+
+def get_index(repo_dir):
+    """Return the changeset index of a repository, loading it the first time it is asked for in this process.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+
+    Returns:
+        ChangesetIndex: Changeset index of the repository
+    """
+    repo_dir = Path(repo_dir)
+    if repo_dir not in CHANGESET_INDEXES:
+        index = ChangesetIndex(repo_dir)
+        index.load()
+        CHANGESET_INDEXES[repo_dir] = index
+    return CHANGESET_INDEXES[repo_dir]
+
+
+def resolve_revs(repo_dir, *specs):
+    """Resolve changesets to their revision numbers using the index, updating it once if any of them is missing.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        *specs (str): Changeset hashes, or parents(<hash>)
+
+    Returns:
+        list: Revision numbers, with None for changesets not in the repository, or None if the index cannot tell
+    """
+    index = get_index(repo_dir)
+    try:
+        revs = [index.resolve(spec) for spec in specs]
+        if None in revs:
+            index.update()
+            revs = [index.resolve(spec) for spec in specs]
+    except ValueError:
+        return None
+    return revs
@@ -11,11 +11,12 @@ Not merged into Lithium as it still relies on grab_crash_log.
 """
 
 import argparse
+import io
 import logging
 from pathlib import Path
+import re
 
 import lithium.interestingness.timed_run as timedrun
-from lithium.interestingness.utils import file_contains
 
 from . import os_ops
 
@@ -54,7 +55,14 @@ def interesting(cli_args, temp_prefix):
     if runinfo.sta == timedrun.CRASHED:
         if crash_log.resolve().is_file():
             # When using this script, remember to escape characters, e.g. "\(" instead of "(" !
-            if file_contains(str(crash_log), args.sig.encode("utf-8"), args.regex)[0]:
+            # Search the whole crash log, so that regular expressions may span several lines
+            with io.open(str(crash_log), "r", encoding="utf-8", errors="replace") as f:
+                crash_log_text = f.read()
+            if args.regex:
+                sig_found = re.search(args.sig, crash_log_text, re.MULTILINE) is not None
+            else:
+                sig_found = args.sig in crash_log_text
+            if sig_found:
                 log.info("Exit status: %s%s", runinfo.msg, time_str)
                 return True
             log.info("[Uninteresting] It crashed somewhere else!%s", time_str)
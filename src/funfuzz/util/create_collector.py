@@ -7,10 +7,160 @@
 """Functions here make use of a Collector created from FuzzManager.
 """
 
+import hashlib
+import json
+import os
 from pathlib import Path
+import shutil
+import tempfile
+import threading
 from time import sleep
+from time import strftime
 
 from Collector.Collector import Collector
+from FTB.ProgramConfiguration import ProgramConfiguration
+import FTB.Signatures.CrashInfo as Crash_Info
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.Symptom import OutputSymptom
+
+from . import file_system_helpers
+from . import sm_compile_helpers
+
+NO_CRASH_SIGNATURE = "No crash detected"  # Short signature of e.g. compare_jit mismatches, which say nothing of the bug
+SIGNATURE_INDEXES = {}  # Signature indexes of this process, keyed by signature cache directory
+SPOOL_DIR = None  # Set by start_uploader, after which submit_collector spools submissions instead of uploading them
+UPLOAD_BACKOFF_MAX = 30 * 60  # seconds
+UPLOAD_INTERVAL = 10  # seconds
+
+
+class SignatureIndex:
+    """Signatures of a FuzzManager signature cache directory, parsed once and kept in memory.
+
+    Each signature comes with the literal strings its output symptoms require, so that most signatures can be ruled
+    out with a substring check, before FuzzManager matches the rest of the signature.
+
+    Args:
+        sigcache_dir (str): Signature cache directory
+    """
+
+    def __init__(self, sigcache_dir):
+        self.sigcache_dir = sigcache_dir
+        self.dir_mtime_ns = None
+        self.entries = {}  # Keyed by signature file name
+
+    def refresh(self):
+        """Reload the signatures that were added or changed since the last refresh, and drop removed ones.
+
+        The directory itself is only listed when its modification time changes, which FuzzManager's refresh and
+        download of signatures always cause.
+        """
+        try:
+            dir_mtime_ns = os.stat(self.sigcache_dir).st_mtime_ns
+        except OSError:
+            self.entries = {}
+            return
+        if dir_mtime_ns == self.dir_mtime_ns:
+            return
+        self.dir_mtime_ns = dir_mtime_ns
+
+        entries = {}
+        for dir_entry in os.scandir(self.sigcache_dir):
+            if not dir_entry.name.endswith(".signature") or not dir_entry.is_file():
+                continue
+            metadata_file = dir_entry.path.replace(".signature", ".metadata")
+            try:
+                metadata_mtime_ns = os.stat(metadata_file).st_mtime_ns
+            except OSError:
+                metadata_mtime_ns = None
+            signature_stat = dir_entry.stat()
+            version = (signature_stat.st_mtime_ns, signature_stat.st_size, metadata_mtime_ns)
+            old_entry = self.entries.get(dir_entry.name)
+            if old_entry and old_entry["version"] == version:
+                entries[dir_entry.name] = old_entry
+                continue
+            try:
+                signature = CrashSignature.fromFile(dir_entry.path)
+                metadata = None
+                if metadata_mtime_ns is not None:
+                    with open(metadata_file) as f:
+                        metadata = json.load(f)
+            except (OSError, RuntimeError, ValueError):
+                continue  # Being rewritten by FuzzManager, the next refresh picks it up
+            entries[dir_entry.name] = {
+                "version": version,
+                "signature": signature,
+                "metadata": metadata,
+                "keywords": required_keywords(signature),
+            }
+        self.entries = entries
+
+    def search(self, crash_info):
+        """Search the signatures for one matching a crash, like Collector.search does on disk.
+
+        Args:
+            crash_info (object): CrashInfo object
+
+        Returns:
+            tuple: Full path to the matching signature file and its metadata, or (None, None) if nothing matches
+        """
+        self.refresh()
+        outputs = {
+            "stdout": "\n".join(crash_info.rawStdout),
+            "stderr": "\n".join(crash_info.rawStderr),
+            "crashdata": "\n".join(crash_info.rawCrashData),
+        }
+        outputs[None] = "\n".join(outputs.values())
+        for name, entry in self.entries.items():
+            if not all(keyword in outputs[src] for src, keyword in entry["keywords"]):
+                continue
+            if entry["signature"].matches(crash_info):
+                return (os.path.join(self.sigcache_dir, name), entry["metadata"])
+        return (None, None)
+
+
+class IndexedCollector(Collector):
+    """Collector that searches an in-memory index of its signature cache, shared by all collectors of the process."""
+
+    def search(self, crashInfo):  # pylint: disable=invalid-name
+        """Search the signature cache for a signature matching a crash.
+
+        Args:
+            crashInfo (object): CrashInfo object
+
+        Returns:
+            tuple: Full path to the matching signature file and its metadata, or (None, None) if nothing matches
+        """
+        if self.sigCacheDir not in SIGNATURE_INDEXES:
+            SIGNATURE_INDEXES[self.sigCacheDir] = SignatureIndex(self.sigCacheDir)
+        return SIGNATURE_INDEXES[self.sigCacheDir].search(crashInfo)
+
+
+def required_keywords(signature):
+    """Return the literal strings that output must contain for a signature to possibly match.
+
+    Args:
+        signature (object): CrashSignature object
+
+    Returns:
+        list: Tuples of the output source, or None for all output, and the string it must contain
+    """
+    return [(symptom.src, symptom.output.value) for symptom in signature.symptoms
+            if isinstance(symptom, OutputSymptom) and not symptom.output.isPCRE and "\n" not in symptom.output.value]
+
+
+def get_sigcache_version(collector):
+    """Return what changes whenever the signature cache of a collector is refreshed, see SignatureIndex.refresh.
+
+    Args:
+        collector (class): Collector for FuzzManager
+
+    Returns:
+        int: Modification time of the signature cache directory in nanoseconds, or None if there is none
+    """
+    try:
+        return os.stat(collector.sigCacheDir).st_mtime_ns
+    except (OSError, TypeError):
+        return None
 
 
 def make_collector():
@@ -21,7 +171,7 @@ def make_collector():
     """
     sigcache_path = Path.home() / "sigcache"
     sigcache_path.mkdir(exist_ok=True)
-    return Collector(sigCacheDir=str(sigcache_path), tool="jsfunfuzz")
+    return IndexedCollector(sigCacheDir=str(sigcache_path), tool="jsfunfuzz")
 
 
 def printCrashInfo(crashInfo):  # pylint: disable=invalid-name,missing-docstring
@@ -44,6 +194,8 @@ def printMatchingSignature(match):  # pylint: disable=invalid-name,missing-docst
 def submit_collector(collector, crash_info, testcase, quality, meta_data=None):
     """Use exponential backoff for FuzzManager submission. Adapted from https://stackoverflow.com/a/23961254/445241
 
+    Once start_uploader has been called, the submission is spooled for the uploader instead, and this returns at once.
+
     Args:
         collector (class): Collector for FuzzManager
         crash_info (object): Crash info object
@@ -53,6 +205,9 @@ def submit_collector(collector, crash_info, testcase, quality, meta_data=None):
     """
     if meta_data is None:
         meta_data = {}
+    if SPOOL_DIR is not None:
+        spool_submission(SPOOL_DIR, crash_info, testcase, quality, meta_data)
+        return
     sleep_time = 2
     for _ in range(0, 99):
         try:
@@ -63,3 +218,197 @@ def submit_collector(collector, crash_info, testcase, quality, meta_data=None):
             # RuntimeError: Server unexpectedly responded with status code 500: <h1>Server Error (500)</h1>
             sleep(sleep_time)
             sleep_time *= 2  # exponential backoff
+
+
+def serialize_crash_info(crash_info):
+    """Convert a CrashInfo object into something that can be stored as JSON.
+
+    Args:
+        crash_info (object): CrashInfo object
+
+    Returns:
+        dict: Raw crash data and program configuration needed to recreate the CrashInfo object
+    """
+    config = crash_info.configuration
+    return {
+        "product": config.product,
+        "platform": config.platform,
+        "os": config.os,
+        "version": config.version,
+        "env": config.env,
+        "args": config.args,
+        "metadata": config.metadata,
+        "stdout": crash_info.rawStdout,
+        "stderr": crash_info.rawStderr,
+        "crash_data": crash_info.rawCrashData,
+    }
+
+
+def deserialize_crash_info(contents):
+    """Recreate a CrashInfo object stored using serialize_crash_info.
+
+    Args:
+        contents (dict): Output of serialize_crash_info
+
+    Returns:
+        object: CrashInfo object
+    """
+    config = ProgramConfiguration(contents["product"], contents["platform"], contents["os"],
+                                  version=contents["version"], env=contents["env"], args=contents["args"],
+                                  metadata=contents["metadata"])
+    return Crash_Info.CrashInfo.fromRawCrashData(contents["stdout"], contents["stderr"], config,
+                                                 auxCrashData=contents["crash_data"])
+
+
+def get_spool_dir():
+    """Return the submission spool shared by the processes on this machine.
+
+    Returns:
+        Path: Full path to the spool directory
+    """
+    return sm_compile_helpers.ensure_cache_dir(Path.home()) / "submission-spool"
+
+
+def spool_submission(spool_dir, crash_info, testcase, quality, meta_data):
+    """Store a submission on disk for the uploader.
+
+    Like reduction jobs, submissions are assembled in a staging directory, then renamed into the pending directory.
+
+    Args:
+        spool_dir (Path): Full path to the spool directory
+        crash_info (object): Crash info object
+        testcase (str): Path to the testcase to be submitted
+        quality (int): Quality specified as a number when submitting to FuzzManager
+        meta_data (dict): Metadata when submitting testcase
+
+    Returns:
+        Path: Full path to the spooled submission
+    """
+    (spool_dir / "pending").mkdir(parents=True, exist_ok=True)
+    entry_dir = Path(tempfile.mkdtemp(prefix=strftime("%Y%m%d%H%M%S-"), dir=str(spool_dir)))
+    shutil.copyfile(str(testcase), str(entry_dir / Path(testcase).name))
+    file_system_helpers.write_json_atomically(entry_dir / "submission.json", {
+        "testcase": Path(testcase).name,
+        "quality": quality,
+        "meta_data": meta_data,
+        "signature": crash_info.createShortSignature(),
+        "crash_info": serialize_crash_info(crash_info),
+    })
+    spooled_dir = spool_dir / "pending" / entry_dir.name
+    os.replace(str(entry_dir), str(spooled_dir))
+    print(f"Spooled {testcase} (quality={quality}) for submission")
+    return spooled_dir
+
+
+def requeue_orphaned_uploads(spool_dir):
+    """Move submissions left behind by uploaders that did not finish back into the pending directory.
+
+    Only call this when no uploaders are running, e.g. before bot starts fuzzing.
+
+    Args:
+        spool_dir (Path): Full path to the spool directory
+    """
+    if not (spool_dir / "uploading").is_dir():
+        return
+    (spool_dir / "pending").mkdir(parents=True, exist_ok=True)
+    for entry_name in os.listdir(str(spool_dir / "uploading")):
+        os.replace(str(spool_dir / "uploading" / entry_name), str(spool_dir / "pending" / entry_name))
+
+
+def upload_spool(collector, spool_dir):
+    """Upload a batch of all pending submissions, once each.
+
+    Of the submissions in the batch that share a crash signature, only the one with the best (lowest) quality is
+    uploaded. Submissions without a crash signature are only duplicates if their testcases are identical.
+    Submissions that fail to upload go back to the pending directory.
+
+    Args:
+        collector (class): Collector for FuzzManager
+        spool_dir (Path): Full path to the spool directory
+
+    Returns:
+        bool: True if nothing failed to upload
+    """
+    (spool_dir / "uploading").mkdir(parents=True, exist_ok=True)
+    try:
+        pending = sorted(os.listdir(str(spool_dir / "pending")))
+    except OSError:
+        return True
+
+    batch = {}
+    for entry_name in pending:
+        entry_dir = spool_dir / "uploading" / entry_name
+        try:
+            os.rename(str(spool_dir / "pending" / entry_name), str(entry_dir))
+        except OSError:
+            continue  # Another uploader got to it first
+        submission = file_system_helpers.read_json(entry_dir / "submission.json")
+        if submission is None:
+            print(f"Discarding unreadable submission: {entry_name}")
+            file_system_helpers.rm_tree_incl_readonly_files(entry_dir)
+            continue
+        dedupe_key = submission["signature"]
+        if dedupe_key == NO_CRASH_SIGNATURE:
+            dedupe_key += " " + hashlib.sha1((entry_dir / submission["testcase"]).read_bytes()).hexdigest()
+        best = batch.get(dedupe_key)
+        if best and best[1]["quality"] <= submission["quality"]:
+            print(f"Not uploading {entry_name}, it duplicates {best[0].name}")
+            file_system_helpers.rm_tree_incl_readonly_files(entry_dir)
+            continue
+        if best:
+            print(f"Not uploading {best[0].name}, it duplicates {entry_name}")
+            file_system_helpers.rm_tree_incl_readonly_files(best[0])
+        batch[dedupe_key] = (entry_dir, submission)
+
+    all_uploaded = True
+    for entry_dir, submission in batch.values():
+        try:
+            collector.submit(deserialize_crash_info(submission["crash_info"]),
+                             str(entry_dir / submission["testcase"]), submission["quality"],
+                             metaData=submission["meta_data"])
+        except Exception as ex:  # pylint: disable=broad-except
+            # Connection errors, error responses from the server, or anything else the collector raises
+            print(f"Uploading {entry_dir.name} failed, will retry: {ex!r}")
+            os.replace(str(entry_dir), str(spool_dir / "pending" / entry_dir.name))
+            all_uploaded = False
+            continue
+        print(f"Uploaded {submission['testcase']} (quality={submission['quality']}) from {entry_dir.name}")
+        file_system_helpers.rm_tree_incl_readonly_files(entry_dir)
+    return all_uploaded
+
+
+def run_uploader(collector, spool_dir):
+    """Keep uploading spooled submissions, backing off exponentially while uploads fail.
+
+    Args:
+        collector (class): Collector for FuzzManager
+        spool_dir (Path): Full path to the spool directory
+    """
+    backoff = UPLOAD_INTERVAL
+    while True:
+        try:
+            uploaded = upload_spool(collector, spool_dir)
+        except Exception as ex:  # pylint: disable=broad-except
+            # Keep the thread alive whatever the collector raises, as the spool would otherwise grow forever
+            print(f"Uploading the submission spool failed, will retry: {ex!r}")
+            uploaded = False
+        backoff = UPLOAD_INTERVAL if uploaded else min(backoff * 2, UPLOAD_BACKOFF_MAX)
+        sleep(backoff)
+
+
+def start_uploader(collector, spool_dir):
+    """Spool submissions of this process from now on, and upload them from a background thread.
+
+    Args:
+        collector (class): Collector for FuzzManager
+        spool_dir (Path): Full path to the spool directory
+
+    Returns:
+        Thread: The uploader thread, which runs for as long as the process does
+    """
+    global SPOOL_DIR  # pylint: disable=global-statement
+    SPOOL_DIR = spool_dir
+    uploader = threading.Thread(target=run_uploader, args=[collector, spool_dir], name="FuzzManager uploader",
+                                daemon=True)
+    uploader.start()
+    return uploader
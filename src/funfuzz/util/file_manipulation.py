@@ -9,44 +9,32 @@
 
 import io
 
-
-def amiss(log_prefix):  # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
-    """Look for "szone_error" (Tiger), "malloc_error_break" (Leopard), "MallocHelp" (?)
-    which are signs of malloc being unhappy (double free, out-of-memory, etc).
-    """
-    found_something = False
-    err_log = (log_prefix.parent / f"{log_prefix.stem}-err").with_suffix(".txt")
-    with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            line = line.strip("\x07").rstrip("\n")
-            if (line.find("szone_error") != -1 or
-                    line.find("malloc_error_break") != -1 or
-                    line.find("MallocHelp") != -1):
-                print()
-                print(line)
-                found_something = True
-                break  # Don't flood the log with repeated malloc failures
-
-    return found_something
+# SPLICE halves of fuzzer files, keyed by (path, size, mtime_ns), so each worker only splits its fuzzer once
+FUZZ_SPLICES = {}
 
 
 def fuzzSplice(filename):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc,missing-return-type-doc
     # pylint: disable=missing-type-doc
     """Return the lines of a file, minus the ones between the two lines containing SPLICE."""
-    before = []
-    after = []
-    with io.open(str(filename), "r", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            before.append(line)
-            if line.find("SPLICE") != -1:
-                break
-        for line in f:
-            if line.find("SPLICE") != -1:
+    file_stat = filename.stat()
+    splice_key = (str(filename), file_stat.st_size, file_stat.st_mtime_ns)
+    if splice_key not in FUZZ_SPLICES:
+        before = []
+        after = []
+        with io.open(str(filename), "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                before.append(line)
+                if line.find("SPLICE") != -1:
+                    break
+            for line in f:
+                if line.find("SPLICE") != -1:
+                    after.append(line)
+                    break
+            for line in f:
                 after.append(line)
-                break
-        for line in f:
-            after.append(line)
-    return [before, after]
+        FUZZ_SPLICES[splice_key] = [before, after]
+    before, after = FUZZ_SPLICES[splice_key]
+    return [list(before), list(after)]
 
 
 def linesWith(lines, search_for):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
@@ -8,14 +8,18 @@
 """
 
 import errno
+import hashlib
+import io
+import json
 import os.path
 from pathlib import Path
 import platform
 import shutil
 import stat
+import tempfile
 
 
-def delete_logs(log_prefix):  # pylint: disable=too-complex
+def delete_logs(log_prefix):
     """Whoever might call baseLevel should eventually call this function (unless a bug was found).
 
     If this turns up a WindowsError on Windows, remember to have excluded fuzzing locations in
@@ -25,35 +29,81 @@ def delete_logs(log_prefix):  # pylint: disable=too-complex
         log_prefix (Path): Prefix of the log name
     """
     out_log = (log_prefix.parent / f"{log_prefix.stem}-out").with_suffix(".txt")
-    if out_log.is_file():
-        out_log.unlink()
-    if out_log.with_suffix(".binaryen-seed").is_file():
-        out_log.with_suffix(".binaryen-seed").unlink()
-    if out_log.with_suffix(".wasm").is_file():
-        out_log.with_suffix(".wasm").unlink()
-    if out_log.with_suffix(".wrapper").is_file():
-        out_log.with_suffix(".wrapper").unlink()
-    err_log = (log_prefix.parent / f"{log_prefix.stem}-err").with_suffix(".txt")
-    if err_log.is_file():
-        err_log.unlink()
-    wasm_err_log = (log_prefix.parent / f"{log_prefix.stem}-wasm-err").with_suffix(".txt")
-    if wasm_err_log.is_file():
-        wasm_err_log.unlink()
-    wasm_out_log = (log_prefix.parent / f"{log_prefix.stem}-wasm-out").with_suffix(".txt")
-    if wasm_out_log.is_file():
-        wasm_out_log.unlink()
-    wasm_summary_log = (log_prefix.parent / f"{log_prefix.stem}-wasm-summary").with_suffix(".txt")
-    if wasm_summary_log.is_file():
-        wasm_summary_log.unlink()
-    crash_log = (log_prefix.parent / f"{log_prefix.stem}-crash").with_suffix(".txt")
-    if crash_log.is_file():
-        crash_log.unlink()
-    valgrind_xml = (log_prefix.parent / f"{log_prefix.stem}-vg").with_suffix(".xml")
-    if valgrind_xml.is_file():
-        valgrind_xml.unlink()
-    core_gzip = (log_prefix.parent / f"{log_prefix.stem}-core").with_suffix(".gz")
-    if core_gzip.is_file():
-        core_gzip.unlink()
+    for log_file in [
+            out_log,
+            out_log.with_suffix(".binaryen-seed"),
+            out_log.with_suffix(".wasm"),
+            out_log.with_suffix(".wrapper"),
+            (log_prefix.parent / f"{log_prefix.stem}-err").with_suffix(".txt"),
+            (log_prefix.parent / f"{log_prefix.stem}-wasm-err").with_suffix(".txt"),
+            (log_prefix.parent / f"{log_prefix.stem}-wasm-out").with_suffix(".txt"),
+            (log_prefix.parent / f"{log_prefix.stem}-wasm-summary").with_suffix(".txt"),
+            (log_prefix.parent / f"{log_prefix.stem}-crash").with_suffix(".txt"),
+            (log_prefix.parent / f"{log_prefix.stem}-vg").with_suffix(".xml"),
+            (log_prefix.parent / f"{log_prefix.stem}-core").with_suffix(".gz"),
+    ]:
+        # Try removing each file directly, as most of them do not exist, rather than checking for them first
+        try:
+            log_file.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def file_sha256(file_path):
+    """Compute the SHA-256 hash of a file, reading it in chunks so that large binaries do not fill up memory.
+
+    Args:
+        file_path (Path): Full path to the file
+
+    Returns:
+        str: Hexadecimal SHA-256 digest of the file contents
+    """
+    sha = hashlib.sha256()
+    with io.open(str(file_path), "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_json(json_path):
+    """Read a JSON file written by write_json_atomically, treating missing or corrupt files as absent.
+
+    Args:
+        json_path (Path): Full path to the JSON file
+
+    Returns:
+        object: Decoded JSON contents, or None if the file is missing or cannot be decoded
+    """
+    try:
+        with io.open(str(json_path), "r", encoding="utf-8", errors="replace") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomically(json_path, contents):
+    """Write a JSON file such that concurrent readers (e.g. other forkJoin workers) never see a partial file.
+
+    Args:
+        json_path (Path): Full path to the JSON file
+        contents (object): JSON-serializable contents to be written
+
+    Returns:
+        bool: True if the file was written, False if the directory is not writable
+    """
+    json_path = Path(json_path)
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=f"{json_path.name}.", suffix=".tmp", dir=str(json_path.parent))
+    except OSError:
+        return False
+    try:
+        with io.open(fd, "w", encoding="utf-8", errors="replace") as f:
+            json.dump(contents, f)
+        os.replace(tmp_name, str(json_path))
+    except OSError:
+        Path(tmp_name).unlink()
+        return False
+    return True
 
 
 def handle_rm_readonly_files(_func, path, exc):
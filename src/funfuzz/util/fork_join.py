@@ -9,14 +9,45 @@
 
 import io
 import multiprocessing
+import os
 from pathlib import Path
 import sys
+import time
+
+ITERATIONS = None  # Throughput counter of the current worker process, set by redirectOutputAndCallFun
+MEMORY_HEADROOM = 0.9  # Fraction of the memory available to workers that the pool is sized to use
+RESTART_BACKOFF_MAX = 5 * 60  # seconds
+STABLE_RUN_TIME = 10 * 60  # Workers running at least this long before dying restart without backoff, in seconds
+SUPERVISE_INTERVAL = 5  # seconds
+
+
+class WorkerSlot:  # pylint: disable=too-few-public-methods
+    """Keep track of one worker of forkJoin across restarts.
+
+    Args:
+        i (int): Numeric ID of the worker
+    """
+
+    def __init__(self, i):
+        self.i = i
+        self.process = None
+        self.started = 0
+        self.next_start = 0
+        self.backoff = 0
+        self.restarts = 0
+        self.peak_rss = 0
+        self.finished = False
+        self.iterations = multiprocessing.Value("L", 0)
 
 
 # Call |fun| in a bunch of separate processes, then wait for them all to finish.
 # fun is called with someArgs, plus an additional argument with a numeric ID.
 # |fun| must be a top-level function (not a closure) so it can be pickled on Windows.
-def forkJoin(logDir, numProcesses, fun, *someArgs):  # pylint: disable=invalid-name,missing-docstring
+# With a deadline, workers that die with an error are restarted with backoff until the deadline passes.
+# With memory_per_process, no more workers run at the same time than the memory available allows for, going by
+# the larger of memory_per_process and the peak memory use of a worker (including its children) seen so far.
+def forkJoin(logDir, numProcesses, fun, *someArgs, deadline=None, memory_per_process=None):
+    # pylint: disable=invalid-name,missing-docstring,too-complex,too-many-branches
     def showFile(fn):  # pylint: disable=invalid-name
         print(f"==== {fn} ====")
         print()
@@ -25,27 +56,143 @@ def forkJoin(logDir, numProcesses, fun, *someArgs):  # pylint: disable=invalid-n
                 print(line.rstrip())
         print()
 
-    # Fork a bunch of processes
-    print(f"Forking {numProcesses} children...")
-    ps = []  # pylint: disable=invalid-name
-    for i in range(numProcesses):
-        p = multiprocessing.Process(  # pylint: disable=invalid-name
-            target=redirectOutputAndCallFun, args=[logDir, i, fun, someArgs], name=f"Parallel process {i}")
-        p.start()
-        ps.append(p)
-
-    # Wait for them all to finish, and splat their outputs
-    for i in range(numProcesses):
-        p = ps[i]  # pylint: disable=invalid-name
-        print(f"=== Waiting for child #{i} ({p.pid}) to finish... ===")
-        p.join()
-        print(f"=== Child process #{i} exited with code {p.exitcode} ===")
-        print()
-        showFile(log_name(logDir, i, "out"))
-        showFile(log_name(logDir, i, "err"))
+    print(f"Forking up to {numProcesses} children...")
+    slots = [WorkerSlot(i) for i in range(numProcesses)]
+
+    while True:
+        now = time.time()
+        for slot in slots:
+            if slot.process is None or slot.process.is_alive():
+                continue
+            slot.process.join()
+            print(f"=== Child process #{slot.i} exited with code {slot.process.exitcode} "
+                  f"after {slot.iterations.value} iterations ===")
+            if slot.process.exitcode == 0 or deadline is None or now >= deadline:
+                slot.finished = True
+            else:
+                # Restart right away after a long run, otherwise back off in case it dies again straight away
+                slot.backoff = 0 if now - slot.started > STABLE_RUN_TIME else min(
+                    max(slot.backoff * 2, 1), RESTART_BACKOFF_MAX)
+                slot.next_start = now + slot.backoff
+                slot.restarts += 1
+                print(f"=== Restarting child #{slot.i} in {slot.backoff} seconds ===")
+            slot.process = None
+
+        running = [slot for slot in slots if slot.process]
+        tree_rss = process_tree_rss([slot.process.pid for slot in running])
+        for slot in running:
+            slot.peak_rss = max(slot.peak_rss, tree_rss.get(slot.process.pid, 0))
+        pool_size = memory_pool_size(numProcesses, memory_per_process,
+                                     max([slot.peak_rss for slot in slots] + [0]), sum(tree_rss.values()))
+
+        for slot in slots:
+            if len(running) >= pool_size:
+                break
+            if slot.finished or slot.process or slot.next_start > now:
+                continue
+            if deadline is not None and now >= deadline:
+                slot.finished = True
+                continue
+            slot.process = multiprocessing.Process(
+                target=redirectOutputAndCallFun, args=[logDir, slot.i, fun, someArgs, slot.iterations],
+                name=f"Parallel process {slot.i}")
+            slot.process.start()
+            slot.started = now
+            running.append(slot)
+
+        if all(slot.finished for slot in slots):
+            break
+        time.sleep(SUPERVISE_INTERVAL)
+
+    # Splat the outputs of the children
+    for slot in slots:
+        print(f"=== Child #{slot.i}: {slot.iterations.value} iterations, {slot.restarts} restarts, "
+              f"peak memory use {slot.peak_rss // (1024 ** 2)} MB ===")
+        if Path(log_name(logDir, slot.i, "out")).is_file():  # Not every child gets started if memory is short
+            showFile(log_name(logDir, slot.i, "out"))
+            showFile(log_name(logDir, slot.i, "err"))
         print()
 
 
+def count_iteration():
+    """Count one unit of work, e.g. a fuzzing iteration, towards the throughput of the current forkJoin worker."""
+    if ITERATIONS is not None:
+        with ITERATIONS.get_lock():
+            ITERATIONS.value += 1
+
+
+def available_memory():
+    """Return the memory available for starting new processes without swapping, on Linux.
+
+    Returns:
+        int: MemAvailable from /proc/meminfo in bytes, or None if it cannot be read
+    """
+    try:
+        with io.open("/proc/meminfo", "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def process_tree_rss(pids):
+    """Return the resident memory of processes including all their descendants, on Linux.
+
+    Args:
+        pids (list): Process IDs of the roots of the trees
+
+    Returns:
+        dict: Resident memory in bytes of each tree, keyed by the process ID of its root. Empty if /proc is absent.
+    """
+    if not pids or not Path("/proc").is_dir():
+        return {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with io.open(f"/proc/{entry}/stat", "r", encoding="utf-8", errors="replace") as f:
+                # The process name may contain spaces and parentheses, so split after its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue  # The process exited while /proc was being read
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+
+    tree_rss = {}
+    for pid in pids:
+        tree_rss[pid] = 0
+        to_visit = [pid]
+        while to_visit:
+            current = to_visit.pop()
+            tree_rss[pid] += rss.get(current, 0)
+            to_visit.extend(children.get(current, []))
+    return tree_rss
+
+
+def memory_pool_size(max_processes, memory_per_process, peak_rss, workers_rss):
+    """Return how many workers can run at the same time, given the memory available.
+
+    Args:
+        max_processes (int): Upper bound, e.g. the number of cores
+        memory_per_process (int): Expected memory use of a worker in bytes, or None to not size by memory
+        peak_rss (int): Highest memory use of a worker seen so far, in bytes
+        workers_rss (int): Memory currently used by all workers, in bytes
+
+    Returns:
+        int: Number of workers, at least 1
+    """
+    memory_available = available_memory()
+    if not memory_per_process or memory_available is None:
+        return max_processes
+    per_process = max(memory_per_process, peak_rss)
+    return max(1, min(max_processes, int((memory_available + workers_rss) * MEMORY_HEADROOM) // per_process))
+
+
 # Functions used by forkJoin are top-level so they can be "pickled" (required on Windows)
 def log_name(log_dir, i, log_type):
     """Returns the path of the forkjoin log file as a string.
@@ -61,9 +208,13 @@ def log_name(log_dir, i, log_type):
     return str(Path(log_dir) / f"forkjoin-{i}-{log_type}.txt")
 
 
-def redirectOutputAndCallFun(logDir, i, fun, someArgs):  # pylint: disable=invalid-name,missing-docstring
-    sys.stdout = io.open(log_name(logDir, i, "out"), "w", buffering=1)
-    sys.stderr = io.open(log_name(logDir, i, "err"), "w", buffering=1)
+def redirectOutputAndCallFun(logDir, i, fun, someArgs, iterations=None):  # pylint: disable=invalid-name
+    # pylint: disable=missing-docstring
+    global ITERATIONS  # pylint: disable=global-statement
+    ITERATIONS = iterations
+    # Append, so that the output of restarted workers follows that of the ones they replace
+    sys.stdout = io.open(log_name(logDir, i, "out"), "a", buffering=1)
+    sys.stderr = io.open(log_name(logDir, i, "err"), "a", buffering=1)
     fun(*(someArgs + (i,)))
 
 
@@ -0,0 +1,216 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Run hg commands through pooled Mercurial command servers, so that each command does not pay for starting hg.
+
+See https://www.mercurial-scm.org/wiki/CommandServer for the protocol.
+"""
+
+import atexit
+import os
+import struct
+import subprocess
+import threading
+
+DEFAULT_TIMEOUT = 999  # seconds
+IDLE_SERVERS = {}  # Command servers not running a command, keyed by repository path
+POOL_LOCK = threading.Lock()
+
+
+class CommandServer:
+    """An `hg serve --cmdserver pipe` process for a repository.
+
+    Args:
+        repo_dir (str): Full path to the repository
+
+    Raises:
+        OSError: If the command server cannot be started
+    """
+
+    def __init__(self, repo_dir):
+        self.timed_out = False
+        self.process = subprocess.Popen(
+            ["hg", "serve", "--cmdserver", "pipe", "-R", repo_dir, "--config", "ui.interactive=False"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.getcwd())
+        try:
+            channel, hello = self.read_channel()
+        except EOFError:
+            channel, hello = b"", b""
+        if channel != b"o" or b"runcommand" not in hello:
+            self.close()
+            raise OSError(f"Unable to start a Mercurial command server for {repo_dir}")
+
+    def read_exactly(self, size):
+        """Read a number of bytes from the command server.
+
+        Args:
+            size (int): Number of bytes
+
+        Returns:
+            bytes: Data read
+
+        Raises:
+            EOFError: If the command server exited
+        """
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            raise EOFError("The Mercurial command server exited")
+        return data
+
+    def read_channel(self):
+        """Read the next message from the command server.
+
+        Returns:
+            tuple: Channel, and the data sent on it or, for input channels, the number of bytes asked for
+        """
+        header = self.read_exactly(5)
+        channel = header[:1]
+        length = struct.unpack(">I", header[1:])[0]
+        if channel in (b"I", b"L"):
+            return channel, length
+        return channel, self.read_exactly(length)
+
+    def run(self, args, timeout=None):
+        """Run an hg command.
+
+        Args:
+            args (list): Arguments of the command, without "hg"
+            timeout (int): Seconds after which the command server is killed, if the command has not finished
+
+        Returns:
+            tuple: Exit code, stdout and stderr of the command
+
+        Raises:
+            TimeoutExpired: If the command did not finish in time, in which case the command server is gone
+        """
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self.kill)
+            timer.daemon = True
+            timer.start()
+        try:
+            return self.run_command(args)
+        except EOFError:
+            if self.timed_out:
+                raise subprocess.TimeoutExpired(["hg"] + args, timeout)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def run_command(self, args):
+        """Send an hg command to the command server and collect its results.
+
+        Args:
+            args (list): Arguments of the command, without "hg"
+
+        Returns:
+            tuple: Exit code, stdout and stderr of the command
+
+        Raises:
+            OSError: If the command server asks for something this client does not support
+        """
+        data = "\0".join(str(arg) for arg in args).encode("utf-8")
+        self.process.stdin.write(b"runcommand\n" + struct.pack(">I", len(data)) + data)
+        self.process.stdin.flush()
+        out = bytearray()
+        err = bytearray()
+        while True:
+            channel, data = self.read_channel()
+            if channel == b"o":
+                out += data
+            elif channel == b"e":
+                err += data
+            elif channel == b"r":
+                return struct.unpack(">i", data)[0], bytes(out), bytes(err)
+            elif channel in (b"I", b"L"):
+                # Commands are not interactive, so answer any prompt with an empty line, i.e. the default
+                self.process.stdin.write(struct.pack(">I", 0))
+                self.process.stdin.flush()
+            elif channel.isupper():
+                raise OSError(f"The Mercurial command server requires unsupported channel {channel!r}")
+            # Other optional channels, e.g. debug output, are ignored
+
+    def kill(self):
+        """Kill the command server, e.g. when a command hangs on the network or on a lock."""
+        self.timed_out = True
+        self.process.kill()
+
+    def close(self):
+        """Stop the command server."""
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def run(cmd, check=False, stderr_to_stdout=False, timeout=DEFAULT_TIMEOUT):
+    """Run an hg command in a pooled command server of its repository, like subprocess.run with captured output.
+
+    If no command server can be used, the command is run as a separate hg process instead. A command server whose
+    command times out is killed, and replaced by a new one for the next command.
+
+    Args:
+        cmd (list): Command, starting with "hg", "-R", <repository>
+        check (bool): Whether to raise if the command fails
+        stderr_to_stdout (bool): Whether to add stderr to the end of stdout, instead of keeping it apart
+        timeout (int): Timeout of the command in seconds
+
+    Returns:
+        CompletedProcess: Exit code, stdout and stderr of the command
+
+    Raises:
+        TimeoutExpired: If the command did not finish in time
+    """
+    assert cmd[:2] == ["hg", "-R"]
+    repo_dir = str(cmd[2])
+    args = [str(arg) for arg in cmd[3:]]
+
+    with POOL_LOCK:
+        idle_servers = IDLE_SERVERS.setdefault(repo_dir, [])
+        server = idle_servers.pop() if idle_servers else None
+    result = None
+    try:
+        if server is None:
+            server = CommandServer(repo_dir)
+        result = server.run(args, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        server.close()
+        raise
+    except (OSError, EOFError):
+        if server is not None and server.process.poll() is None:
+            server.close()
+        server = None
+    if server is not None:
+        with POOL_LOCK:
+            idle_servers.append(server)
+
+    if result is None:
+        completed = subprocess.run(["hg", "-R", repo_dir] + args,
+                                   check=False,
+                                   cwd=os.getcwd(),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   timeout=timeout)
+        result = (completed.returncode, completed.stdout, completed.stderr)
+    returncode, out, err = result
+    if stderr_to_stdout:
+        out, err = out + err, None
+    completed = subprocess.CompletedProcess(["hg", "-R", repo_dir] + args, returncode, out, err)
+    if check:
+        completed.check_returncode()
+    return completed
+
+
+@atexit.register
+def close_idle_servers():
+    """Stop the command servers of the pool."""
+    with POOL_LOCK:
+        for idle_servers in IDLE_SERVERS.values():
+            for server in idle_servers:
+                server.close()
+            idle_servers.clear()
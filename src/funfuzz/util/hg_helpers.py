@@ -7,13 +7,18 @@
 """Helper functions involving Mercurial (hg).
 """
 
+import binascii
 import configparser
+import io
 import os
 from pathlib import Path
 import re
+import shutil
 import subprocess
 import sys
 
+from . import changeset_index
+from . import hg_cmdserver
 from . import subprocesses as sps
 
 
@@ -50,24 +55,27 @@ def ensure_mq_enabled():
 
 def findCommonAncestor(repo_dir, a, b):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
     # pylint: disable=missing-return-type-doc
-    return subprocess.run(
+    revs = changeset_index.resolve_revs(repo_dir, a, b)
+    if revs and None not in revs:
+        index = changeset_index.get_index(repo_dir)
+        common_ancestor = index.common_ancestor(*revs)
+        if common_ancestor is not None:
+            return index.nodes[common_ancestor][:12]
+    return hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "log", "-r", f"ancestor({a},{b})", "--template={node|short}"],
-        cwd=os.getcwd(),
         check=True,
-        stdout=subprocess.PIPE,
-        timeout=999,
         ).stdout.decode("utf-8", errors="replace")
 
 
 def isAncestor(repo_dir, a, b):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc
     """Return true iff |a| is an ancestor of |b|. Throw if |a| or |b| does not exist."""
-    return subprocess.run(
+    revs = changeset_index.resolve_revs(repo_dir, a, b)
+    if revs and None not in revs:
+        return changeset_index.get_index(repo_dir).is_ancestor(*revs)
+    return hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "log", "-r", f"{a} and ancestor({a},{b})", "--template={node|short}"],
-        cwd=os.getcwd(),
         check=True,
-        stdout=subprocess.PIPE,
-        timeout=999,
         ).stdout.decode("utf-8", errors="replace") != ""
 
 
@@ -76,17 +84,54 @@ def existsAndIsAncestor(repo_dir, a, b):  # pylint: disable=invalid-name,missing
     """Return true iff |a| exists and is an ancestor of |b|."""
     # Note that if |a| is the same as |b|, it will return True
     # Takes advantage of "id(badhash)" being the empty set, in contrast to just "badhash", which is an error
-    out = subprocess.run(
+    revs = changeset_index.resolve_revs(repo_dir, a, b)
+    if revs:
+        return None not in revs and changeset_index.get_index(repo_dir).is_ancestor(*revs)
+    out = hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "log", "-r", f"{a} and ancestor({a},{b})", "--template={node|short}"],
         check=False,
-        cwd=os.getcwd(),
-        stderr=subprocess.STDOUT,
-        stdout=subprocess.PIPE,
-        timeout=999,
+        stderr_to_stdout=True,
         ).stdout.decode("utf-8", errors="replace")
     return out != "" and out.find("abort: unknown revision") < 0
 
 
+def get_bisect_revs(repo_dir, status="untested"):
+    """Return the changesets of the current bisection of a Mercurial repository that have a given status.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        status (str): Status as understood by the bisect() revset, e.g. "untested" for the changesets left to test
+
+    Returns:
+        list: Short changeset hashes, in revision number order
+    """
+    return hg_cmdserver.run(
+        ["hg", "-R", str(repo_dir), "log", "-r", f'sort(bisect("{status}"), rev)', "--template={node|short}\n"],
+        check=True,
+        ).stdout.decode("utf-8", errors="replace").split()
+
+
+def get_linear_range(repo_dir, first, last):
+    """Return the changesets from one to another, if they form a single line of development, i.e. if none of them
+    after the first is a merge.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        first (str): Hash of the first changeset
+        last (str): Hash of the last changeset, a descendant of the first
+
+    Returns:
+        list: Short changeset hashes, in revision number order, or None if the range contains merges
+    """
+    csets = [line.split(" ") for line in hg_cmdserver.run(
+        ["hg", "-R", str(repo_dir), "log", "-r", f"sort({first}::{last}, rev)", "--template={node|short} {p2rev}\n"],
+        check=True,
+        ).stdout.decode("utf-8", errors="replace").splitlines()]
+    if any(p2_rev != "-1" for _node, p2_rev in csets[1:]):
+        return None
+    return [node for node, _p2_rev in csets]
+
+
 def get_cset_hash_from_bisect_msg(msg):
     """Extract the changeset hash from bisection output.
 
@@ -121,15 +166,17 @@ def get_repo_hash_and_id(repo_dir, repo_rev="parents() and default"):
     Returns:
         tuple: Changeset hash, local numerical ID, boolean on whether the repository is on default tip
     """
+    if changeset_index.HEX_NODE_RE.match(repo_rev):
+        revs = changeset_index.resolve_revs(repo_dir, repo_rev)
+        if revs and revs[0] is not None:
+            return changeset_index.get_index(repo_dir).nodes[revs[0]][:12], str(revs[0]), True
+
     # This returns null if the repository is not on default.
     hg_log_template_cmds = ["hg", "-R", str(repo_dir), "log", "-r", repo_rev,
                             "--template", "{node|short} {rev}"]
-    hg_id_full = subprocess.run(
+    hg_id_full = hg_cmdserver.run(
         hg_log_template_cmds,
-        cwd=os.getcwd(),
         check=True,
-        stdout=subprocess.PIPE,
-        timeout=99,
         ).stdout.decode("utf-8", errors="replace")
     is_on_default = bool(hg_id_full)
     if not is_on_default:
@@ -141,19 +188,16 @@ def get_repo_hash_and_id(repo_dir, repo_rev="parents() and default"):
             print("Aborting...")
             sys.exit(0)
         elif update_default == "d":
-            subprocess.run(["hg", "-R", str(repo_dir), "update", "default"], check=True)
+            hg_cmdserver.run(["hg", "-R", str(repo_dir), "update", "default"], check=True)
             is_on_default = True
         elif update_default == "u":
             hg_log_template_cmds = ["hg", "-R", str(repo_dir), "log", "-r", "parents()", "--template",
                                     "{node|short} {rev}"]
         else:
             raise ValueError("Invalid choice.")
-        hg_id_full = subprocess.run(
+        hg_id_full = hg_cmdserver.run(
             hg_log_template_cmds,
-            cwd=os.getcwd(),
             check=True,
-            stdout=subprocess.PIPE,
-            timeout=99,
             ).stdout.decode("utf-8", errors="replace")
     assert hg_id_full != ""
     (hg_id_hash, hg_id_local_num) = hg_id_full.split(" ")
@@ -161,6 +205,50 @@ def get_repo_hash_and_id(repo_dir, repo_rev="parents() and default"):
     return hg_id_hash, hg_id_local_num, is_on_default
 
 
+def get_working_dir_revision(repo_dir):
+    """Return the full hash of the working directory parent of a Mercurial repository.
+
+    The hash is read straight from the start of .hg/dirstate where possible, so no hg process is launched.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+
+    Returns:
+        str: Full changeset hash of the working directory parent
+    """
+    try:
+        with io.open(str(repo_dir / ".hg" / "dirstate"), "rb") as f:
+            dirstate_parents = f.read(40)
+    except OSError:
+        dirstate_parents = b""
+    # dirstate-v2 files start with a marker instead of the two 20-byte parent nodes, so ask hg instead
+    if len(dirstate_parents) == 40 and not dirstate_parents.startswith(b"dirstate-v2"):
+        return binascii.hexlify(dirstate_parents[:20]).decode("utf-8", errors="replace")
+    return hg_cmdserver.run(
+        ["hg", "-R", str(repo_dir), "log", "-r", ".", "--template={node}"],
+        check=True,
+        ).stdout.decode("utf-8", errors="replace")
+
+
+def ensure_share(repo_dir, share_dir):
+    """Create a working copy sharing the store of a Mercurial repository, unless one exists already.
+
+    The hgrc of the repository is copied over, so that the shared working copy has the same repository name.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        share_dir (Path): Full path to the shared working copy
+    """
+    if (share_dir / ".hg").is_dir():
+        return
+    share_dir.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["hg", "--config", "extensions.share=", "share", "-U", str(repo_dir), str(share_dir)],
+                   check=True,
+                   cwd=os.getcwd(),
+                   timeout=999)
+    shutil.copyfile(str(repo_dir / ".hg" / "hgrc"), str(share_dir / ".hg" / "hgrc"))
+
+
 def hgrc_repo_name(repo_dir):
     """Look in the hgrc file in the .hg directory of the Mercurial repository and return the name.
 
@@ -194,13 +282,10 @@ def patch_hg_repo_with_mq(patch_file, repo_dir=None):
     # We may have passed in the patch with or without the full directory.
     patch_abs_path = patch_file.resolve()
     pname = patch_abs_path.name
-    qimport_result = subprocess.run(
+    qimport_result = hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "qimport", str(patch_abs_path)],
         check=False,
-        cwd=os.getcwd(),
-        stderr=subprocess.STDOUT,
-        stdout=subprocess.PIPE,
-        timeout=99)
+        stderr_to_stdout=True)
     qimport_output, qimport_return_code = (qimport_result.stdout.decode("utf-8", errors="replace"),
                                            qimport_result.returncode)
     if qimport_return_code != 0:
@@ -210,13 +295,10 @@ def patch_hg_repo_with_mq(patch_file, repo_dir=None):
 
     print("Patch qimport'ed...", end=" ")
 
-    qpush_result = subprocess.run(
+    qpush_result = hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "qpush", str(pname)],
-        cwd=os.getcwd(),
         check=True,
-        stderr=subprocess.STDOUT,
-        stdout=subprocess.PIPE,
-        timeout=99)
+        stderr_to_stdout=True)
     qpush_output, qpush_return_code = qpush_result.stdout.decode("utf-8", errors="replace"), qpush_result.returncode
     assert " is empty" not in qpush_output, "Patch to be qpush'ed should not be empty."
 
@@ -224,8 +306,8 @@ def patch_hg_repo_with_mq(patch_file, repo_dir=None):
         qpop_qrm_applied_patch(patch_file, repo_dir)
         print("You may have untracked .rej or .orig files in the repository.")
         print(f"`hg status` output of the repository of interesting files in {repo_dir} :")
-        subprocess.run(["hg", "-R", str(repo_dir), "status", "--modified", "--added",
-                        "--removed", "--deleted"], check=True)
+        print(hg_cmdserver.run(["hg", "-R", str(repo_dir), "status", "--modified", "--added",
+                                "--removed", "--deleted"], check=True).stdout.decode("utf-8", errors="replace"))
         raise OSError(f"Return code from `hg qpush` is: {qpush_return_code}")
 
     print("Patch qpush'ed. Continuing...", end=" ")
@@ -242,18 +324,15 @@ def qpop_qrm_applied_patch(patch_file, repo_dir):
     Raises:
         OSError: Raises when `hg qpop` did not return a return code of 0
     """
-    qpop_result = subprocess.run(
+    qpop_result = hg_cmdserver.run(
         ["hg", "-R", str(repo_dir), "qpop"],
         check=False,
-        cwd=os.getcwd(),
-        stderr=subprocess.STDOUT,
-        stdout=subprocess.PIPE,
-        timeout=99)
+        stderr_to_stdout=True)
     qpop_output, qpop_return_code = qpop_result.stdout.decode("utf-8", errors="replace"), qpop_result.returncode
     if qpop_return_code != 0:
         print(f"`hg qpop` output is: {qpop_output}")
         raise OSError(f"Return code from `hg qpop` is: {qpop_return_code}")
 
     print("Patch qpop'ed...", end=" ")
-    subprocess.run(["hg", "-R", str(repo_dir), "qdelete", str(patch_file.name)], check=True)
+    hg_cmdserver.run(["hg", "-R", str(repo_dir), "qdelete", str(patch_file.name)], check=True)
     print("Patch qdelete'd.")
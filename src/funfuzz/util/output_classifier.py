@@ -0,0 +1,52 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Classify the lines of program output using many patterns in a single pass.
+"""
+
+import re
+
+
+class OutputClassifier:  # pylint: disable=too-few-public-methods
+    """Find the lines matching each of a set of named patterns.
+
+    All patterns are combined into one regular expression, which is searched through the whole output at once. Only
+    the few lines it stops at are then checked against the individual patterns, to tell which of them matched.
+
+    Args:
+        patterns (dict): Regular expressions keyed by name. "^" and "$" match at the start and end of each line.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = {name: re.compile(pattern, re.MULTILINE) for name, pattern in patterns.items()}
+        self.combined = re.compile("|".join(f"(?:{pattern})" for pattern in patterns.values()), re.MULTILINE)
+
+    def classify(self, lines):
+        """Find the lines matching each pattern.
+
+        Args:
+            lines (list): Lines of output, without line endings
+
+        Returns:
+            dict: Matching lines in order, keyed by the name of each pattern that matched at least once
+        """
+        matches = {}
+        text = "\n".join(lines)
+        pos = 0
+        while True:
+            found = self.combined.search(text, pos)
+            if not found:
+                break
+            line_start = text.rfind("\n", 0, found.start()) + 1
+            line_end = text.find("\n", found.start())
+            if line_end == -1:
+                line_end = len(text)
+            line = text[line_start:line_end]
+            for name, pattern in self.patterns.items():
+                if pattern.search(line):
+                    matches.setdefault(name, []).append(line)
+            pos = line_end + 1
+        return matches
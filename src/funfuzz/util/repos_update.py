@@ -18,6 +18,8 @@ import platform
 import subprocess
 import time
 
+from . import changeset_index
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -92,6 +94,9 @@ def updateRepo(repo):  # pylint: disable=invalid-name,missing-param-doc,missing-
         logger.info('"%s" had the above output and took - %s',
                     subprocess.list2cmdline(out_hg_log_default.args),
                     out_hg_log_default.stderr.decode("utf-8", errors="replace").rstrip())
+
+        # Add the changesets just pulled to the index that ancestry questions are answered from
+        changeset_index.get_index(repo).update()
     elif repo_type == "git":
         # Ignore exit codes so the loop can continue retrying up to number of counts.
         gitenv = deepcopy(os.environ)
@@ -60,6 +60,17 @@ class S3Cache:  # pylint: disable=missing-docstring
             return True
         return False
 
+    def list_files(self, prefix):
+        """List the files in the S3 bucket whose names start with a prefix.
+
+        Args:
+            prefix (str): Start of the file names
+
+        Returns:
+            set: Names of the files
+        """
+        return {key.name for key in self.bucket.list(prefix=prefix)}
+
     def compressAndUploadDirTarball(self, directory, tarball_path):  # pylint: disable=invalid-name,missing-param-doc
         # pylint: disable=missing-type-doc
         """Compress a directory into a bz2 tarball and upload it to S3."""
@@ -0,0 +1,314 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the autobisectjs.py file."""
+
+import logging
+from pathlib import Path
+import platform
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from funfuzz.autobisectjs import autobisectjs
+from funfuzz.js import js_interesting
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_pick_bisection_points():
+    """Test that the points picked for parallel bisection split the range into equal parts."""
+    revs = [f"{i:012x}" for i in range(100)]
+    assert autobisectjs.pick_bisection_points(revs, 1) == [revs[50]]
+    assert autobisectjs.pick_bisection_points(revs, 3) == [revs[25], revs[50], revs[75]]
+    assert autobisectjs.pick_bisection_points(revs[:5], 4) == revs[1:5]
+    assert autobisectjs.pick_bisection_points(revs[:3], 4) == revs[:3]
+    # Any range gets as many distinct points as there are builds, as long as it has enough revisions
+    for length in range(8, 40):
+        assert len(set(autobisectjs.pick_bisection_points(revs[:length], 7))) == 7
+
+
+def test_prefer_cached_revs():
+    """Test that bisection points move to the nearest revision with a built shell, if it is close enough."""
+    revs = [f"{i:012x}" for i in range(100)]
+    cached = {revs[44], revs[56], revs[68], revs[90]}
+    # A single point may move by up to a fifth of half the range, to the nearest cached revision, the earlier on ties
+    assert autobisectjs.prefer_cached_revs(revs, [revs[50]], cached.__contains__, 0.2) == [revs[44]]
+    assert autobisectjs.prefer_cached_revs(revs, [revs[50]], cached.__contains__, 0.1) == [revs[50]]
+    # Points stay apart, each moving by up to a fraction of the distance between them
+    assert autobisectjs.prefer_cached_revs(
+        revs, [revs[25], revs[50], revs[75]], cached.__contains__, 0.4) == [revs[25], revs[44], revs[68]]
+    assert autobisectjs.prefer_cached_revs(revs, [revs[50]], cached.__contains__, 0) == [revs[50]]
+
+
+def test_narrow_range():
+    """Test that the range is narrowed down to the last good and first bad revisions, going around skipped ones."""
+    revs = list(range(100))
+    tested = []
+
+    def test(rev):
+        tested.append(rev)
+        if rev in (62, 63):
+            return "skip"
+        return "bad" if rev >= 63 else "good"
+
+    assert autobisectjs.narrow_range(revs, test) == (61, 64)
+    assert len(tested) <= 10
+    assert autobisectjs.narrow_range(revs, lambda rev: "bad") == (None, 0)
+    assert autobisectjs.narrow_range([], test) == (None, None)
+
+
+def test_find_broken_range():
+    """Test that the edges of a compilation bustage are found by binary search."""
+    revs = list(range(100))
+    built = []
+
+    def is_busted(rev):
+        built.append(rev)
+        return 37 <= rev < 52
+
+    assert autobisectjs.find_broken_range(revs, 40, is_busted) == (37, 52)
+    assert len(built) <= 12
+    assert autobisectjs.find_broken_range(revs, 1, lambda rev: rev == 1) == (1, 2)
+
+
+def test_find_linear_broken_range(monkeypatch):
+    """Test that the edges of a compilation bustage are only trusted if no merges lie between them.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+    """
+    revs = [f"{rev:012x}" for rev in range(100)]
+    merges = set()
+
+    def get_linear_range(_repo_dir, first, last):
+        dag_range = revs[revs.index(first):revs.index(last) + 1]
+        return None if merges & set(dag_range[1:]) else dag_range
+
+    monkeypatch.setattr(autobisectjs.hg_helpers, "get_linear_range", get_linear_range)
+    assert autobisectjs.find_linear_broken_range("repo", revs, revs[40], lambda rev: 37 <= int(rev, 16) < 52) == (
+        revs[37], revs[52])
+    merges.add(revs[45])
+    assert autobisectjs.find_linear_broken_range("repo", revs, revs[40], lambda rev: 37 <= int(rev, 16) < 52) is None
+
+
+def test_bisect_together():
+    """Test that testcases share the builds of their common range, and each finds its own first bad revision."""
+    revs = list(range(100))
+    parents = {rev: [rev - 1] if rev else [] for rev in revs}
+    first_bads = {"a.js": 30, "b.js": 34, "c.js": 80}
+    built = []
+
+    def test_rev(rev, names):
+        built.append(rev)
+        if rev == 33:
+            return {name: ("skip", "compilation failed") for name in names}
+        return {name: ("bad" if rev >= first_bads[name] else "good", "") for name in names}
+
+    results = autobisectjs.bisect_together(revs, parents, list(first_bads), test_rev)
+    assert {name: result[:2] for name, result in results.items()} == {
+        "a.js": (30, []), "b.js": (34, [33]), "c.js": (80, [])}
+    assert results["a.js"][2][29] == ("good", "")
+    assert len(built) == len(set(built))
+    assert len(built) < 3 * 7
+
+    # The middle of the range moves to a revision whose shell is already built, if it is close enough
+    built.clear()
+    cached = {47}
+    assert autobisectjs.bisect_together(revs, parents, ["c.js"], test_rev, has_shell=cached.__contains__,
+                                        tolerance=0.2)["c.js"][:2] == (80, [])
+    assert built[0] == 47
+
+    # Revisions skipped along with a compilation bustage are not tested afterwards
+    built.clear()
+    first_bad, suspects, _labels = autobisectjs.bisect_together(revs, parents, ["b.js"], test_rev,
+                                                                skip_range=lambda rev: range(31, 36))["b.js"]
+    assert 33 in suspects and first_bad in range(34, 37)
+    assert not set(built[built.index(33) + 1:]) & set(range(31, 36))
+
+
+def test_bisect_together_merges():
+    """Test that bisecting together follows the DAG rather than revision numbers across merges."""
+    # 0 is the start, 1-4 and 5-8 are two lines of development from it, merged by 9
+    revs = list(range(10))
+    parents = {0: [], 1: [0], 5: [0], 9: [4, 8]}
+    parents.update({rev: [rev - 1] for rev in revs if rev not in parents})
+    first_bads = {"a.js": 6, "b.js": 9}
+
+    def test_rev(rev, names):
+        # a.js broke on the second line, and b.js only when both lines came together
+        bad = {"a.js": rev in (6, 7, 8, 9), "b.js": rev == 9}
+        return {name: ("bad" if bad[name] else "good", "") for name in names}
+
+    results = autobisectjs.bisect_together(revs, parents, list(first_bads), test_rev)
+    assert {name: result[0] for name, result in results.items()} == first_bads
+    assert all(not result[1] for result in results.values())
+
+
+def test_read_batch_file(tmpdir):
+    """Test that each testcase of a batch file gets its own parameters and test, repeated like any other.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    (tmpdir / "testcase.js").write_text("")
+    (tmpdir / "testcases.txt").write_text(f"# Comment\n--fuzzing-safe {tmpdir / 'testcase.js'}\n-e 42\n")
+    options = SimpleNamespace(parameters="-e 42", runtime_params=["-e", "42"], repeat=3)
+    batch = autobisectjs.read_batch_file(options, tmpdir / "testcases.txt")
+    assert list(batch) == [f"--fuzzing-safe {tmpdir / 'testcase.js'}", "-e 42"]
+    assert batch["-e 42"][0].runtime_params == ["-e", "42"]
+    assert all(isinstance(test_and_label, autobisectjs.RepeatedTestAndLabel) for _, test_and_label in batch.values())
+
+
+def test_repeated_test_and_label():
+    """Test that a revision is bad if any run is, that runs stop after a bad one, and that good labels get a
+    confidence once bad revisions have been seen.
+    """
+    runs = []
+
+    def flaky_test_and_label(_shellFilename, hgHash):  # pylint: disable=invalid-name
+        runs.append(hgHash)
+        if hgHash == "bad" and runs.count(hgHash) % 2 == 0:
+            return "bad", "Negative exit code -11"
+        return "good", "Exit code 0"
+
+    test_and_label = autobisectjs.RepeatedTestAndLabel(flaky_test_and_label, 8, 1)
+    assert test_and_label("js", "good") == ("good", "Exit code 0, in all 8 runs")
+    assert test_and_label("js", "bad") == ("bad", "Negative exit code -11, in 1 of 2 runs")
+    assert runs.count("bad") == 2
+    assert test_and_label("js", "good") == (
+        "good", "Exit code 0, in all 8 runs, 100% confidence given that 50% of runs on bad revisions failed")
+
+    parallel_test_and_label = autobisectjs.RepeatedTestAndLabel(flaky_test_and_label, 8, 4)
+    assert parallel_test_and_label("js", "bad")[0] == "bad"
+    assert runs.count("bad") <= 2 + 4 + 1
+
+
+def test_repeated_interestingness_runs(monkeypatch, tmpdir):
+    """Test that repeated runs of an interestingness test run the shell every time, rather than reuse cached results.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    runs = []
+
+    class IntermittentShellResult:  # pylint: disable=too-few-public-methods
+        """Crashes on the third run only."""
+
+        def __init__(self, *_args, **_kwargs):
+            runs.append(None)
+            self.lev = js_interesting.JS_NEW_ASSERT_OR_CRASH if len(runs) == 3 else js_interesting.JS_FINE
+
+    monkeypatch.setattr(js_interesting, "ShellResult", IntermittentShellResult)
+    monkeypatch.setattr(js_interesting, "result_cache_path", lambda *_args: tmpdir / "results" / "result.json")
+    monkeypatch.setattr(js_interesting, "gOptions", SimpleNamespace(
+        jsengine=tmpdir / "js", timeout=120, valgrind=False, jsengineWithArgs=[tmpdir / "js", tmpdir / "t.js"],
+        collector=None, minimumInterestingLevel=js_interesting.JS_NEW_ASSERT_OR_CRASH))
+
+    def test_and_label(_shellFilename, _hgHash):  # pylint: disable=invalid-name
+        if js_interesting.interesting([], str(tmpdir / "t")):
+            return "bad", "interesting"
+        return "good", "not interesting"
+
+    assert autobisectjs.RepeatedTestAndLabel(test_and_label, 5, 1)(tmpdir / "js", "1") == (
+        "bad", "interesting, in 1 of 3 runs")
+    assert len(runs) == 3
+    assert not (tmpdir / "results" / "result.json").exists()
+
+    # Single runs still use the result cache
+    runs.clear()
+    assert test_and_label(tmpdir / "js", "1")[0] == "good"
+    assert test_and_label(tmpdir / "js", "1")[0] == "good"
+    assert len(runs) == 1
+
+
+def test_adaptive_timeout():
+    """Test that the timeout follows the first good and bad runs, within its bounds."""
+    adaptive_timeout = autobisectjs.AdaptiveTimeout(factor=10, minimum=30, maximum=999)
+    assert adaptive_timeout.get() == 999
+    adaptive_timeout.record("skip", 500)
+    assert adaptive_timeout.get() == 999
+    adaptive_timeout.record("good", 1.5)
+    assert adaptive_timeout.get() == 30
+    adaptive_timeout.record("bad", 12)
+    adaptive_timeout.record("bad", 200)
+    assert adaptive_timeout.get() == 120
+    adaptive_timeout.record("good", 200)
+    assert adaptive_timeout.get() == 120
+
+
+def test_next_bisect_candidates(monkeypatch):
+    """Test that the changesets to build speculatively are found with revsets, without changing the bisection state.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+    """
+    revsets = []
+
+    def run(cmd, check):
+        assert check and cmd[3] == "log"
+        revsets.append(cmd[5])
+        csets = "111111111111\n222222222222\n333333333333\n" if "- ::" in cmd[5] else ""
+        return subprocess.CompletedProcess(cmd, 0, stdout=csets.encode("utf-8"))
+
+    monkeypatch.setattr(autobisectjs.hg_cmdserver, "run", run)
+    assert autobisectjs.next_bisect_candidates("repo", "abcdefabcdef") == ["222222222222"]
+    assert revsets == ['sort(bisect("untested") - ::abcdefabcdef, rev)',
+                       'sort((bisect("untested") and ::abcdefabcdef) - abcdefabcdef, rev)']
+
+
+def test_external_test_and_label_timeout(monkeypatch):
+    """Test that interestingness tests taking a timeout get the derived one, unless their arguments set one.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+    """
+    calls = []
+
+    def interesting(cli_args, _temp_prefix):
+        calls.append(cli_args)
+        return cli_args[-2] == "bad-js"
+
+    monkeypatch.setattr(autobisectjs, "rel_or_abs_import",
+                        lambda _module: SimpleNamespace(__name__="funfuzz.util.crashesat", interesting=interesting))
+    options = SimpleNamespace(runtime_params=["testcase.js"])
+    test_and_label = autobisectjs.externalTestAndLabel(options, ["funfuzz.util.crashesat", "-s", "js::gc"])
+    assert test_and_label("good-js", "1") == ("good", "not interesting")
+    assert calls[-1] == ["-s", "js::gc", "good-js", "testcase.js"]
+    assert test_and_label("bad-js", "2") == ("bad", "interesting")
+    assert test_and_label("bad-js", "3") == ("bad", "interesting")
+    assert calls[-1] == [f"--timeout={autobisectjs.MIN_TEST_TIMEOUT}", "-s", "js::gc", "bad-js", "testcase.js"]
+
+    calls.clear()
+    test_and_label = autobisectjs.externalTestAndLabel(options, ["funfuzz.util.crashesat", "--timeout=5"])
+    for rev in ("1", "2", "3"):
+        test_and_label("good-js", rev)
+    assert all(cli_args[0] == "--timeout=5" for cli_args in calls)
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="Process groups are only used on POSIX systems")
+def test_cancel_speculative_builds():
+    """Test that cancelling speculative builds stops all but the one to keep."""
+    speculative_builds = autobisectjs.SpeculativeBuilds.__new__(autobisectjs.SpeculativeBuilds)
+    speculative_builds.builds = {rev: subprocess.Popen(["sleep", "60"], start_new_session=True)
+                                 for rev in ["aaaaaaaaaaaa", "bbbbbbbbbbbb"]}
+    cancelled = speculative_builds.builds["aaaaaaaaaaaa"]
+    kept = speculative_builds.builds["bbbbbbbbbbbb"]
+
+    speculative_builds.cancel_all_except("bbbbbbbbbbbb")
+    assert cancelled.returncode is not None
+    assert kept.poll() is None
+    assert list(speculative_builds.builds) == ["bbbbbbbbbbbb"]
+
+    speculative_builds.cancel_all_except(None)
+    assert kept.returncode is not None
+    assert not speculative_builds.builds
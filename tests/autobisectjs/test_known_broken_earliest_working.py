@@ -0,0 +1,36 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the known_broken_earliest_working.py file."""
+
+import logging
+from pathlib import Path
+
+from funfuzz.autobisectjs import known_broken_earliest_working as kbew
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_learned_broken_ranges(monkeypatch, tmpdir):
+    """Test that broken ranges are learned per build type, once each.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    monkeypatch.setenv("HOME", str(tmpdir))
+    monkeypatch.setattr(kbew.build_options, "computeShellType", lambda build_opts: build_opts)
+    assert not kbew.learned_broken_ranges("js-dbg-64-linux-x86_64")
+
+    kbew.record_broken_range("js-dbg-64-linux-x86_64", "a" * 12, "b" * 12)
+    kbew.record_broken_range("js-dbg-64-linux-x86_64", "a" * 12, "b" * 12)
+    kbew.record_broken_range("js-dbg-64-linux-x86_64", "c" * 12, "d" * 12)
+    assert kbew.learned_broken_ranges("js-dbg-64-linux-x86_64") == [
+        kbew.hgrange("a" * 12, "b" * 12), kbew.hgrange("c" * 12, "d" * 12)]
+    assert not kbew.learned_broken_ranges("js-64-linux-x86_64")
+    assert (Path(tmpdir) / "shell-cache" / "learned-broken-ranges.json").is_file()
@@ -0,0 +1,54 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the artifact_store.py file."""
+
+import logging
+from pathlib import Path
+
+from funfuzz.js import artifact_store
+from funfuzz.js import compile_shell
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_directory_artifact_store(monkeypatch, tmpdir):
+    """Test that shells added to a directory store are listed, and extracted into the shell cache under their names.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    monkeypatch.setenv("HOME", str(tmpdir / "home"))
+    (tmpdir / "home").mkdir()
+    monkeypatch.setattr(artifact_store.build_options, "computeShellType", lambda _build_opts: "js-64-linux-x86_64")
+    monkeypatch.setattr(compile_shell.build_options, "computeShellName",
+                        lambda _build_opts, rev: f"js-64-linux-x86_64-{rev}")
+    monkeypatch.setattr(compile_shell.platform, "system", lambda: "Linux")
+
+    bin_dir = tmpdir / "dist" / "bin"
+    bin_dir.mkdir(parents=True)
+    (bin_dir / "js").write_bytes(b"shell")
+    (bin_dir / "js.fuzzmanagerconf").write_text("[Main]\n")
+    (bin_dir / "libnspr4.so").write_bytes(b"library")
+
+    store = artifact_store.get_artifact_store(str(tmpdir / "store"))
+    store.add_shell("js-64-linux-x86_64", "a" * 40, bin_dir)
+    store.add_shell("js-64-linux-x86_64", "a" * 12, bin_dir)
+    assert store.list_revs("js-64-linux-x86_64") == {"a" * 12}
+    assert (tmpdir / "store" / "js-64-linux-x86_64" / "index.txt").read_text() == f'{"a" * 12}\n'
+    assert not store.list_revs("js-dbg-64-linux-x86_64")
+
+    shell = compile_shell.CompiledShell(None, "a" * 12)
+    assert store.obtain_shell(shell)
+    shell_dir = shell.get_shell_cache_dir()
+    assert shell.get_shell_cache_js_bin_path().read_bytes() == b"shell"
+    assert (shell_dir / f"{shell.get_shell_name_without_ext()}.fuzzmanagerconf").is_file()
+    assert (shell_dir / "libnspr4.so").is_file()
+    assert not store.obtain_shell(compile_shell.CompiledShell(None, "b" * 12))
@@ -0,0 +1,63 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the compare_jit.py file."""
+
+from contextlib import closing
+import logging
+from pathlib import Path
+import time
+
+from funfuzz.js import compare_jit
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+class FakeShellResult:  # pylint: disable=too-few-public-methods
+    """Stand-in for js_interesting.ShellResult that writes a log, with later commands finishing first.
+
+    Args:
+        _options (object): Unused options
+        command (list): Command that would have been run, the last item being the run time in seconds
+        prefix (Path): Log prefix
+        _in_compare_jit (bool): Unused
+        stop_event (class): Event that stops the run early once set
+    """
+    # pylint: disable=unused-argument
+    def __init__(self, _options, command, prefix, _in_compare_jit, in_memory=False, stop_event=None):
+        if stop_event:
+            stop_event.wait(command[-1])
+        else:
+            time.sleep(command[-1])
+        (prefix.parent / f"{prefix.stem}-out").with_suffix(".txt").write_text("")
+        self.command = command
+
+
+def test_run_combos(monkeypatch, tmpdir):
+    """Test that results come back in command order, and that stopping early cleans up runs not looked at.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    monkeypatch.setattr(compare_jit.js_interesting, "ShellResult", FakeShellResult)
+    commands = [["js", 0.3], ["js", 0.2], ["js", 0.1], ["js", 0]]
+
+    for jobs in (1, 4):
+        prefixes = [Path(tmpdir) / f"cj{jobs}-r{i}" for i in range(len(commands))]
+        assert [r.command for r in compare_jit.run_combos(None, commands, prefixes, jobs)] == commands
+
+    # Runs that are still going when the caller stops early are stopped too
+    commands = [["js", 0]] + [["js", 60]] * 3
+    prefixes = [Path(tmpdir) / f"cj-early-r{i}" for i in range(len(commands))]
+    start_time = time.time()
+    with closing(compare_jit.run_combos(None, commands, prefixes, 4)) as results:
+        assert next(results).command == commands[0]
+    assert time.time() - start_time < 30
+    assert (Path(tmpdir) / "cj-early-r0-out.txt").is_file()
+    assert not any((Path(tmpdir) / f"cj-early-r{i}-out.txt").is_file() for i in range(1, len(commands)))
@@ -0,0 +1,68 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the inspect_shell.py file."""
+
+import io
+import logging
+import os
+from pathlib import Path
+import platform
+import stat
+
+import pytest
+
+from funfuzz.js import inspect_shell
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def make_fake_shell(shell_dir):
+    """Create a fake js shell that prints a build configuration, and records each launch.
+
+    Args:
+        shell_dir (Path): Directory to create the fake shell in
+
+    Returns:
+        Path: Full path to the fake shell
+    """
+    fake_shell = shell_dir / "js-fake"
+    with io.open(str(fake_shell), "w", encoding="utf-8", errors="replace") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f'echo launched >> "{shell_dir / "launches.txt"}"\n')
+        f.write("echo '{\"asan\":true,\"debug\":false,\"arm64-simulator\":false}'\n")
+    fake_shell.chmod(fake_shell.stat().st_mode | stat.S_IEXEC)
+    return fake_shell
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="Fake shell is a POSIX shell script")
+def test_get_build_configuration_cached(tmpdir):
+    """Test that the build configuration is queried only once per binary, even across processes.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    fake_shell = make_fake_shell(tmpdir)
+    launches = tmpdir / "launches.txt"
+
+    assert inspect_shell.queryBuildConfiguration(fake_shell, "asan")
+    assert not inspect_shell.queryBuildConfiguration(fake_shell, "arm64-simulator")
+    assert len(launches.read_text().splitlines()) == 1
+    assert fake_shell.with_suffix(inspect_shell.BUILD_CONFIGURATION_SUFFIX).is_file()
+
+    # Simulate another process, which only has the on-disk cache
+    inspect_shell.BUILD_CONFIGURATIONS.clear()
+    assert not inspect_shell.queryBuildConfiguration(fake_shell, "debug")
+    assert len(launches.read_text().splitlines()) == 1
+
+    # A changed mtime with unchanged contents is verified using the hash, without launching the shell
+    inspect_shell.BUILD_CONFIGURATIONS.clear()
+    os.utime(str(fake_shell), ns=(0, 0))
+    assert inspect_shell.queryBuildConfiguration(fake_shell, "asan")
+    assert len(launches.read_text().splitlines()) == 1
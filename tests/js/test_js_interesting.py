@@ -0,0 +1,81 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the js_interesting.py file."""
+
+import logging
+import os
+from pathlib import Path
+
+from Collector.Collector import Collector
+import lithium.interestingness.timed_run as timedrun
+
+from funfuzz.js import js_interesting
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_cached_level(tmpdir):
+    """Test that levels are cached by the contents of the shell and the testcase, along with the run settings and the
+    signature cache, unless a run timed out or ran out of memory.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    shell = tmpdir / "js"
+    shell.write_text("fake shell")
+    testcase = tmpdir / "w1-reduced.js"
+    testcase.write_text("gc();\n")
+    testcase_copy = tmpdir / "w2-reduced.js"
+    testcase_copy.write_text("gc();\n")
+    (tmpdir / "sigcache").mkdir()
+    collector = Collector(sigCacheDir=str(tmpdir / "sigcache"), tool="jsfunfuzz")
+
+    cache_path = js_interesting.result_cache_path(shell, ["js_interesting", 10, "--fuzzing-safe"], testcase, collector)
+    assert js_interesting.read_cached_level(cache_path) is None
+    timing_dependent_runs = js_interesting.TIMING_DEPENDENT_RUNS["count"]
+    js_interesting.TIMING_DEPENDENT_RUNS["count"] += 1  # As if the run timed out
+    js_interesting.write_cached_level(cache_path, js_interesting.JS_NEW_ASSERT_OR_CRASH, timing_dependent_runs)
+    assert js_interesting.read_cached_level(cache_path) is None
+    timing_dependent_runs = js_interesting.TIMING_DEPENDENT_RUNS["count"]
+    js_interesting.write_cached_level(cache_path, js_interesting.JS_NEW_ASSERT_OR_CRASH, timing_dependent_runs)
+    assert js_interesting.read_cached_level(cache_path) == js_interesting.JS_NEW_ASSERT_OR_CRASH
+
+    # Same contents in a different file share the result, but other settings or contents do not
+    assert js_interesting.result_cache_path(
+        shell, ["js_interesting", 10, "--fuzzing-safe"], testcase_copy, collector) == cache_path
+    assert js_interesting.result_cache_path(
+        shell, ["js_interesting", 10, "--ion-eager"], testcase, collector) != cache_path
+    testcase.write_text("oomTest(gc);\n")
+    assert js_interesting.result_cache_path(
+        shell, ["js_interesting", 10, "--fuzzing-safe"], testcase, collector) != cache_path
+
+    # Refreshing the signature cache may turn crashes into frequent buckets
+    testcase.write_text("gc();\n")
+    os.utime(str(tmpdir / "sigcache"), ns=(0, 0))
+    assert js_interesting.result_cache_path(
+        shell, ["js_interesting", 10, "--fuzzing-safe"], testcase, collector) != cache_path
+
+
+def test_is_suspicious():
+    """Test that only runs with signs of a bug are deemed to need a CrashInfo object."""
+    fine_run = timedrun.rundata(timedrun.ABNORMAL, 3, "ABNORMAL exit code 3", 0.1, False, 1, "", "")
+    crashed_run = timedrun.rundata(timedrun.CRASHED, -11, "CRASHED signal 11", 0.1, False, 1, "", "")
+
+    def err_matches(err):
+        return js_interesting.STDERR_CLASSIFIER.classify(err)
+
+    assert not js_interesting.is_suspicious(js_interesting.JS_FINE, fine_run, [],
+                                            err_matches(["uncaught exception: out of memory"]))
+    assert js_interesting.is_suspicious(js_interesting.JS_FINE, crashed_run, [], {})
+    assert js_interesting.is_suspicious(js_interesting.JS_DID_NOT_FINISH, fine_run, [], {})
+    assert js_interesting.is_suspicious(js_interesting.JS_FINE, fine_run, [],
+                                        err_matches(["Assertion failure: false, at jsapi.cpp:1"]))
+    assert js_interesting.is_suspicious(js_interesting.JS_FINE, fine_run, [],
+                                        err_matches(["==1==ERROR: AddressSanitizer: heap-use-after-free"]))
@@ -8,9 +8,12 @@
 
 import io
 import logging
+import os
 from pathlib import Path
+import time
 
 from funfuzz.js import link_fuzzer
+from funfuzz.util import file_manipulation
 
 FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
 logging.basicConfig(level=logging.DEBUG)
@@ -35,3 +38,50 @@ def test_link_fuzzer(tmpdir):
                 break
 
     assert found
+
+
+def test_link_cached_fuzzer(monkeypatch, tmpdir):
+    """Test that workers share one linked jsfunfuzz file, along with its SPLICE halves.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    monkeypatch.setattr(link_fuzzer.sm_compile_helpers, "ensure_cache_dir", lambda _base_dir: tmpdir)
+    jsfunfuzz_plain = tmpdir / "jsfunfuzz-plain.js"
+    jsfunfuzz_1 = tmpdir / "jsfunfuzz-w1.js"
+    jsfunfuzz_2 = tmpdir / "jsfunfuzz-w2.js"
+
+    link_fuzzer.link_fuzzer(jsfunfuzz_plain, "// prologue\n")
+    link_fuzzer.link_cached_fuzzer(jsfunfuzz_1, "// prologue\n")
+    link_fuzzer.link_cached_fuzzer(jsfunfuzz_2, "// prologue\n")
+
+    assert jsfunfuzz_1.read_text() == jsfunfuzz_plain.read_text()
+    assert jsfunfuzz_1.stat().st_ino == jsfunfuzz_2.stat().st_ino
+    assert len(list((tmpdir / "jsfunfuzz").glob("jsfunfuzz-*.js"))) == 1
+    assert file_manipulation.fuzzSplice(jsfunfuzz_2) == file_manipulation.fuzzSplice(jsfunfuzz_plain)
+
+
+def test_remove_stale_fuzzers(monkeypatch, tmpdir):
+    """Test that linked fuzzers in use are refreshed, while old ones and leftover temporary files are removed.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    monkeypatch.setattr(link_fuzzer.sm_compile_helpers, "ensure_cache_dir", lambda _base_dir: tmpdir)
+    link_fuzzer.link_cached_fuzzer(tmpdir / "jsfunfuzz-w1.js")
+    (cached_fuzzer,) = (tmpdir / "jsfunfuzz").glob("jsfunfuzz-*.js")
+    os.utime(str(cached_fuzzer), (0, 0))
+    link_fuzzer.link_cached_fuzzer(tmpdir / "jsfunfuzz-w2.js")
+    assert time.time() - cached_fuzzer.stat().st_mtime < link_fuzzer.LINKED_FUZZER_REFRESH_AGE
+
+    for stale_name in ["jsfunfuzz-0.js", "tmp1234.tmp"]:
+        (tmpdir / "jsfunfuzz" / stale_name).write_text("")
+        os.utime(str(tmpdir / "jsfunfuzz" / stale_name), (0, 0))
+    (tmpdir / "jsfunfuzz" / "tmp5678.tmp").write_text("")
+    link_fuzzer.remove_stale_fuzzers(tmpdir / "jsfunfuzz")
+    assert sorted(path.name for path in (tmpdir / "jsfunfuzz").iterdir()) == sorted(
+        [cached_fuzzer.name, cached_fuzzer.with_suffix(".splice.json").name, "tmp5678.tmp"])
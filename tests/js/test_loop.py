@@ -0,0 +1,73 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the loop.py file."""
+
+import logging
+import os
+from pathlib import Path
+
+from funfuzz.js import loop
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def walk_js_files(repo, root):
+    """List the .js files within a directory the way inTreeRegressionTests used to, using os.walk.
+
+    Args:
+        repo (Path): Full path to the repository
+        root (Path): Directory relative to the repository
+
+    Returns:
+        list: Paths to the .js files, relative to the repository
+    """
+    return [os.path.join(path, filename)[len(str(repo)) + 1:]
+            for path, _dirs, files in os.walk(str(repo / root))
+            for filename in files
+            if filename.endswith(".js")]
+
+
+def test_in_tree_regression_tests(monkeypatch, tmpdir):
+    """Test that the regression test index matches a full walk, and is only rebuilt when the revision changes.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    repo = Path(tmpdir) / "mozilla-central"
+    index_path = Path(tmpdir) / "regression-tests.json"
+    monkeypatch.setattr(loop, "get_regression_test_index_path", lambda _repo: index_path)
+
+    for test_dir in [Path("js") / "src" / "jit-test" / "tests" / "basic",
+                     Path("js") / "src" / "tests" / "non262" / "Array",
+                     Path("js") / "src" / "tests" / "test262" / "built-ins",
+                     Path("testing") / "web-platform" / "tests" / "streams"]:
+        (repo / test_dir).mkdir(parents=True)
+        (repo / test_dir / "a.js").write_text("")
+        (repo / test_dir / "b.txt").write_text("")
+    (repo / ".hg").mkdir()
+    (repo / ".hg" / "dirstate").write_bytes(b"\x01" * 40)
+
+    expected = (walk_js_files(repo, Path("js") / "src" / "jit-test" / "tests") +
+                walk_js_files(repo, Path("js") / "src" / "tests") +
+                walk_js_files(repo, Path("js") / "src" / "tests" / "non262") +
+                walk_js_files(repo, Path("js") / "src" / "tests" / "test262") +
+                walk_js_files(repo, Path("testing") / "web-platform" / "tests" / "streams"))
+    assert len(expected) == 6
+    assert loop.inTreeRegressionTests(repo) == expected
+    assert index_path.is_file()
+
+    # The index is reused while the revision stays the same
+    new_test = Path("js") / "src" / "tests" / "non262" / "Array" / "c.js"
+    (repo / new_test).write_text("")
+    assert str(new_test) not in loop.inTreeRegressionTests(repo)
+
+    # A new revision refreshes the index
+    (repo / ".hg" / "dirstate").write_bytes(b"\x02" * 40)
+    assert loop.inTreeRegressionTests(repo).count(str(new_test)) == 2
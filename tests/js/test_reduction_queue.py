@@ -0,0 +1,113 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the reduction_queue.py file."""
+
+import logging
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+import FTB.Signatures.CrashInfo as Crash_Info
+
+from funfuzz.js import reduction_queue
+from funfuzz.util import create_collector
+from funfuzz.util import file_system_helpers
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_reduction_queue(tmpdir):
+    """Test that queued jobs are claimed once, in order, and can be requeued.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    queue_dir = tmpdir / "reduction-queue"
+    testcase = tmpdir / "w1-reduced.js"
+    testcase.write_text("gc();\n")
+    crash_info = Crash_Info.CrashInfo.fromRawCrashData(
+        [], ["Assertion failure: false, at jsapi.cpp:1"],
+        ProgramConfiguration("mozilla-central", "x86-64", "linux", args=["--fuzzing-safe"]))
+
+    queued = [reduction_queue.enqueue(queue_dir, {"lev": lev}, testcase, crash_info) for lev in (5, 3, 4)]
+
+    claimed = [reduction_queue.claim_job(queue_dir) for _ in queued]
+    assert [job.name for job in claimed] == [job.name for job in queued]
+    assert reduction_queue.claim_job(queue_dir) is None
+
+    job = file_system_helpers.read_json(claimed[0] / "job.json")
+    assert (claimed[0] / job["testcase"]).read_text() == "gc();\n"
+    restored = create_collector.deserialize_crash_info(job["crash_info"])
+    assert restored.rawStderr == crash_info.rawStderr
+    assert restored.configuration.args == ["--fuzzing-safe"]
+
+    reduction_queue.requeue_orphaned_jobs(queue_dir)
+    assert reduction_queue.claim_job(queue_dir) is not None
+
+
+def test_register_signature(monkeypatch, tmpdir):
+    """Test that only the first hit of a signature is reduced, and that the smallest testcase is kept.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    registry_path = tmpdir / "reduction-signatures.json"
+    testcase = tmpdir / "w1-orig.js"
+
+    testcase.write_text("gc(); gc();\n")
+    assert reduction_queue.register_signature(registry_path, "Assertion failure: false", testcase)
+    testcase.write_text("gc();\n")
+    assert not reduction_queue.register_signature(registry_path, "Assertion failure: false", testcase)
+    testcase.write_text("gc(); gc(); gc();\n")
+    assert not reduction_queue.register_signature(registry_path, "Assertion failure: false", testcase)
+    assert reduction_queue.register_signature(registry_path, "Assertion failure: x", testcase)
+
+    registry = file_system_helpers.read_json(registry_path)
+    assert registry["Assertion failure: false"]["hits"] == 3
+    assert registry["Assertion failure: false"]["smallest_size"] == len("gc();\n")
+    assert [kept.read_text() for kept in (tmpdir / "reduction-signatures").iterdir()].count("gc();\n") == 1
+
+    # Kept testcases go away along with their signatures
+    reduction_queue.unregister_signature(registry_path, "Assertion failure: x")
+    assert not reduction_queue.get_kept_testcase_path(registry_path, "Assertion failure: x").exists()
+    monkeypatch.setattr(reduction_queue, "SIGNATURE_REGISTRY_TTL", 0)
+    assert reduction_queue.register_signature(registry_path, "Assertion failure: y", testcase)
+    assert list((tmpdir / "reduction-signatures").iterdir()) == [
+        reduction_queue.get_kept_testcase_path(registry_path, "Assertion failure: y")]
+
+
+def test_failed_job(monkeypatch, tmpdir):
+    """Test that a job whose reduction fails is removed from the queue, and that its signature gets reduced again.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    registry_path = tmpdir / "reduction-signatures.json"
+    monkeypatch.setattr(reduction_queue, "get_signature_registry_path", lambda: registry_path)
+    queue_dir = tmpdir / "reduction-queue"
+    testcase = tmpdir / "w1-reduced.js"
+    testcase.write_text("gc();\n")
+    crash_info = Crash_Info.CrashInfo.fromRawCrashData(
+        [], ["Assertion failure: false, at jsapi.cpp:1"],
+        ProgramConfiguration("mozilla-central", "x86-64", "linux", args=["--fuzzing-safe"]))
+    assert reduction_queue.register_signature(registry_path, "Assertion failure: false", testcase)
+
+    def submit_reduced(*_args):
+        raise OSError("Lithium crashed")
+
+    monkeypatch.setattr(reduction_queue, "submit_reduced", submit_reduced)
+    reduction_queue.enqueue(queue_dir, {"signature": "Assertion failure: false"}, testcase, crash_info)
+    job_dir = reduction_queue.claim_job(queue_dir)
+    reduction_queue.run_job(job_dir, None)
+    assert not job_dir.exists()
+    assert reduction_queue.register_signature(registry_path, "Assertion failure: false", testcase)
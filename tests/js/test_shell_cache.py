@@ -0,0 +1,121 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the shell_cache.py file."""
+
+import logging
+import os
+from pathlib import Path
+
+from funfuzz.js import shell_cache
+from funfuzz.util import changeset_index
+from funfuzz.util import file_system_helpers
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def make_shell_dir(cache_dir, shell_name, size, busted=False):
+    """Make a shell cache directory with a file of a given size in it.
+
+    Args:
+        cache_dir (Path): Full path to the shell cache
+        shell_name (str): Name of the shell
+        size (int): Size of the file in bytes
+        busted (bool): Whether to mark the shell as having failed to compile
+    """
+    (cache_dir / shell_name).mkdir()
+    (cache_dir / shell_name / shell_name).write_bytes(b"\0" * size)
+    if busted:
+        (cache_dir / shell_name / f"{shell_name}.busted").write_text("Compilation failed")
+
+
+def test_shell_cache(monkeypatch, tmpdir):
+    """Test that shells are indexed, evicted least recently used first, and found by revision.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    cache_dir = Path(tmpdir)
+    monkeypatch.setattr(shell_cache, "EVICTION_GRACE_PERIOD", 0)
+    shell_names = ["js-dbg-64-linux-x86_64-" + f"{rev:x}" * 12 for rev in range(4)]
+    make_shell_dir(cache_dir, shell_names[0], 100)
+    make_shell_dir(cache_dir, shell_names[1], 100, busted=True)
+    make_shell_dir(cache_dir, "shell-mozilla-central-lock", 1000)
+
+    # Shells that were in the cache before the index are indexed the first time it is needed
+    shell_cache.record_shell(cache_dir, shell_names[0], measure=False)
+    index = file_system_helpers.read_json(shell_cache.get_index_path(cache_dir))
+    assert sorted(index) == shell_names[:2]
+    assert index[shell_names[0]]["size"] == 100
+    assert index[shell_names[1]]["busted"]
+    assert index[shell_names[0]]["last_used"] > index[shell_names[1]]["last_used"]
+
+    make_shell_dir(cache_dir, shell_names[2], 100)
+    shell_cache.record_shell(cache_dir, shell_names[2])
+    assert not shell_cache.make_room(cache_dir, quota=400, min_free_space=0)
+    assert shell_cache.make_room(cache_dir, keep=[shell_names[1]], quota=250, min_free_space=0) == [shell_names[0]]
+    assert not (cache_dir / shell_names[0]).exists()
+    assert (cache_dir / "shell-mozilla-central-lock").is_dir()
+
+    cset_index = changeset_index.ChangesetIndex(Path("mozilla-central"))
+    cset_index.nodes = [f"{rev:x}" * 40 for rev in range(4)]
+    cset_index.revs_by_short_node = {node[:12]: rev for rev, node in enumerate(cset_index.nodes)}
+    make_shell_dir(cache_dir, shell_names[3], 100)
+    shell_cache.record_shell(cache_dir, shell_names[3])
+    nearest = shell_cache.nearest_cached_shells(cache_dir, "js-dbg-64-linux-x86_64", cset_index, 1)
+    assert nearest == ["2" * 12, "3" * 12]
+    assert not shell_cache.nearest_cached_shells(cache_dir, "js-64-linux-x86_64", cset_index, 1)
+
+
+def test_record_shell_in_use(monkeypatch, tmpdir):
+    """Test that shells being run are recorded as used now and then, so that they are not evicted.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    cache_dir = Path(tmpdir)
+    monkeypatch.setattr(shell_cache, "LAST_RECORDED_USES", {})
+    shell_names = ["js-dbg-64-linux-x86_64-" + f"{rev:x}" * 12 for rev in range(2)]
+    for shell_name in shell_names:
+        make_shell_dir(cache_dir, shell_name, 100)
+        shell_cache.record_shell(cache_dir, shell_name)
+    index = file_system_helpers.read_json(shell_cache.get_index_path(cache_dir))
+    for entry in index.values():
+        entry["last_used"] -= 2 * shell_cache.EVICTION_GRACE_PERIOD
+    file_system_helpers.write_json_atomically(shell_cache.get_index_path(cache_dir), index)
+
+    shell_cache.record_shell_in_use(cache_dir / shell_names[0] / shell_names[0])
+    assert shell_cache.make_room(cache_dir, quota=150, min_free_space=0) == [shell_names[1]]
+
+    # Uses are only recorded once per interval
+    index = file_system_helpers.read_json(shell_cache.get_index_path(cache_dir))
+    last_used = index[shell_names[0]]["last_used"]
+    shell_cache.record_shell_in_use(cache_dir / shell_names[0] / shell_names[0])
+    index = file_system_helpers.read_json(shell_cache.get_index_path(cache_dir))
+    assert index[shell_names[0]]["last_used"] == last_used
+
+
+def test_prune_result_caches(tmpdir):
+    """Test that cached testcase results not used for a while are pruned.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    cache_dir = Path(tmpdir)
+    shell_name = "js-dbg-64-linux-x86_64-" + "a" * 12
+    make_shell_dir(cache_dir, shell_name, 100)
+    results_dir = cache_dir / shell_name / f"{shell_name}{shell_cache.RESULT_CACHE_SUFFIX}"
+    results_dir.mkdir()
+    (results_dir / "old.json").write_text("{}")
+    os.utime(str(results_dir / "old.json"), (0, 0))
+    (results_dir / "new.json").write_text("{}")
+
+    shell_cache.prune_result_caches(cache_dir)
+    assert sorted(os.listdir(str(results_dir))) == ["new.json"]
@@ -6,13 +6,17 @@
 
 """Test the shell_flags.py file."""
 
+import io
 import logging
+from pathlib import Path
 import platform
 import random
+import stat
 
 import pytest
 
 from funfuzz import js
+from funfuzz.js import shell_flags
 
 from .test_compile_shell import test_shell_compile
 
@@ -136,3 +140,52 @@ def test_random_flag_set(monkeypatch):
 def test_shell_supports_flag():
     """Test that the shell does support flags as intended."""
     assert js.shell_flags.shell_supports_flag(test_shell_compile(), "--fuzzing-safe")
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="Fake shell is a POSIX shell script")
+def test_get_supported_flags(tmpdir):
+    """Test that the supported flag table is built in one pass and shared on disk.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    launches = tmpdir / "launches.txt"
+    fake_shell = tmpdir / "js-fake"
+    with io.open(str(fake_shell), "w", encoding="utf-8", errors="replace") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f'echo "$@" >> "{launches}"\n')
+        f.write('if [ "$1" = "--help" ]; then\n')
+        f.write("  echo 'Usage: js [options] [[script] scriptArgs*]'\n")
+        f.write("  echo '  --fuzzing-safe             Disable fuzz-unsafe functions'\n")
+        f.write("  echo '  --wasm-compiler=[option]   Choose to enable a subset of the wasm compilers'\n")
+        f.write("  echo '  --help                     Display help information'\n")
+        f.write("  exit 0\n")
+        f.write("fi\n")
+        f.write('for arg in "$@"; do\n')
+        f.write('  case "$arg" in\n')
+        f.write("    -e) exit 0;;\n")
+        f.write("    --fuzzing-safe|--wasm-compiler=baseline) ;;\n")
+        f.write("    *) exit 2;;\n")
+        f.write("  esac\n")
+        f.write("done\n")
+    fake_shell.chmod(fake_shell.stat().st_mode | stat.S_IEXEC)
+
+    assert shell_flags.shell_supports_flag(fake_shell, "--fuzzing-safe")
+    assert not shell_flags.shell_supports_flag(fake_shell, "--no-threads")
+    # The option exists, but not with this value
+    assert not shell_flags.shell_supports_flag(fake_shell, "--wasm-compiler=none")
+    # --help, then a single probe for the only listed flag with a value
+    assert len(launches.read_text().splitlines()) == 2
+
+    # Simulate another worker, which only has the on-disk table
+    shell_flags.SUPPORTED_FLAGS.clear()
+    assert shell_flags.shell_supports_flag(fake_shell, "--fuzzing-safe")
+    assert len(launches.read_text().splitlines()) == 2
+
+    # Flags outside of PROBED_FLAGS are probed on demand and added to the table
+    assert shell_flags.shell_supports_flag(fake_shell, "--wasm-compiler=baseline")
+    assert len(launches.read_text().splitlines()) == 3
+    shell_flags.SUPPORTED_FLAGS.clear()
+    assert shell_flags.shell_supports_flag(fake_shell, "--wasm-compiler=baseline")
+    assert len(launches.read_text().splitlines()) == 3
@@ -0,0 +1,51 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the capture_run.py file."""
+
+import logging
+import sys
+import threading
+
+import lithium.interestingness.timed_run as timedrun
+
+from funfuzz.util import capture_run
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_bounded_capture():
+    """Test that only the start and the end of a long stream are kept."""
+    capture = capture_run.BoundedCapture(head_limit=4, tail_limit=6)
+    for data in [b"ab", b"cdef", b"ghijk", b"lmnopq"]:
+        capture.feed(data)
+    assert capture.getvalue() == "abcd\n[... 7 bytes dropped ...]\nlmnopq"
+
+    capture = capture_run.BoundedCapture(head_limit=4, tail_limit=6)
+    capture.feed(b"short")
+    assert capture.getvalue() == "short"
+
+
+def test_timed_run():
+    """Test that output larger than a pipe buffer is captured, and that timeouts are detected."""
+    runinfo = capture_run.timed_run(
+        [sys.executable, "-c", "import sys; print('x' * 1000000); sys.stderr.write('done'); sys.exit(3)"], 60)
+    assert runinfo.sta == timedrun.ABNORMAL
+    assert runinfo.return_code == 3
+    assert runinfo.out == "x" * 1000000 + "\n"
+    assert runinfo.err == "done"
+
+    runinfo = capture_run.timed_run([sys.executable, "-c", "import time; time.sleep(60)"], 1)
+    assert runinfo.sta == timedrun.TIMED_OUT
+    assert runinfo.killed
+
+    stop_event = threading.Event()
+    threading.Timer(0.5, stop_event.set).start()
+    runinfo = capture_run.timed_run([sys.executable, "-c", "import time; time.sleep(60)"], 60, stop_event=stop_event)
+    assert runinfo.sta == timedrun.TIMED_OUT
+    assert runinfo.elapsedtime < 30
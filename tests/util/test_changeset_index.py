@@ -0,0 +1,62 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the changeset_index.py file."""
+
+import logging
+from pathlib import Path
+
+import pytest
+
+from funfuzz.util import changeset_index
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def make_index():
+    """Make an index of a small history with a merge, without a repository.
+
+    0 - 1 - 2 - 3 ----- 6
+         \\         /
+          4 ---- 5
+
+    Returns:
+        ChangesetIndex: Changeset index
+    """
+    index = changeset_index.ChangesetIndex(Path("mozilla-central"))
+    index.parents = [[], [0], [1], [2], [1], [4], [3, 5]]
+    index.nodes = [f"{rev:x}" * 40 for rev in range(len(index.parents))]
+    index.branches = ["default"] * len(index.parents)
+    index.revs_by_short_node = {node[:12]: rev for rev, node in enumerate(index.nodes)}
+    return index
+
+
+def test_ancestry():
+    """Test ancestry and common ancestor queries."""
+    index = make_index()
+    assert index.is_ancestor(0, 6)
+    assert index.is_ancestor(5, 6)
+    assert index.is_ancestor(3, 3)
+    assert not index.is_ancestor(4, 3)
+    assert not index.is_ancestor(6, 5)
+    assert index.common_ancestor(3, 5) == 1
+    assert index.common_ancestor(2, 6) == 2
+    assert index.common_ancestor(4, 4) == 4
+
+
+def test_resolve():
+    """Test that hashes and parents() of non-merges resolve, while other revsets are left to hg."""
+    index = make_index()
+    assert index.resolve("3" * 12) == 3
+    assert index.resolve("3" * 40) == 3
+    assert index.resolve("7" * 12) is None
+    assert index.resolve(f'parents({"5" * 40})') == 4
+    with pytest.raises(ValueError):
+        index.resolve(f'parents({"6" * 12})')
+    with pytest.raises(ValueError):
+        index.resolve("default")
@@ -0,0 +1,126 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the create_collector.py file."""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+import FTB.Signatures.CrashInfo as Crash_Info
+
+from funfuzz.util import create_collector
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def write_signature(sigcache, name, assertion, frequent):
+    """Write a signature and its metadata into a signature cache directory.
+
+    Args:
+        sigcache (Path): Signature cache directory
+        name (str): Name of the signature
+        assertion (str): Assertion message the signature matches
+        frequent (bool): Whether the signature is of a frequent bucket
+    """
+    (sigcache / f"{name}.signature").write_text(json.dumps(
+        {"symptoms": [{"type": "output", "src": "stderr", "value": assertion}]}))
+    (sigcache / f"{name}.metadata").write_text(json.dumps({"frequent": frequent, "shortDescription": name}))
+
+
+def test_signature_index(tmpdir):
+    """Test that the signature index matches like Collector.search does, and picks up changes to the cache.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    sigcache = Path(tmpdir) / "sigcache"
+    sigcache.mkdir()
+    write_signature(sigcache, "1", "Assertion failure: false", True)
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    crash_info = Crash_Info.CrashInfo.fromRawCrashData(
+        [], ["Assertion failure: false, at jsapi.cpp:1"], config)
+    other_crash_info = Crash_Info.CrashInfo.fromRawCrashData(
+        [], ["Assertion failure: !cx->isExceptionPending(), at jsapi.cpp:2"], config)
+
+    index = create_collector.SignatureIndex(str(sigcache))
+    sig_file, metadata = index.search(crash_info)
+    assert sig_file == str(sigcache / "1.signature")
+    assert metadata["frequent"]
+    assert index.search(other_crash_info) == (None, None)
+
+    write_signature(sigcache, "2", "Assertion failure: !cx->isExceptionPending()", False)
+    os.utime(str(sigcache), ns=(0, 0))  # Make sure the directory looks modified, whatever the timestamp resolution
+    assert index.search(other_crash_info)[0] == str(sigcache / "2.signature")
+
+    (sigcache / "1.signature").unlink()
+    os.utime(str(sigcache), ns=(1, 1))
+    assert index.search(crash_info) == (None, None)
+
+
+class FakeCollector:  # pylint: disable=too-few-public-methods
+    """Stand-in for a FuzzManager server, recording the submissions it accepts.
+
+    Args:
+        up (bool): Whether the server accepts submissions
+    """
+
+    def __init__(self, up):
+        self.up = up
+        self.submitted = []
+
+    def submit(self, crash_info, testcase, quality, metaData=None):  # pylint: disable=invalid-name
+        """Accept a submission, or fail like the FuzzManager Reporter does when the server errors out.
+
+        Args:
+            crash_info (object): Crash info object
+            testcase (str): Path to the testcase
+            quality (int): Quality of the testcase
+            metaData (dict): Metadata of the submission
+        """
+        if not self.up:
+            raise RuntimeError("Server unexpectedly responded with status code 500")
+        self.submitted.append((crash_info.createShortSignature(), Path(testcase).read_text(), quality, metaData))
+
+
+def test_submission_spool(tmpdir):
+    """Test that spooled submissions are uploaded once the server is up, without duplicate signatures.
+
+    Args:
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    tmpdir = Path(tmpdir)
+    spool_dir = tmpdir / "submission-spool"
+    testcase = tmpdir / "w1-reduced.js"
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    assertion = Crash_Info.CrashInfo.fromRawCrashData([], ["Assertion failure: false, at jsapi.cpp:1"], config)
+    other_assertion = Crash_Info.CrashInfo.fromRawCrashData([], ["Assertion failure: x, at jsapi.cpp:2"], config)
+    mismatch = Crash_Info.CrashInfo.fromRawCrashData(["Mismatch"], [], config)
+
+    for crash_info, contents, quality in [(assertion, "a", 10), (assertion, "b", 0), (other_assertion, "c", 6),
+                                          (mismatch, "d", 10), (mismatch, "e", 10), (mismatch, "e", 6)]:
+        testcase.write_text(contents)
+        create_collector.spool_submission(spool_dir, crash_info, str(testcase), quality, {"autoBisectLog": contents})
+
+    down = FakeCollector(False)
+    assert not create_collector.upload_spool(down, spool_dir)
+    # Duplicates of lower quality are dropped, while submissions without a crash signature need the same testcase
+    assert len(os.listdir(str(spool_dir / "pending"))) == 4
+
+    up = FakeCollector(True)
+    assert create_collector.upload_spool(up, spool_dir)
+    assert sorted(up.submitted) == [
+        ("Assertion failure: false, at jsapi.cpp:1", "b", 0, {"autoBisectLog": "b"}),
+        ("Assertion failure: x, at jsapi.cpp:2", "c", 6, {"autoBisectLog": "c"}),
+        ("No crash detected", "d", 10, {"autoBisectLog": "d"}),
+        ("No crash detected", "e", 6, {"autoBisectLog": "e"}),
+    ]
+    assert not os.listdir(str(spool_dir / "pending"))
+    assert not os.listdir(str(spool_dir / "uploading"))
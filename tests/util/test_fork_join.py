@@ -9,6 +9,7 @@
 import io
 import logging
 from pathlib import Path
+import time
 
 from funfuzz.util import fork_join
 
@@ -30,3 +31,53 @@ def test_log_name(tmpdir):
         f.writelines("test")
 
     assert fork_join.log_name(tmpdir, 1, "out") == str(log_path)
+
+
+def fail_once_then_count(marker_dir, i):
+    """Die with an error on the first call for each worker, and count three iterations on the next one.
+
+    Args:
+        marker_dir (Path): Directory recording which workers already ran
+        i (int): Numeric ID of the worker
+    """
+    marker = marker_dir / f"ran-{i}"
+    if not marker.is_file():
+        marker.write_text("")
+        raise RuntimeError("Worker died")
+    for _ in range(3):
+        fork_join.count_iteration()
+
+
+def test_fork_join_restarts(capsys, monkeypatch, tmpdir):
+    """Test that workers which die are restarted, and that their throughput is counted across restarts.
+
+    Args:
+        capsys (class): Fixture from pytest for capturing stdout and stderr
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    monkeypatch.setattr(fork_join, "SUPERVISE_INTERVAL", 0.1)
+    tmpdir = Path(tmpdir)
+
+    fork_join.forkJoin(tmpdir, 2, fail_once_then_count, tmpdir, deadline=time.time() + 60)
+
+    out = capsys.readouterr().out
+    assert "Child #0: 3 iterations, 1 restarts" in out
+    assert "Child #1: 3 iterations, 1 restarts" in out
+    assert "RuntimeError: Worker died" in out
+
+
+def test_memory_pool_size(monkeypatch):
+    """Test that the number of workers is sized by the memory available.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+    """
+    monkeypatch.setattr(fork_join, "available_memory", lambda: 10 * 1024 ** 3)
+    assert fork_join.memory_pool_size(64, None, 0, 0) == 64
+    assert fork_join.memory_pool_size(64, 1024 ** 3, 0, 0) == 9
+    assert fork_join.memory_pool_size(64, 1024 ** 3, 2 * 1024 ** 3, 8 * 1024 ** 3) == 8
+    assert fork_join.memory_pool_size(4, 1024 ** 3, 0, 0) == 4
+
+    monkeypatch.setattr(fork_join, "available_memory", lambda: 0)
+    assert fork_join.memory_pool_size(64, 1024 ** 3, 0, 0) == 1
@@ -0,0 +1,83 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the hg_cmdserver.py file."""
+
+import io
+import logging
+import os
+import platform
+import subprocess
+import sys
+
+import pytest
+
+from funfuzz.util import hg_cmdserver
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+# A stand-in for hg that speaks the command server protocol: it echoes the arguments of each command on stdout,
+# writes its process ID to stderr, fails commands named "fail", and hangs on commands named "hang".
+FAKE_HG = """\
+import os
+import struct
+import sys
+import time
+
+def send(channel, data):
+    sys.stdout.buffer.write(channel + struct.pack(">I", len(data)) + data)
+    sys.stdout.buffer.flush()
+
+send(b"o", b"capabilities: getencoding runcommand\\nencoding: UTF-8")
+while sys.stdin.buffer.readline() == b"runcommand\\n":
+    args = sys.stdin.buffer.read(struct.unpack(">I", sys.stdin.buffer.read(4))[0]).split(b"\\0")
+    if args[0] == b"hang":
+        time.sleep(60)
+    send(b"o", b" ".join(args) + b"\\n")
+    send(b"e", str(os.getpid()).encode("utf-8"))
+    send(b"r", struct.pack(">i", 1 if args[0] == b"fail" else 0))
+"""
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="The fake hg is a script with a shebang line")
+def test_run(monkeypatch, tmpdir):
+    """Test that commands run in a pooled command server, which is reused and stopped at exit.
+
+    Args:
+        monkeypatch (class): Fixture from pytest for monkeypatching some variables/functions
+        tmpdir (class): Fixture from pytest for creating a temporary directory
+    """
+    fake_hg = tmpdir / "hg"
+    with io.open(str(fake_hg), "w", encoding="utf-8", errors="replace") as f:
+        f.write(f"#!{sys.executable}\n{FAKE_HG}")
+    fake_hg.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmpdir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(hg_cmdserver, "IDLE_SERVERS", {})
+
+    first = hg_cmdserver.run(["hg", "-R", "repo", "log", "-r", "ancestor(a, b)"], check=True)
+    assert first.returncode == 0
+    assert first.stdout == b"log -r ancestor(a, b)\n"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        hg_cmdserver.run(["hg", "-R", "repo", "fail"], check=True)
+    second = hg_cmdserver.run(["hg", "-R", "repo", "fail"], stderr_to_stdout=True)
+    assert second.returncode == 1
+    assert second.stdout == b"fail\n" + first.stderr
+    assert len(hg_cmdserver.IDLE_SERVERS["repo"]) == 1
+
+    # A command server whose command hangs is killed, and replaced for the next command
+    with pytest.raises(subprocess.TimeoutExpired):
+        hg_cmdserver.run(["hg", "-R", "repo", "hang"], timeout=1)
+    assert not hg_cmdserver.IDLE_SERVERS["repo"]
+    third = hg_cmdserver.run(["hg", "-R", "repo", "log"], check=True)
+    assert third.stderr != first.stderr
+
+    server = hg_cmdserver.IDLE_SERVERS["repo"][0]
+    hg_cmdserver.close_idle_servers()
+    assert not hg_cmdserver.IDLE_SERVERS["repo"]
+    assert server.process.returncode == 0
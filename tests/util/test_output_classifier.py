@@ -0,0 +1,37 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the output_classifier.py file."""
+
+import logging
+
+from funfuzz.util.output_classifier import OutputClassifier
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.ERROR)
+
+
+def test_classify():
+    """Test that each matching line is reported under every pattern it matches, and only under those."""
+    classifier = OutputClassifier({
+        "assertion": r"^Assertion failure: ",
+        "crash": r"Assertion failure: |Segmentation fault",
+        "oom": r"out of memory",
+    })
+    matches = classifier.classify([
+        "foo",
+        "Assertion failure: false, at jsapi.cpp:1",
+        "not at start: Assertion failure: x",
+        "Segmentation fault",
+    ])
+    assert matches == {
+        "assertion": ["Assertion failure: false, at jsapi.cpp:1"],
+        "crash": ["Assertion failure: false, at jsapi.cpp:1", "not at start: Assertion failure: x",
+                  "Segmentation fault"],
+    }
+    assert classifier.classify([]) == {}
+    assert classifier.classify(["out of memory"]) == {"oom": ["out of memory"]}